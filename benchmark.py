@@ -0,0 +1,237 @@
+"""
+benchmark.py
+Scaling benchmark for the generator, the dashboard builder and the page's
+data pipeline.  For each fleet size it:
+
+    1. runs generate_epcis_data.py --ndjson (fixed seed)      wall time, peak RSS
+    2. runs build_v4_rebuild.py on the stream                 wall time, peak RSS,
+                                                              HTML / payload bytes
+    3. runs the embedded worker pipeline (runDashboardPipeline: KPIs, charts,
+       forecast, activity table) and the Drill Down decode under node, if
+       node is on PATH                                        per-stage ms, peak RSS
+
+and writes a JSON report.  With --baseline the report is compared against an
+earlier one; any metric that grew by more than --tolerance is listed and the
+exit status is 1, so a regression fails the run.
+
+Usage:
+    python benchmark.py                                  # 193, 2k, 20k, 200k towels
+    python benchmark.py --sizes 193,2000 --report bench.json
+    python benchmark.py --sizes 193,2000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = "193,2000,20000,200000"
+REPORT_VERSION = 1
+
+# Metrics compared against --baseline (dotted paths into a run record)
+COMPARED_METRICS = (
+    "generate.seconds", "generate.max_rss_kb",
+    "build.seconds", "build.max_rss_kb", "build.html_bytes",
+    "js.total_ms", "js.drilldown_ms", "js.max_rss_kb",
+)
+
+# Loads a built page, evaluates the worker source and times the pipeline the
+# browser runs off the main thread.  DOM rendering is not measured.
+NODE_BENCH = r"""
+const fs = require('fs');
+const [htmlPath, repeat] = [process.argv[2], Number(process.argv[3])];
+const html = fs.readFileSync(htmlPath, 'utf8');
+const block = id => {
+    const m = new RegExp('<script[^>]*id="' + id + '"[^>]*>([\\s\\S]*?)</script>').exec(html);
+    return m ? m[1] : null;
+};
+const payloadText = block('dashboard-data');
+const drilldownText = block('drilldown-data');
+const { runDashboardPipeline, decodeTable } =
+    new Function(block('dashboard-worker') + '\nreturn { runDashboardPipeline, decodeTable };')();
+
+const runs = [];
+for (let r = 0; r < repeat; r++) {
+    const stages = {};
+    const t0 = performance.now();
+    let last = t0;
+    runDashboardPipeline(payloadText, msg => {
+        const now = performance.now();
+        stages[msg.stage] = now - last;
+        last = now;
+    });
+    const total = performance.now() - t0;
+    const d0 = performance.now();
+    if (drilldownText && drilldownText !== 'null') {
+        const drill = JSON.parse(drilldownText);
+        decodeTable(drill.index);
+        decodeTable(drill.events);
+    }
+    runs.push({ total, stages, drilldown: performance.now() - d0 });
+}
+const median = xs => xs.slice().sort((a, b) => a - b)[xs.length >> 1];
+const round = x => Math.round(x * 1000) / 1000;
+const stageNames = Object.keys(runs[0].stages);
+console.log(JSON.stringify({
+    repeat,
+    total_ms: round(median(runs.map(r => r.total))),
+    stages_ms: Object.fromEntries(stageNames.map(s => [s, round(median(runs.map(r => r.stages[s])))])),
+    drilldown_ms: round(median(runs.map(r => r.drilldown))),
+    payload_bytes: Buffer.byteLength(payloadText || ''),
+    drilldown_bytes: Buffer.byteLength(drilldownText || ''),
+    max_rss_kb: process.resourceUsage().maxRSS,
+    node: process.version,
+}));
+"""
+
+
+def run_measured(cmd):
+    """Runs `cmd`; returns (seconds, peak RSS of the child in KiB, stdout)."""
+    with tempfile.TemporaryFile("w+") as out, tempfile.TemporaryFile("w+") as err:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=HERE, stdout=out, stderr=err, text=True)
+        # wait4 reaps the child with its own rusage (RUSAGE_CHILDREN would
+        # report the largest child so far)
+        _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        if proc.returncode:
+            raise RuntimeError(f"{' '.join(cmd)} failed ({proc.returncode}):\n{err.read()}")
+        return seconds, usage.ru_maxrss, out.read()
+
+
+def bench_size(items, args, work_dir, node):
+    events_path = os.path.join(work_dir, f"events_{items}.ndjson")
+    html_path = os.path.join(work_dir, f"dashboard_{items}.html")
+    record = {"items": items, "days": args.days}
+
+    seconds, rss, stdout = run_measured(
+        [sys.executable, "generate_epcis_data.py", "--items", str(items), "--days", str(args.days),
+         "--seed", str(args.seed), "--workers", str(args.workers), "--ndjson", "--out", events_path])
+    events = re.search(r"Generated ([\d,]+) EPCIS events", stdout)
+    record["events"] = int(events.group(1).replace(",", "")) if events else None
+    record["generate"] = {"seconds": round(seconds, 3), "max_rss_kb": rss,
+                          "events_bytes": os.path.getsize(events_path)}
+
+    seconds, rss, _ = run_measured(
+        [sys.executable, "build_v4_rebuild.py", "--events", events_path, "--out", html_path])
+    record["build"] = {"seconds": round(seconds, 3), "max_rss_kb": rss,
+                       "html_bytes": os.path.getsize(html_path)}
+
+    if node:
+        script = os.path.join(work_dir, "bench_pipeline.js")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(NODE_BENCH)
+        _, _, stdout = run_measured([node, script, html_path, str(args.js_repeat)])
+        record["js"] = json.loads(stdout)
+    else:
+        record["js"] = None
+
+    if not args.keep:
+        os.remove(events_path)
+    return record
+
+
+def metric(record, path):
+    value = record
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(report, baseline, tolerance):
+    """Metrics more than `tolerance` (fraction) above the baseline run of the same size."""
+    before = {run["items"]: run for run in baseline["runs"]}
+    regressions = []
+    for run in report["runs"]:
+        old = before.get(run["items"])
+        if old is None:
+            continue
+        for path in COMPARED_METRICS:
+            new_value, old_value = metric(run, path), metric(old, path)
+            if new_value is None or not old_value:
+                continue
+            if new_value > old_value * (1 + tolerance):
+                regressions.append({"items": run["items"], "metric": path,
+                                    "baseline": old_value, "value": new_value,
+                                    "change": round(new_value / old_value - 1, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark generation, build and page pipeline by fleet size.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated starting fleet sizes (default %(default)s)")
+    parser.add_argument("--days", type=int, default=120, help="simulated days (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=7, help="generator seed (default %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="generate_epcis_data.py --workers (default %(default)s)")
+    parser.add_argument("--js-repeat", type=int, default=5,
+                        help="pipeline runs per size; the median is reported (default %(default)s)")
+    parser.add_argument("--report", default="benchmark_report.json",
+                        help="JSON report path (default %(default)s)")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="--baseline: allowed growth per metric, as a fraction (default %(default)s)")
+    parser.add_argument("--work-dir", help="directory for generated files (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated event streams")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    node = shutil.which("node")
+    if not node:
+        print("node not found: skipping the page pipeline benchmark", file=sys.stderr)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="towel-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    report = {
+        "version":   REPORT_VERSION,
+        "created":   datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+        "python":    platform.python_version(),
+        "platform":  platform.platform(),
+        "cpus":      os.cpu_count(),
+        "seed":      args.seed,
+        "workers":   args.workers,
+        "runs":      [],
+    }
+    try:
+        for items in sizes:
+            record = bench_size(items, args, work_dir, node)
+            report["runs"].append(record)
+            js = record["js"]
+            print(f"{items:>7,} towels: {record['events'] or 0:>11,} events | "
+                  f"generate {record['generate']['seconds']:7.2f}s | "
+                  f"build {record['build']['seconds']:7.2f}s, {record['build']['html_bytes'] / 1024:,.0f} KiB | "
+                  + (f"pipeline {js['total_ms']:.1f} ms" if js else "pipeline n/a"))
+    finally:
+        if not args.work_dir and not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['items']:,} towels {r['metric']}: {r['baseline']} -> {r['value']} "
+                  f"({r['change']:+.0%})", file=sys.stderr)
+        status = 1 if report["regressions"] else 0
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.report}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,164 +1,269 @@
 """
 build_v4_rebuild.py
-Builds the towel v4 dashboard by injecting fresh EPCIS JSON and script logic
-into a clean towel-only HTML template.
-"""
-import json, re
+Builds the towel v4 dashboard by folding the EPCIS events into compact
+aggregates (dashboard_aggregates.py) and injecting them, together with the
+script logic, into a clean towel-only HTML template.
 
-with open("epcis_events.json", "r") as f:
-    raw_json = f.read()
+Reads epcis_events.json (JSON array) or an .ndjson stream written by
+`generate_epcis_data.py --ndjson`; NDJSON is folded line by line.
 
-with open("towel_dashboard_v4_template.html", "r", encoding="utf-8") as f:
-    html = f.read()
+With --checkpoint the fold state is saved after each build and the next build
+only folds events appended since, so rebuild cost scales with new scans.
 
-# ── 2. Build the new script block ─────────────────────────────────────────────
-NEW_SCRIPT = r"""<script>
-        const rawData = __RAWDATA__;
-
-        // ── Data Processing Engine ─────────────────────────────────────────
-        function processData(data) {
-            const inventory       = {};
-            const usageByDate     = {};
-            const usageByWardDate = {};
-            const complianceAlerts = [];
-            const allDwells       = {
-                'New Linen Department':     [],
-                'Laundry Department':       [],
-                'Cleaned Linen Department': [],
-                'Ward': []          // any ward bucket
-            };
-            const wardsSet = new Set();
-            const initMeta = {};    // EPC -> { initialCycles, homeWard }
-
-            data.sort((a, b) => new Date(a['Event Timestamp']) - new Date(b['Event Timestamp']));
-
-            data.forEach(ev => {
-                const epc  = ev['EPC'];
-                const loc  = ev['Location'];
-                const proc = ev['Process'];
-                const time = new Date(ev['Event Timestamp']);
-                const dateStr = time.toISOString().split('T')[0];
-
-                // INIT meta-events (carry starting cycle count)
-                if (proc === 'INIT') {
-                    initMeta[epc] = {
-                        initialCycles: ev['Initial Cycles'] || 0,
-                        homeWard: ev['Home Ward'] || ''
-                    };
-                    return;
-                }
+Drill Down traces are read back per EPC through an offset index recorded while
+folding (and kept in the checkpoint), and embedded as a separate block the
+page decodes on first use.
 
-                if (!inventory[epc]) {
-                    inventory[epc] = {
-                        epc,
-                        type: ev['Item Description'],
-                        gtin: ev['GTIN'],
-                        currentLocation: loc,
-                        lastInTime: time,
-                        cycles: 0,
-                        history: []
-                    };
-                }
+Raw reader exports (.csv / data.js, see scanner_ingest.py) can be passed to
+--events directly; they are normalized and sorted on the fly.
 
-                const item = inventory[epc];
+With --store the aggregates are queried from a SQLite event store
+(event_store.py) instead of folding an event file.
 
-                // Dwell calculation on OUT
-                if (proc === 'OUT' && item.history.length > 0) {
-                    const last = item.history[item.history.length - 1];
-                    if (last.Process === 'IN' && last.Location === loc) {
-                        const dh = (time - new Date(last['Event Timestamp'])) / 3600000;
-                        const bucket = loc.startsWith('Ward') ? 'Ward' : loc;
-                        if (allDwells[bucket] !== undefined) allDwells[bucket].push(dh);
-                    }
-                }
+With --sites (site_config.py) the event stream is partitioned by "Site ID" in
+one pass, every site's dashboard is built in a process pool, and a group
+roll-up page is merged from the per-site fold states.
 
-                // Usage: IN at any ward
-                if (loc.startsWith('Ward') && proc === 'IN') {
-                    usageByDate[dateStr] = (usageByDate[dateStr] || 0) + 1;
-                    wardsSet.add(loc);
-                    if (!usageByWardDate[loc]) usageByWardDate[loc] = {};
-                    usageByWardDate[loc][dateStr] = (usageByWardDate[loc][dateStr] || 0) + 1;
-                    item.lastInTime = time;
-                }
+With --replay the fold also logs stock / ward / lifecycle counter checkpoints
+every few hours plus the moves between them; the page's time slider rebuilds
+any instant from the nearest checkpoint.
 
-                // Cycle count: IN at Laundry
-                if (loc === 'Laundry Department' && proc === 'IN') {
-                    item.cycles += 1;
-                }
+With --compress the data blocks are embedded gzipped and base64-encoded, and
+the page inflates each one when it is first needed (DecompressionStream:
+Chrome 80+, Firefox 113+, Safari 16.4+).
+"""
+import argparse
+import base64, gzip
+import json, os, re
+import tempfile
+from html import escape
+from multiprocessing import Pool
+
+from columnar import DECODER_JS
+from dashboard_aggregates import (FLOW_WINDOW_S, REPLAY_INTERVAL_S, SNAPSHOT_TIME, STAGE_HISTOGRAMS,
+                                  DashboardAggregator, ReplayLog, drilldown_block,
+                                  format_timestamp, load_histogram_config, parse_timestamp,
+                                  site_ward)
+from epcis_io import (EpcHistoryIndex, TraceCache, event_line, is_ndjson, iter_events,
+                      iter_ndjson_from, log_head_digest)
+from event_store import EventStore, iter_source_events
+from generate_epcis_data import Simulation
+from scanner_ingest import is_scanner_export, iter_scanner_events
+from site_config import SITE_FIELD, load_sites
+
+EVENTS_PATH   = "epcis_events.json"
+TEMPLATE_PATH = "towel_dashboard_v4_template.html"
+OUTPUT_PATH   = "Towel Tracking Dashboard demo v4.html"
+CHECKPOINT_VERSION = 9
+
+# ── 2. Build the new script blocks ────────────────────────────────────────────
+# The data pipeline runs in a Web Worker created from a Blob URL, so the HTML
+# stays a single portable file.  Its source is embedded as a non-executing
+# <script type="text/js-worker"> block and never touches the DOM; the page
+# script renders skeleton cards straight away and fills each card and chart as
+# the worker posts its stage results.
+WORKER_SCRIPT = r"""
+        // ── Columnar tables (see columnar.py) ─────────────────────────────
+__DECODER_JS__
+
+        // ── Time-window index over the recent events ──────────────────────
+        // recentEvents.t is ascending (the builder emits the window in
+        // chronological order), so a window query is two binary searches and
+        // callers only touch the k events inside it: O(log n + k).
+        function lowerBound(sorted, x) {
+            let lo = 0, hi = sorted.length;
+            while (lo < hi) { const mid = (lo + hi) >>> 1; if (sorted[mid] < x) lo = mid + 1; else hi = mid; }
+            return lo;
+        }
 
-                // Trust explicit final cycle count at retirement
-                if (proc === 'DECOMMISSION' && typeof ev['Final Cycles'] === 'number') {
-                    item.cycles = Math.max(item.cycles, ev['Final Cycles']);
-                }
+        function upperBound(sorted, x) {
+            let lo = 0, hi = sorted.length;
+            while (lo < hi) { const mid = (lo + hi) >>> 1; if (sorted[mid] <= x) lo = mid + 1; else hi = mid; }
+            return lo;
+        }
 
-                // Compliance: illegal skips
-                if (proc === 'IN' && item.history.length > 0) {
-                    const prev = item.currentLocation;
-                    if (prev.startsWith('Ward') && loc === 'Cleaned Linen Department') {
-                        complianceAlerts.push({ epc, type: 'Skipped Laundry (Ward→Storage)', date: dateStr });
-                    }
-                    if (prev === 'New Linen Department' && loc.startsWith('Ward')) {
-                        complianceAlerts.push({ epc, type: 'Skipped First Wash (New→Ward)', date: dateStr });
-                    }
+        // ── Compressed blocks (build_v4_rebuild.py --compress) ───────────
+        // A block with data-encoding="gzip" holds gzipped JSON as base64.  The
+        // base64 is decoded in 64 KiB slices straight into a
+        // DecompressionStream, so the whole binary is never held at once.
+        // Resolves with the JSON text; plain blocks resolve unchanged.
+        const INFLATE_SLICE = 65536;   // base64 chars per slice (a multiple of 4)
+
+        function inflateText(text, encoding) {
+            if (!encoding) return Promise.resolve(text);
+            if (typeof DecompressionStream !== 'function') {
+                return Promise.reject(new Error(
+                    'This browser cannot read compressed dashboards (no DecompressionStream); rebuild without --compress.'));
+            }
+            const stream = new DecompressionStream(encoding);
+            const writer = stream.writable.getWriter();
+            (async () => {
+                for (let i = 0; i < text.length; i += INFLATE_SLICE) {
+                    const binary = atob(text.slice(i, i + INFLATE_SLICE));
+                    const bytes = new Uint8Array(binary.length);
+                    for (let j = 0; j < binary.length; j++) bytes[j] = binary.charCodeAt(j);
+                    await writer.write(bytes);
                 }
+                await writer.close();
+            })().catch(() => {});   // a corrupt block rejects the read below
+            return new Response(stream.readable).text();
+        }
 
-                if (proc === 'IN') {
-                    item.lastInTime = time;
-                    item.currentLocation = loc;
-                }
-                item.history.push(ev);
+        // Runs the pipeline on a { text, encoding } payload.  Plain payloads run
+        // synchronously; inflate or pipeline failures are emitted as an 'error' stage.
+        function runPayload(payload, emit) {
+            if (!payload.encoding) return runDashboardPipeline(payload.text, emit);
+            return inflateText(payload.text, payload.encoding)
+                .then(text => runDashboardPipeline(text, emit))
+                .catch(err => emit({ stage: 'error', message: String(err && err.message || err) }));
+        }
+
+        // ── Dashboard pipeline ────────────────────────────────────────────
+        // Parses the payload and emits one message per stage, cheapest first:
+        // kpis → distributions → usage → forecast → activity → done.
+        function runDashboardPipeline(payloadText, emit) {
+            const dashboardData = JSON.parse(payloadText);
+            const recencyStart = new Date(dashboardData.flow24h.start);
+            const recencyEnd   = new Date(dashboardData.flow24h.end);
+            const recentEvents = decodeTable(dashboardData.recentEvents);
+
+            // Index range [from, to) of events with start <= time <= end (Dates or epoch ms).
+            function eventsBetween(start, end) {
+                const from = lowerBound(recentEvents.t, +start / 1000);
+                const to   = Math.max(from, upperBound(recentEvents.t, +end / 1000));
+                return { from, to, length: to - from };
+            }
+
+            // ── 24h flow KPI: only the events inside the window are visited ───
+            // Codes are compared as integers; each dictionary string is classified once.
+            const LOC = recentEvents.location, PROC = recentEvents.process;
+            const locIsWard    = Uint8Array.from(LOC.values, v => v.startsWith('Ward') ? 1 : 0);
+            const locIsStorage = Uint8Array.from(LOC.values, v => v === 'Cleaned Linen Department' ? 1 : 0);
+            const PROC_IN = PROC.values.indexOf('IN'), PROC_OUT = PROC.values.indexOf('OUT');
+            const flowWindow = eventsBetween(recencyStart, recencyEnd);
+            let received24h = 0, dispatched24h = 0;
+            for (let i = flowWindow.from; i < flowWindow.to; i++) {
+                const loc = LOC.codes[i], proc = PROC.codes[i];
+                if (proc === PROC_IN && locIsWard[loc]) received24h++;
+                else if (proc === PROC_OUT && locIsStorage[loc]) dispatched24h++;
+            }
+
+            emit({
+                stage: 'kpis',
+                snapshot:        dashboardData.snapshot,
+                flow24h:         dashboardData.flow24h,
+                wards:           dashboardData.wards,
+                itemCount:       dashboardData.itemCount,
+                storageSample:   dashboardData.storageSample,
+                stockCounts:     dashboardData.stockCounts,
+                wardStockCounts: dashboardData.wardStockCounts,
+                recentDecomm30d: dashboardData.recentDecomm30d,
+                received24h, dispatched24h
             });
 
-            // Merge initial cycles from INIT events
-            Object.entries(inventory).forEach(([epc, item]) => {
-                if (initMeta[epc]) {
-                    item.cycles += initMeta[epc].initialCycles;
-                    item.homeWard = initMeta[epc].homeWard;
-                }
+            emit({
+                stage: 'distributions',
+                lifecycle:       dashboardData.lifecycle,
+                dwellHistograms: dashboardData.dwellHistograms
             });
 
-            return { inventory, usageByDate, usageByWardDate, wards: Array.from(wardsSet).sort(), complianceAlerts, allDwells };
-        }
+            // ── Daily usage columns → Chart 1 (last 30 complete days) ────────
+            const DAY_MS = 86400000;
+            const CHART1_DAYS = 30;
+            const usage = dashboardData.usage;
+            const usageStartMs = usage.start ? Date.parse(usage.start + 'T00:00:00Z') : 0;
+            const usageTotal = Uint32Array.from(usage.total);
+            const usageWards = Object.keys(usage.byWard);
+            const usageByWard = usageWards.map(w => Uint32Array.from(usage.byWard[w]));
+            // Only complete days (before the snapshot date) are charted
+            const snapshotDayMs = Date.parse(new Date(dashboardData.snapshot).toISOString().split('T')[0] + 'T00:00:00Z');
+            const completeDays = usage.start
+                ? Math.max(0, Math.min(usage.days, Math.round((snapshotDayMs - usageStartMs) / DAY_MS)))
+                : 0;
+
+            const chart1Labels = [], chart1Total = [], chart1ByWard = usageWards.map(() => []);
+            for (let d = Math.max(0, completeDays - CHART1_DAYS); d < completeDays; d++) {
+                chart1Labels.push(new Date(usageStartMs + d * DAY_MS).toISOString().split('T')[0]);
+                chart1Total.push(usageTotal[d]);
+                usageByWard.forEach((series, w) => chart1ByWard[w].push(series[d]));
+            }
 
-        const processed = processData(rawData);
-        const items     = Object.values(processed.inventory);
-        const SIM_END   = new Date('2025-05-01T08:00:00Z');
-        const LOW_STOCK_THRESHOLD = 5;
+            emit({ stage: 'usage', usageWards, chart1Labels, chart1Total, chart1ByWard });
 
-        const latestEventMs = rawData.reduce((maxTs, ev) => {
-            const ts = Date.parse(ev['Event Timestamp'] || '');
-            return Number.isNaN(ts) ? maxTs : Math.max(maxTs, ts);
-        }, 0);
-        const recencyEnd = latestEventMs ? new Date(latestEventMs) : SIM_END;
-        const recencyStart = new Date(recencyEnd);
-        recencyStart.setDate(recencyStart.getDate() - 1);
+            // ── Chart 6: Forecasting ──────────────────────────────────────────
+            // Fitted at build time (forecast.py): the series, rolling averages,
+            // forecasts and intervals are embedded, only the date labels are made here.
+            const forecast = dashboardData.forecast;
+            const dayLabels = (start, n) => {
+                const startMs = Date.parse(start + 'T00:00:00Z');
+                return Array.from({ length: n }, (_, i) => new Date(startMs + i * DAY_MS).toISOString().split('T')[0]);
+            };
+            const histDates = dayLabels(forecast.historyStart, forecast.total.history.length);
+            const fcDates = dayLabels(forecast.start, forecast.days);
+            const avgDaily = forecast.avgDaily;
+
+            // Retirement calendar: projected per towel by the builder from its own wash rate
+            const retirement = dashboardData.retirement;
+            const weekDates = dayLabels(retirement.start, retirement.weeks.length * 7).filter((_, i) => i % 7 === 0);
+
+            emit({ stage: 'forecast', histDates, fcDates, forecast, avgDaily, retirement, weekDates });
+
+            // ── Recent Towel Activity rows ────────────────────────────────────
+            const formatEventTime = sec => new Date(sec * 1000).toISOString().slice(0, 19).replace('T', ' ');
+            // Newest 15 events up to the window end: the tail of the index range
+            const upToEnd = eventsBetween(0, recencyEnd);
+            const first = Math.max(upToEnd.from, upToEnd.to - 15);
+            const rows = [];
+            for (let i = upToEnd.to - 1; i >= first; i--) {
+                const processLabel = PROC.at(i) || '-';
+                rows.push({
+                    timestamp:   formatEventTime(recentEvents.t[i]),
+                    epc:         recentEvents.epc.at(i),
+                    shortEpc:    String(recentEvents.epc.at(i)).split('.').pop(),
+                    description: recentEvents.description.at(i) || '-',
+                    cycles:      recentEvents.cycles[i],
+                    location:    LOC.at(i) || '-',
+                    status:
+                        processLabel === 'DECOMMISSION' ? 'Retired' :
+                        processLabel === 'OUT' ? 'Checked Out' :
+                        processLabel === 'IN' ? 'Checked In' :
+                        'Active'
+                });
+            }
+            emit({ stage: 'activity', rows });
 
-        function getLastEvent(item) {
-            return item.history[item.history.length - 1] || null;
-        }
+            // ── Compliance alert index (paged in the notification panel) ─────
+            emit({ stage: 'alerts', alerts: dashboardData.alerts });
 
-        function getCurrentCheckIn(item) {
-            // An item is "currently in a stage" if its last event is an IN (no OUT yet)
-            const lastEv = item.history[item.history.length - 1];
-            return (lastEv && lastEv.Process === 'IN') ? lastEv : null;
+            emit({ stage: 'done' });
         }
+"""
 
-        function getCurrentStageKey(item) {
-            const cur = getCurrentCheckIn(item);
-            if (!cur) return null;
-            if (cur.Location === 'New Linen Department') return 'New Linen';
-            if (cur.Location === 'Laundry Department') return 'Laundry';
-            if (cur.Location === 'Cleaned Linen Department') return 'Storage';
-            if (cur.Location.startsWith('Ward')) return 'Ward';
-            return null;
+NEW_SCRIPT = r"""<script>
+        const LOW_STOCK_THRESHOLD = 5;
+        const workerSource = document.getElementById('dashboard-worker').textContent;
+        let workerLib = null;
+
+        // The worker script's helpers on the main thread (alerts, Drill Down,
+        // replay, the inline fallback); its source is evaluated once, on first use
+        function workerHelpers() {
+            return workerLib || (workerLib = new Function(workerSource +
+                '\nreturn { decodeTable, lowerBound, upperBound, inflateText, runPayload };')());
         }
 
-        // ── KPI Cards ──────────────────────────────────────────────────────
-        const activeItems = items.filter(i => {
-            const last = getLastEvent(i);
-            return last && last.Process !== 'DECOMMISSION';
-        });
+        // Filled in by the 'kpis' stage of the data worker
+        let dashboardMeta = { snapshot: null, wards: [], storageSample: [], itemCount: 0 };
+        let stockCounts = {}, suggestedOrderQty = 0, dwellHistograms = {};
+        let stockChart = null, wardChart = null, lifecycleChart = null;
 
+        function markReady(el) {
+            if (el) el.classList.remove('is-loading');
+        }
+
+        function markChartReady(canvasId) {
+            const canvas = document.getElementById(canvasId);
+            if (canvas) markReady(canvas.parentElement);
+        }
         // ── Language Toggle ────────────────────────────────────────────────
         const enBtn = document.getElementById('en-btn');
         const thBtn = document.getElementById('th-btn');
@@ -190,6 +295,12 @@ NEW_SCRIPT = r"""<script>
                 ' ' + ts.toLocaleTimeString('en-GB', { hour: '2-digit', minute: '2-digit' });
         }
 
+        // Data strings (locations, rules, staff, descriptions) before they go into innerHTML
+        const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+        function escapeHtml(value) {
+            return String(value).replace(/[&<>"']/g, c => HTML_ESCAPES[c]);
+        }
+
         function formatTowelLabel(epc) {
             const epcText = String(epc || '').trim();
             if (!epcText) return 'Towel Unknown';
@@ -214,8 +325,8 @@ NEW_SCRIPT = r"""<script>
 
             notificationList.innerHTML = notifications.map(n => (
                 `<li class="notification-item">` +
-                    `<div class="notification-item-title">${n.message}</div>` +
-                    (n.detail ? `<div class="notification-item-detail">${n.detail}</div>` : '') +
+                    `<div class="notification-item-title">${escapeHtml(n.message)}</div>` +
+                    (n.detail ? `<div class="notification-item-detail">${escapeHtml(n.detail)}</div>` : '') +
                     `<div class="notification-item-time">${formatNotificationTime(n.timestamp)}</div>` +
                 `</li>`
             )).join('');
@@ -252,6 +363,112 @@ NEW_SCRIPT = r"""<script>
             notificationModal.setAttribute('aria-hidden', 'true');
         }
 
+        // ── Compliance alerts (notification panel) ────────────────────────
+        // The builder's alert index lists the alert rows newest day first, the
+        // row ids of each ward and each rule, and each day's row range.  A
+        // filter is at most one merge of two id lists plus two binary searches,
+        // and a page is a slice, so thousands of alerts page instantly.  The
+        // table itself is decoded when the panel first shows it.
+        const ALERT_PAGE_SIZE = 25;
+        const alertViewBtn    = document.getElementById('alert-view-btn');
+        const alertView       = document.getElementById('alert-view');
+        const alertCount      = document.getElementById('alert-count');
+        const alertWardFilter = document.getElementById('alert-ward-filter');
+        const alertRuleFilter = document.getElementById('alert-rule-filter');
+        const alertDayFilter  = document.getElementById('alert-day-filter');
+        const alertList       = document.getElementById('alert-list');
+        const alertPageInfo   = document.getElementById('alert-page-info');
+        const alertPrevBtn    = document.getElementById('alert-prev-btn');
+        const alertNextBtn    = document.getElementById('alert-next-btn');
+        let alertIndex = null, alertTable = null, alertRows = null, alertPage = 0;
+
+        function setAlertIndex(index) {
+            alertIndex = index;
+            alertTable = null;
+            if (alertCount) alertCount.textContent = index.total;
+            const options = (all, lists) => `<option value="">${all} (${index.total})</option>` +
+                Object.entries(lists).map(([key, rows]) =>
+                    `<option value="${escapeHtml(key)}">${escapeHtml(key)} (${rows.length})</option>`).join('');
+            if (alertWardFilter) alertWardFilter.innerHTML = options('All Wards', index.wards);
+            if (alertRuleFilter) alertRuleFilter.innerHTML = options('All Rules', index.rules);
+            filterAlerts();
+        }
+
+        // Ascending row ids in both sorted lists
+        function intersectRows(a, b) {
+            const out = [];
+            for (let i = 0, j = 0; i < a.length && j < b.length;) {
+                if (a[i] < b[j]) i++;
+                else if (a[i] > b[j]) j++;
+                else { out.push(a[i]); i++; j++; }
+            }
+            return out;
+        }
+
+        function filterAlerts() {
+            if (!alertIndex) return;
+            const { lowerBound } = workerHelpers();
+            const ward = alertWardFilter && alertWardFilter.value;
+            const rule = alertRuleFilter && alertRuleFilter.value;
+            const day  = alertDayFilter && alertDayFilter.value;
+            let rows = null;                    // null: every row, in order
+            if (ward) rows = alertIndex.wards[ward] || [];
+            if (rule) rows = rows ? intersectRows(rows, alertIndex.rules[rule] || []) : (alertIndex.rules[rule] || []);
+            if (day) {
+                const [start, length] = alertIndex.days[day] || [0, 0];
+                rows = rows
+                    ? rows.slice(lowerBound(rows, start), lowerBound(rows, start + length))
+                    : Array.from({ length }, (_, i) => start + i);
+            }
+            alertRows = rows;
+            alertPage = 0;
+            renderAlertPage();
+        }
+
+        function renderAlertPage() {
+            if (!alertIndex || !alertList || !alertView || alertView.hidden) return;
+            if (!alertTable) {
+                alertTable = workerHelpers().decodeTable(alertIndex.table);
+            }
+            const total = alertRows ? alertRows.length : alertIndex.total;
+            const pages = Math.max(1, Math.ceil(total / ALERT_PAGE_SIZE));
+            alertPage = Math.min(Math.max(0, alertPage), pages - 1);
+            const from = alertPage * ALERT_PAGE_SIZE, to = Math.min(total, from + ALERT_PAGE_SIZE);
+            const items = [];
+            for (let i = from; i < to; i++) {
+                const k = alertRows ? alertRows[i] : i;
+                const epc = alertTable.epc.at(k);
+                items.push(
+                    `<li class="notification-item">` +
+                        `<div class="notification-item-title">${escapeHtml(alertTable.rule.at(k))}</div>` +
+                        `<div class="notification-item-detail">${escapeHtml(formatTowelLabel(epc))} · ` +
+                            `${escapeHtml(alertTable.location.at(k))} · ${escapeHtml(alertTable.ward.at(k))}</div>` +
+                        `<div class="notification-item-time">${escapeHtml(alertTable.day.at(k))}</div>` +
+                    `</li>`
+                );
+            }
+            alertList.innerHTML = items.length ? items.join('')
+                : '<li class="notification-empty" data-en="No alerts match." data-th="ไม่มีการแจ้งเตือนที่ตรงกัน">No alerts match.</li>';
+            if (alertPageInfo) alertPageInfo.textContent = total ? `${from + 1}–${to} of ${total}` : '0 of 0';
+            if (alertPrevBtn) alertPrevBtn.disabled = alertPage === 0;
+            if (alertNextBtn) alertNextBtn.disabled = alertPage >= pages - 1;
+        }
+
+        function toggleAlertView() {
+            if (!alertView) return;
+            alertView.hidden = !alertView.hidden;
+            if (notificationList) notificationList.hidden = !alertView.hidden;
+            if (alertViewBtn) alertViewBtn.classList.toggle('active', !alertView.hidden);
+            renderAlertPage();
+        }
+
+        if (alertViewBtn) alertViewBtn.addEventListener('click', toggleAlertView);
+        [alertWardFilter, alertRuleFilter, alertDayFilter].forEach(el => {
+            if (el) el.addEventListener('change', filterAlerts);
+        });
+        if (alertPrevBtn) alertPrevBtn.addEventListener('click', () => { alertPage--; renderAlertPage(); });
+        if (alertNextBtn) alertNextBtn.addEventListener('click', () => { alertPage++; renderAlertPage(); });
+
         // ── Report Modal Logic ─────────────────────────────────────────────
         const reportBtn      = document.getElementById('report-btn');
         const reportModal    = document.getElementById('report-modal');
@@ -276,11 +493,94 @@ NEW_SCRIPT = r"""<script>
         if (reportCloseBtn) reportCloseBtn.addEventListener('click', closeReportModal);
         if (reportBackdrop) reportBackdrop.addEventListener('click', closeReportModal);
 
+        // ── Drill Down: one towel's full trace ─────────────────────────────
+        // The trace block (events grouped by EPC + an EPC -> start/length
+        // index) is parsed and decoded on the first Drill Down only; each
+        // lookup after that is a Map hit and a contiguous slice.
+        const drilldownModal    = document.getElementById('drilldown-modal');
+        const drilldownBackdrop = document.getElementById('drilldown-backdrop');
+        const drilldownCloseBtn = document.getElementById('drilldown-close-btn');
+        const drilldownSummary  = document.getElementById('drilldown-summary');
+        const drilldownBody     = document.getElementById('drilldown-body');
+        let drilldown = null;
+
+        // Parsed JSON of an embedded data block (inflated first if compressed)
+        function readDataBlock(block) {
+            if (!block) return Promise.resolve(null);
+            return workerHelpers().inflateText(block.textContent, block.dataset.encoding).then(JSON.parse);
+        }
+
+        function getDrilldown() {
+            if (drilldown) return drilldown;
+            const { decodeTable } = workerHelpers();
+            return (drilldown = readDataBlock(document.getElementById('drilldown-data')).then(raw => {
+                if (!raw) return { index: null, events: null, rowOf: new Map() };
+                const index = decodeTable(raw.index);
+                const rowOf = new Map();
+                for (let k = 0; k < index.n; k++) rowOf.set(index.epc.at(k), k);
+                return { index, events: decodeTable(raw.events), rowOf };
+            }));
+        }
+
+        function formatDuration(sec) {
+            return sec < 86400 ? `${(sec / 3600).toFixed(1)} h` : `${(sec / 86400).toFixed(1)} d`;
+        }
+
+        async function openDrilldown(epc) {
+            if (!drilldownModal) return;
+            const { index, events, rowOf } = await getDrilldown();
+            const k = rowOf.get(epc);
+            const formatTraceTime = sec => new Date(sec * 1000).toISOString().slice(0, 16).replace('T', ' ');
+
+            if (k === undefined) {
+                drilldownSummary.textContent = `${formatTowelLabel(epc)}: no trace embedded for this towel.`;
+                drilldownBody.innerHTML = '';
+            } else {
+                const start = index.start[k], end = start + index.length[k];
+                const snapshotSec = Date.parse(dashboardMeta.snapshot) / 1000;
+                let washes = index.initial[k];
+                const rows = [];
+                for (let i = start; i < end; i++) {
+                    const proc = events.process.at(i), loc = events.location.at(i);
+                    if (proc === 'IN' && loc === 'Laundry Department') washes++;
+                    // Dwell at a stage = IN until the towel's next scan (open IN: until the snapshot)
+                    let dwell = '-';
+                    if (proc === 'IN') {
+                        dwell = i + 1 < end
+                            ? formatDuration(events.t[i + 1] - events.t[i])
+                            : `${formatDuration(Math.max(0, snapshotSec - events.t[i]))} (open)`;
+                    }
+                    rows.push(
+                        `<tr><td>${formatTraceTime(events.t[i])}</td><td>${escapeHtml(proc)}</td><td>${escapeHtml(loc)}</td>` +
+                        `<td>${escapeHtml(events.staff.at(i) || '-')}</td><td>${dwell}</td><td>${washes}</td></tr>`
+                    );
+                }
+                const lastProc = end > start ? events.process.at(end - 1) : '-';
+                drilldownSummary.textContent =
+                    `${formatTowelLabel(epc)} · ${epc} · Home: ${index.homeWard.at(k) || '-'} · ` +
+                    `Initial cycles: ${index.initial[k]} · Wash cycles: ${washes} · ` +
+                    `${lastProc === 'DECOMMISSION' ? 'Retired' : 'Active'}`;
+                drilldownBody.innerHTML = rows.join('');
+            }
+            drilldownModal.classList.add('show');
+            drilldownModal.setAttribute('aria-hidden', 'false');
+        }
+
+        function closeDrilldownModal() {
+            if (!drilldownModal) return;
+            drilldownModal.classList.remove('show');
+            drilldownModal.setAttribute('aria-hidden', 'true');
+        }
+
+        if (drilldownCloseBtn) drilldownCloseBtn.addEventListener('click', closeDrilldownModal);
+        if (drilldownBackdrop) drilldownBackdrop.addEventListener('click', closeDrilldownModal);
+
         // Global Escape key to close any modal
         window.addEventListener('keydown', (e) => {
             if (e.key === 'Escape') {
                 closeNotificationModal();
                 closeReportModal();
+                closeDrilldownModal();
             }
         });
 
@@ -294,51 +594,34 @@ NEW_SCRIPT = r"""<script>
         }
 
         // ── Chart 1: Usage by Ward (last 30 days) ─────────────────────────
-        const completeCutoffDate = SIM_END.toISOString().split('T')[0];
-        const allCompleteDates = Object.keys(processed.usageByDate)
-            .filter(d => d < completeCutoffDate)
-            .sort();
+        let usageSeries = { usageWards: [], chart1Labels: [], chart1Total: [], chart1ByWard: [] };
 
         function getUsageSeries(ward) {
-            const source = (ward === 'All Wards')
-                ? processed.usageByDate
-                : (processed.usageByWardDate[ward] || {});
-            const labels = allCompleteDates.slice(-30);
-            const values = labels.map(d => source[d] || 0);
-            return { labels, values };
+            const { usageWards, chart1Labels, chart1Total, chart1ByWard } = usageSeries;
+            const w = usageWards.indexOf(ward);
+            const values = (ward === 'All Wards') ? chart1Total
+                : (w >= 0 ? chart1ByWard[w] : chart1Labels.map(() => 0));
+            return { labels: chart1Labels, values };
         }
 
         const wardFilter = document.getElementById('ward-filter');
-        if (wardFilter) {
-            wardFilter.innerHTML = '<option>All Wards</option>';
-            processed.wards.forEach(ward => {
-                const opt = document.createElement('option');
-                opt.value = ward;
-                opt.textContent = ward;
-                wardFilter.appendChild(opt);
-            });
-        }
 
         function triggerDebugDispatchNotification() {
-            const storageItems = items.filter(i => {
-                const cur = getCurrentCheckIn(i);
-                return cur && cur.Location === 'Cleaned Linen Department';
-            });
-
-            const randomItem = storageItems.length
-                ? storageItems[Math.floor(Math.random() * storageItems.length)]
+            const storageEpcs = dashboardMeta.storageSample || [];
+            const randomEpc = storageEpcs.length
+                ? storageEpcs[Math.floor(Math.random() * storageEpcs.length)]
                 : null;
 
             const selectedWard = (wardFilter && wardFilter.value && wardFilter.value !== 'All Wards')
                 ? wardFilter.value
                 : 'Wards';
 
-            const availableWards = (processed.wards || []).filter(w => String(w).startsWith('Ward'));
+            const availableWards = (dashboardMeta.wards || []).filter(w => String(w).startsWith('Ward'));
             const randomArrivalWard = availableWards.length
                 ? availableWards[Math.floor(Math.random() * availableWards.length)]
                 : 'Ward 1';
 
-            const towelId = randomItem ? randomItem.epc : 'Unknown Towel';
+            const towelId = randomEpc || 'Unknown Towel';
             const towelLabel = formatTowelLabel(towelId);
             pushNotification(
                 `${towelLabel} has been checked out from Clean Storage.`,
@@ -369,19 +652,74 @@ NEW_SCRIPT = r"""<script>
             if (ev.key === 'Escape') closeNotificationModal();
         });
 
-        const initialUsage = getUsageSeries('All Wards');
-        const usageChart = new Chart(document.getElementById('cycles-lifespan-chart'), {
-            type: 'bar',
-            data: {
-                labels: initialUsage.labels,
-                datasets: [{ label: 'Linen IN Events (All Wards)', data: initialUsage.values, backgroundColor: '#0056b3' }]
-            },
-            options: { responsive: true, maintainAspectRatio: false }
-        });
+        let usageChart = null;
+
+        // ── Chart 6: Usage forecast (per ward with the ward filter) ──────
+        // Each series carries its history, 7-day rolling average, forecast
+        // mean and 80% / 95% prediction bounds, all fitted by the builder.
+        let forecastSeries = null, forecastChart = null;
+
+        function forecastDatasets(ward) {
+            const { forecast, histDates, fcDates } = forecastSeries;
+            const s = (ward !== 'All Wards' && forecast.byWard[ward]) || forecast.total;
+            const past = values => [...values, ...Array(fcDates.length).fill(null)];
+            const ahead = values => [...Array(histDates.length).fill(null), ...values];
+            const band = { borderWidth: 0, pointRadius: 0, tension: 0.3 };
+            return [
+                {
+                    label: `Historical Usage (${ward})`,
+                    data: past(s.history),
+                    borderColor: '#0056b3', backgroundColor: 'rgba(0,86,179,0.1)',
+                    fill: true, tension: 0.3, pointRadius: 1
+                },
+                {
+                    label: '7-Day Average',
+                    data: past(s.rolling),
+                    borderColor: '#17a2b8', borderWidth: 1.5, fill: false, tension: 0.3, pointRadius: 0
+                },
+                {
+                    label: `Forecasted Usage (${fcDates.length}d)`,
+                    data: ahead(s.mean),
+                    borderColor: '#dc3545', borderDash: [6, 3],
+                    fill: false, tension: 0.3, pointRadius: 1
+                },
+                // Interval bands: each upper bound is filled down to its lower bound
+                { ...band, label: '95% Interval', data: ahead(s.hi95), fill: '+1', backgroundColor: 'rgba(220,53,69,0.08)' },
+                { ...band, label: '95% Lower', data: ahead(s.lo95), fill: false },
+                { ...band, label: '80% Interval', data: ahead(s.hi80), fill: '+1', backgroundColor: 'rgba(220,53,69,0.15)' },
+                { ...band, label: '80% Lower', data: ahead(s.lo80), fill: false }
+            ];
+        }
+
+        // Weekly retirements and the replenishment order placed that week
+        // (orders lead retirements by retirement.leadWeeks; week 0 also
+        // covers the overdue towels).
+        const RETIREMENT_CALENDAR_WEEKS = 8;
+
+        function renderRetirementCalendar(retirement, weekDates) {
+            const body = document.getElementById('fc-retire-calendar');
+            const note = document.getElementById('fc-retire-note');
+            if (body) {
+                body.innerHTML = weekDates.slice(0, RETIREMENT_CALENDAR_WEEKS).map((week, k) =>
+                    `<tr><td>${week}</td><td>${retirement.weeks[k]}</td><td>${retirement.orders[k] ?? 0}</td></tr>`
+                ).join('');
+            }
+            if (note) {
+                note.textContent =
+                    `Retire at ${retirement.retireAt} cycles · ${retirement.overdue} overdue · ` +
+                    `${retirement.later} beyond ${retirement.weeks.length} weeks · ` +
+                    `orders ${retirement.leadWeeks} weeks ahead · fleet ${(retirement.fleetRate * 7).toFixed(1)} washes/towel/week`;
+            }
+        }
 
         if (wardFilter) {
             wardFilter.addEventListener('change', () => {
                 const selectedWard = wardFilter.value || 'All Wards';
+                if (forecastChart) {
+                    forecastChart.data.datasets = forecastDatasets(selectedWard);
+                    forecastChart.update();
+                }
+                if (!usageChart) return;
                 const usage = getUsageSeries(selectedWard);
                 usageChart.data.labels = usage.labels;
                 usageChart.data.datasets[0].data = usage.values;
@@ -390,387 +728,899 @@ NEW_SCRIPT = r"""<script>
             });
         }
 
-        // ── Chart 2: Stock Levels ──────────────────────────────────────────
-        // Items with an open IN (last event = IN, no matching OUT) are genuinely
-        // "currently in" that stage at the snapshot date.
-        const stockCounts = { 'New Linen': 0, 'In Laundry': 0, 'Clean Storage': 0, 'In Wards': 0 };
-        const wardStockCounts = Object.fromEntries(processed.wards.map(ward => [ward, 0]));
-        items.forEach(i => {
-            const cur = getCurrentCheckIn(i);
-            if (!cur) return;
-            const loc = cur.Location;
-            if (loc === 'New Linen Department')      stockCounts['New Linen']++;
-            else if (loc === 'Laundry Department')   stockCounts['In Laundry']++;
-            else if (loc === 'Cleaned Linen Department') stockCounts['Clean Storage']++;
-            else if (loc.startsWith('Ward')) {
-                stockCounts['In Wards']++;
-                wardStockCounts[loc] = (wardStockCounts[loc] || 0) + 1;
-            }
-        });
-
-        // ── Top KPI: Linen Flow (24h) ─────────────────────────────────────
-        const received24h = rawData.filter(ev => {
-            if (ev['Process'] !== 'IN' || !String(ev['Location'] || '').startsWith('Ward')) return false;
-            const t = new Date(ev['Event Timestamp']);
-            return t >= recencyStart && t <= recencyEnd;
-        }).length;
-
-        const dispatched24h = rawData.filter(ev => {
-            if (ev['Process'] !== 'OUT' || ev['Location'] !== 'Cleaned Linen Department') return false;
-            const t = new Date(ev['Event Timestamp']);
-            return t >= recencyStart && t <= recencyEnd;
-        }).length;
-
-        const wardNames = Object.keys(wardStockCounts).sort();
-        const lowStockWards = wardNames.filter(ward => (wardStockCounts[ward] || 0) < LOW_STOCK_THRESHOLD);
-        const throughputValueEl = document.getElementById('throughput-24h-value');
-        if (throughputValueEl) throughputValueEl.textContent = `${received24h} IN / ${dispatched24h} OUT`;
-
-
-        const throughputCard = document.getElementById('throughput-24h');
-        if (throughputCard) {
-            throughputCard.setAttribute(
-                'data-tooltip',
-                `Linen movement in the latest 24-hour window.\nWindow: ${recencyStart.toLocaleDateString('en-GB',{day:'numeric',month:'short',year:'numeric'})} ${recencyStart.toLocaleTimeString('en-GB',{hour:'2-digit',minute:'2-digit'})} → ${recencyEnd.toLocaleDateString('en-GB',{day:'numeric',month:'short',year:'numeric'})} ${recencyEnd.toLocaleTimeString('en-GB',{hour:'2-digit',minute:'2-digit'})}\nIN: ${received24h}  OUT: ${dispatched24h}`
-            );
-        }
-
-        const circulatingNow = Object.values(stockCounts).reduce((a, b) => a + b, 0);
-        document.querySelector('#total-linen .value').textContent = circulatingNow;
-
-        const bedCoverage = Math.min(stockCounts['In Wards'], 20);
-        const wardCoverageValueEl = document.querySelector('#ward-coverage .value');
-        wardCoverageValueEl.textContent = `${bedCoverage} / 20`;
-        wardCoverageValueEl.classList.remove('kpi-good', 'kpi-caution');
-        if (bedCoverage >= 20) {
-            wardCoverageValueEl.classList.add('kpi-good');
-        }
-        // Future: Implement pill display logic here when scaling up (e.g., only show if stock < threshold)
-
-        const TARGET_BEDS = 20;
-        const TARGET_PAR_RATIO = 10;
-        const targetParInventory = TARGET_BEDS * TARGET_PAR_RATIO;
-        const recent30dStart = new Date(recencyEnd);
-        recent30dStart.setDate(recent30dStart.getDate() - 30);
-        const recentDecomm30d = rawData.filter(ev => {
-            if (ev['Process'] !== 'DECOMMISSION' || !ev['Event Timestamp']) return false;
-            const t = new Date(ev['Event Timestamp']);
-            return t >= recent30dStart && t <= recencyEnd;
-        }).length;
-        const suggestedOrderQty = Math.max(0, targetParInventory - circulatingNow) + recentDecomm30d;
-
-        document.querySelector('#monthly-replenishment .value').textContent = `${suggestedOrderQty} items`;
-
-        document.getElementById('total-linen').setAttribute(
-            'data-tooltip',
-            `Active towels currently in circulation across all stages.\nNow in circulation: ${circulatingNow}`
-        );
-        document.getElementById('monthly-replenishment').setAttribute(
-            'data-tooltip',
-            `Suggested order quantity for next month.\nTarget par = ${TARGET_BEDS} beds × ${TARGET_PAR_RATIO} = ${targetParInventory}\nCurrent inventory = ${circulatingNow}\n30-day decommissions = ${recentDecomm30d}\nSuggested order = max(0, ${targetParInventory} - ${circulatingNow}) + ${recentDecomm30d} = ${suggestedOrderQty}`
-        );
-        document.getElementById('ward-coverage').setAttribute(
-            'data-tooltip',
-            `Coverage in wards versus bed target.\nCurrent: ${bedCoverage} / ${TARGET_BEDS}`
-        );
-
-        new Chart(document.getElementById('bottlenecks-chart'), {
-            type: 'doughnut',
-            data: {
-                labels: Object.keys(stockCounts),
-                datasets: [{ data: Object.values(stockCounts), backgroundColor: ['#17a2b8','#ffc107','#0056b3','#dc3545'] }]
-            },
-            options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'right' } } }
-        });
-
-        // ── Chart 5: Life Cycle Analysis ──────────────────────────────────
-        // Red bar is a risk backlog indicator:
-        // items at >=100 cycles that are NOT yet decommissioned.
-        const lc = { 'New (0-20)': 0, 'Active (21-70)': 0, 'Old (71-99)': 0, 'Overdue (100+)': 0 };
-        items.forEach(i => {
-            const last = getLastEvent(i);
-            const isAlreadyRetired = last && last.Process === 'DECOMMISSION';
-            if (isAlreadyRetired) return;
-
-            if      (i.cycles <= 20) lc['New (0-20)']++;
-            else if (i.cycles <= 70) lc['Active (21-70)']++;
-            else if (i.cycles <= 99) lc['Old (71-99)']++;
-            else                     lc['Overdue (100+)']++;
-        });
-
-        new Chart(document.getElementById('lost-by-step-chart'), {
-            type: 'bar',
-            data: {
-                labels: Object.keys(lc),
-                datasets: [{ label: 'Items', data: Object.values(lc), backgroundColor: ['#0056b3','#28a745','#ffc107','#dc3545'] }]
-            },
-            options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { display: false } } }
-        });
-
         // ── Chart 4a: Stage Duration Histogram ────────────────────────────
-        // Only counts items CURRENTLY in the stage (open IN = last event is IN, no OUT yet).
-        // Dwell = time since they checked IN.  Unit varies by stage: hours (fast) vs days (slow).
-        const STAGE_CONFIG = {
-            'New Linen': {
-                locMatch: loc => loc === 'New Linen Department',
-                unit: 'day',
-                buckets: [1, 2, 3, 4, 5, 6, 7],
-                bucketLabel: d => 'Day ' + d,
-                xLabel: 'Days in New Linen'
-            },
-            'Laundry': {
-                locMatch: loc => loc === 'Laundry Department',
-                unit: 'hour',
-                buckets: [2, 4, 6, 8, 10, 12, 18, 24],
-                bucketLabel: h => h + 'h',
-                xLabel: 'Hours in Laundry'
-            },
-            'Storage': {
-                locMatch: loc => loc === 'Cleaned Linen Department',
-                unit: 'day',
-                buckets: [1, 2, 3, 4, 5, 6, 7],
-                bucketLabel: d => 'Day ' + d,
-                xLabel: 'Days in Clean Storage'
-            },
-            'Ward': {
-                locMatch: loc => loc.startsWith('Ward'),
-                unit: 'hour',
-                buckets: [2, 4, 6, 8, 10, 12, 18, 24],
-                bucketLabel: h => h + 'h',
-                xLabel: 'Hours in Ward'
-            }
-        };
+        // "In Stage Now" counts items CURRENTLY in the stage (open IN = last event is IN,
+        // no OUT yet), dwell = time since they checked IN.  "Completed Stays" counts every
+        // closed IN -> OUT stay in the history.  Buckets and percentiles are precomputed
+        // at build time, so switching is a lookup.
+        let dwellMode = 'current', dwellStage = 'Storage';
 
         function buildHistogram(stageKey) {
             if (stageKey === 'DEBUG_TOTAL') {
-                return { buckets: { ...stockCounts, 'TOTAL': items.length }, xLabel: 'Stage' };
+                return { buckets: { ...stockCounts, 'TOTAL': dashboardMeta.itemCount }, xLabel: 'Stage', stats: null };
             }
-            const cfg = STAGE_CONFIG[stageKey];
-            if (!cfg) return { buckets: {}, xLabel: '' };
-
-            const rawDwells = [];
-            items.forEach(item => {
-                const cur = getCurrentCheckIn(item);   // only items with OPEN IN
-                if (!cur || !cfg.locMatch(cur.Location)) return;
-                const dwell = cfg.unit === 'hour'
-                    ? (SIM_END - new Date(cur['Event Timestamp'])) / 3600000
-                    : (SIM_END - new Date(cur['Event Timestamp'])) / 86400000;
-                if (dwell >= 0) rawDwells.push(dwell);
-            });
-
-            const bucketKeys = cfg.buckets.map(cfg.bucketLabel);
-            const buckets = Object.fromEntries(bucketKeys.map(k => [k, 0]));
-            rawDwells.forEach(d => {
-                const fit = cfg.buckets.find(b => d <= b) || cfg.buckets[cfg.buckets.length - 1];
-                buckets[cfg.bucketLabel(fit)]++;
-            });
+            const hist = dwellHistograms[stageKey];
+            if (!hist) return { buckets: {}, xLabel: '', stats: null };
+            const source = dwellMode === 'completed' ? hist.completed : hist;
+            const buckets = Object.fromEntries(hist.labels.map((label, i) => [label, source.counts[i]]));
+            const n = dwellMode === 'completed' ? source.n : source.counts.reduce((a, b) => a + b, 0);
+            return { buckets, xLabel: hist.xLabel, stats: { ...source.percentiles, n, unit: hist.unit } };
+        }
 
-            return { buckets, xLabel: cfg.xLabel };
+        function renderDwellPercentiles(stats) {
+            const el = document.getElementById('dwell-percentiles');
+            if (!el) return;
+            if (!stats || !stats.n) { el.textContent = ''; return; }
+            const suffix = stats.unit === 'day' ? 'd' : 'h';
+            el.textContent = ['p50', 'p90', 'p99'].map(p => `${p} ${stats[p]}${suffix}`).join(' · ')
+                + ` · n = ${stats.n.toLocaleString()}`;
         }
 
         let chart4a = null;
 
         function render4aChart(stageKey) {
-            document.querySelectorAll('.stage-btn').forEach(b => b.classList.toggle('active', b.dataset.stage === stageKey));
-            const { buckets, xLabel } = buildHistogram(stageKey);
+            dwellStage = stageKey;
+            document.querySelectorAll('.stage-btn[data-stage]').forEach(b => b.classList.toggle('active', b.dataset.stage === stageKey));
+            document.querySelectorAll('.dwell-mode-btn').forEach(b => b.classList.toggle('active', b.dataset.mode === dwellMode));
+            const { buckets, xLabel, stats } = buildHistogram(stageKey);
+            renderDwellPercentiles(stats);
             if (chart4a) {
                 chart4a.data.labels = Object.keys(buckets);
                 chart4a.data.datasets[0].data  = Object.values(buckets);
-                chart4a.data.datasets[0].label = 'Items — ' + stageKey;
+                chart4a.data.datasets[0].label = (dwellMode === 'completed' ? 'Stays — ' : 'Items — ') + stageKey;
                 chart4a.options.scales.x.title.text = xLabel;
+                chart4a.options.scales.y.title.text = dwellMode === 'completed' ? 'Number of Stays' : 'Number of Items';
+                chart4a.options.scales.y.ticks.stepSize = dwellMode === 'completed' ? undefined : 1;
                 chart4a.update();
             }
         }
 
-        const initResult = buildHistogram('Storage');
-        chart4a = new Chart(document.getElementById('rfid-barcode-chart'), {
-            type: 'bar',
-            data: {
-                labels: Object.keys(initResult.buckets),
-                datasets: [{ label: 'Items — Storage', data: Object.values(initResult.buckets), backgroundColor: '#0056b3', borderRadius: 3 }]
-            },
-            options: {
-                responsive: true, maintainAspectRatio: false,
-                scales: {
-                    x: { title: { display: true, text: initResult.xLabel } },
-                    y: { beginAtZero: true, title: { display: true, text: 'Number of Items' }, ticks: { stepSize: 1 } }
-                },
-                plugins: { legend: { display: false } }
-            }
-        });
-
-        document.querySelectorAll('.stage-btn').forEach(btn => {
+        document.querySelectorAll('.stage-btn[data-stage]').forEach(btn => {
             btn.addEventListener('click', () => render4aChart(btn.dataset.stage));
         });
+        document.querySelectorAll('.dwell-mode-btn').forEach(btn => {
+            btn.addEventListener('click', () => { dwellMode = btn.dataset.mode; render4aChart(dwellStage); });
+        });
+
+        // ── Top KPI cards (the live feed re-renders them in place) ────────
+        function renderKpiCards(r) {
+            const recencyStart = new Date(r.flow24h.start);
+            const recencyEnd   = new Date(r.flow24h.end);
+            const { received24h, dispatched24h } = r;
+
+            // ── Top KPI: Linen Flow (24h) ─────────────────────────────
+            const throughputValueEl = document.getElementById('throughput-24h-value');
+            if (throughputValueEl) throughputValueEl.textContent = `${received24h} IN / ${dispatched24h} OUT`;
+
+            const throughputCard = document.getElementById('throughput-24h');
+            if (throughputCard) {
+                throughputCard.setAttribute(
+                    'data-tooltip',
+                    `Linen movement in the latest 24-hour window.\nWindow: ${recencyStart.toLocaleDateString('en-GB',{day:'numeric',month:'short',year:'numeric'})} ${recencyStart.toLocaleTimeString('en-GB',{hour:'2-digit',minute:'2-digit'})} → ${recencyEnd.toLocaleDateString('en-GB',{day:'numeric',month:'short',year:'numeric'})} ${recencyEnd.toLocaleTimeString('en-GB',{hour:'2-digit',minute:'2-digit'})}\nIN: ${received24h}  OUT: ${dispatched24h}`
+                );
+            }
+
+            const circulatingNow = Object.values(stockCounts).reduce((a, b) => a + b, 0);
+            document.querySelector('#total-linen .value').textContent = circulatingNow;
 
-        // ── Chart 3: Ward Availability vs Minimum Threshold ─────────────
-        const wardLabels = wardNames;
-        const wardValues = wardLabels.map(ward => wardStockCounts[ward] || 0);
-        const wardThreshold = wardLabels.map(() => LOW_STOCK_THRESHOLD);
-
-        new Chart(document.getElementById('linen-status-chart'), {
-            type: 'bar',
-            data: {
-                labels: wardLabels,
-                datasets: [
-                    {
-                        label: 'Available Towels',
-                        data: wardValues,
-                        backgroundColor: wardValues.map(v => v < LOW_STOCK_THRESHOLD ? '#dc3545' : '#0056b3'),
-                        borderRadius: 4
+            const bedCoverage = Math.min(stockCounts['In Wards'], 20);
+            const wardCoverageValueEl = document.querySelector('#ward-coverage .value');
+            wardCoverageValueEl.textContent = `${bedCoverage} / 20`;
+            wardCoverageValueEl.classList.remove('kpi-good', 'kpi-caution');
+            if (bedCoverage >= 20) {
+                wardCoverageValueEl.classList.add('kpi-good');
+            }
+            // Future: Implement pill display logic here when scaling up (e.g., only show if stock < threshold)
+
+            const TARGET_BEDS = 20;
+            const TARGET_PAR_RATIO = 10;
+            const targetParInventory = TARGET_BEDS * TARGET_PAR_RATIO;
+            const recentDecomm30d = r.recentDecomm30d;
+            suggestedOrderQty = Math.max(0, targetParInventory - circulatingNow) + recentDecomm30d;
+
+            document.querySelector('#monthly-replenishment .value').textContent = `${suggestedOrderQty} items`;
+
+            document.getElementById('total-linen').setAttribute(
+                'data-tooltip',
+                `Active towels currently in circulation across all stages.\nNow in circulation: ${circulatingNow}`
+            );
+            document.getElementById('monthly-replenishment').setAttribute(
+                'data-tooltip',
+                `Suggested order quantity for next month.\nTarget par = ${TARGET_BEDS} beds × ${TARGET_PAR_RATIO} = ${targetParInventory}\nCurrent inventory = ${circulatingNow}\n30-day decommissions = ${recentDecomm30d}\nSuggested order = max(0, ${targetParInventory} - ${circulatingNow}) + ${recentDecomm30d} = ${suggestedOrderQty}`
+            );
+            document.getElementById('ward-coverage').setAttribute(
+                'data-tooltip',
+                `Coverage in wards versus bed target.\nCurrent: ${bedCoverage} / ${TARGET_BEDS}`
+            );
+            ['throughput-24h', 'total-linen', 'monthly-replenishment', 'ward-coverage']
+                .forEach(id => markReady(document.getElementById(id)));
+        }
+
+        // ── Stage handlers: fill the skeleton as worker results arrive ────
+        const stageHandlers = {
+            kpis(r) {
+                dashboardMeta = { snapshot: r.snapshot, wards: r.wards, storageSample: r.storageSample, itemCount: r.itemCount };
+                stockCounts = r.stockCounts;
+                const wardStockCounts = r.wardStockCounts;
+
+                if (wardFilter) {
+                    wardFilter.innerHTML = '<option>All Wards</option>';
+                    r.wards.forEach(ward => {
+                        const opt = document.createElement('option');
+                        opt.value = ward;
+                        opt.textContent = ward;
+                        wardFilter.appendChild(opt);
+                    });
+                }
+
+                const wardNames = Object.keys(wardStockCounts).sort();
+                renderKpiCards(r);
+
+                // ── Chart 2: Stock Levels ─────────────────────────────────
+                // Items with an open IN (last event = IN, no matching OUT) are genuinely
+                // "currently in" that stage at the snapshot date.
+                stockChart = new Chart(document.getElementById('bottlenecks-chart'), {
+                    type: 'doughnut',
+                    data: {
+                        labels: Object.keys(stockCounts),
+                        datasets: [{ data: Object.values(stockCounts), backgroundColor: ['#17a2b8','#ffc107','#0056b3','#dc3545'] }]
+                    },
+                    options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { position: 'right' } } }
+                });
+                markChartReady('bottlenecks-chart');
+
+                // ── Chart 3: Ward Availability vs Minimum Threshold ───────
+                const wardLabels = wardNames;
+                const wardValues = wardLabels.map(ward => wardStockCounts[ward] || 0);
+                const wardThreshold = wardLabels.map(() => LOW_STOCK_THRESHOLD);
+
+                wardChart = new Chart(document.getElementById('linen-status-chart'), {
+                    type: 'bar',
+                    data: {
+                        labels: wardLabels,
+                        datasets: [
+                            {
+                                label: 'Available Towels',
+                                data: wardValues,
+                                backgroundColor: wardValues.map(v => v < LOW_STOCK_THRESHOLD ? '#dc3545' : '#0056b3'),
+                                borderRadius: 4
+                            },
+                            {
+                                label: 'Minimum Threshold',
+                                data: wardThreshold,
+                                type: 'line',
+                                borderColor: '#ffc107',
+                                backgroundColor: '#ffc107',
+                                borderWidth: 2,
+                                pointRadius: 0,
+                                tension: 0
+                            }
+                        ]
                     },
-                    {
-                        label: 'Minimum Threshold',
-                        data: wardThreshold,
-                        type: 'line',
-                        borderColor: '#ffc107',
-                        backgroundColor: '#ffc107',
-                        borderWidth: 2,
-                        pointRadius: 0,
-                        tension: 0
+                    options: {
+                        responsive: true,
+                        maintainAspectRatio: false,
+                        scales: {
+                            y: {
+                                beginAtZero: true,
+                                title: { display: true, text: 'Towels' },
+                                ticks: { stepSize: 1 }
+                            }
+                        },
+                        plugins: {
+                            legend: { position: 'bottom' },
+                            tooltip: {
+                                callbacks: {
+                                    afterBody: (context) => {
+                                        const i = context[0].dataIndex;
+                                        // Read from the chart: the replay slider swaps the values
+                                        const wardValue = context[0].chart.data.datasets[0].data[i] || 0;
+                                        const diff = LOW_STOCK_THRESHOLD - wardValue;
+                                        return diff > 0
+                                            ? `Alert: ${diff} below threshold`
+                                            : `Status: ${Math.abs(diff)} above threshold`;
+                                    }
+                                }
+                            }
+                        }
                     }
-                ]
+                });
+                markChartReady('linen-status-chart');
             },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                scales: {
-                    y: {
-                        beginAtZero: true,
-                        title: { display: true, text: 'Towels' },
-                        ticks: { stepSize: 1 }
+
+            distributions(r) {
+                // ── Chart 5: Life Cycle Analysis ──────────────────────────
+                // Red bar is a risk backlog indicator:
+                // items at >=100 cycles that are NOT yet decommissioned.
+                const lc = r.lifecycle;
+
+                lifecycleChart = new Chart(document.getElementById('lost-by-step-chart'), {
+                    type: 'bar',
+                    data: {
+                        labels: Object.keys(lc),
+                        datasets: [{ label: 'Items', data: Object.values(lc), backgroundColor: ['#0056b3','#28a745','#ffc107','#dc3545'] }]
+                    },
+                    options: { responsive: true, maintainAspectRatio: false, plugins: { legend: { display: false } } }
+                });
+                markChartReady('lost-by-step-chart');
+
+                dwellHistograms = r.dwellHistograms;
+                const initResult = buildHistogram(dwellStage);
+                renderDwellPercentiles(initResult.stats);
+                chart4a = new Chart(document.getElementById('rfid-barcode-chart'), {
+                    type: 'bar',
+                    data: {
+                        labels: Object.keys(initResult.buckets),
+                        datasets: [{ label: 'Items — Storage', data: Object.values(initResult.buckets), backgroundColor: '#0056b3', borderRadius: 3 }]
+                    },
+                    options: {
+                        responsive: true, maintainAspectRatio: false,
+                        scales: {
+                            x: { title: { display: true, text: initResult.xLabel } },
+                            y: { beginAtZero: true, title: { display: true, text: 'Number of Items' }, ticks: { stepSize: 1 } }
+                        },
+                        plugins: { legend: { display: false } }
                     }
-                },
-                plugins: {
-                    legend: { position: 'bottom' },
-                    tooltip: {
-                        callbacks: {
-                            afterBody: (context) => {
-                                const i = context[0].dataIndex;
-                                const wardValue = wardValues[i] || 0;
-                                const diff = LOW_STOCK_THRESHOLD - wardValue;
-                                return diff > 0
-                                    ? `Alert: ${diff} below threshold`
-                                    : `Status: ${Math.abs(diff)} above threshold`;
-                            }
+                });
+                markChartReady('rfid-barcode-chart');
+            },
+
+            usage(r) {
+                usageSeries = r;
+                const selectedWard = (wardFilter && wardFilter.value) || 'All Wards';
+                const initialUsage = getUsageSeries(selectedWard);
+                usageChart = new Chart(document.getElementById('cycles-lifespan-chart'), {
+                    type: 'bar',
+                    data: {
+                        labels: initialUsage.labels,
+                        datasets: [{ label: `Linen IN Events (${selectedWard})`, data: initialUsage.values, backgroundColor: '#0056b3' }]
+                    },
+                    options: { responsive: true, maintainAspectRatio: false }
+                });
+                markChartReady('cycles-lifespan-chart');
+            },
+
+            forecast(r) {
+                // ── Chart 6: Forecasting ──────────────────────────────────
+                forecastSeries = r;
+
+                document.getElementById('fc-avg-daily').textContent    = r.avgDaily.toFixed(1);
+                document.getElementById('fc-near-retire').textContent  = r.retirement.within;
+                document.getElementById('fc-days-retire').textContent  =
+                    r.retirement.nextWaveDays === null ? '-' : r.retirement.nextWaveDays + ' days';
+                document.getElementById('fc-replenish').textContent    = suggestedOrderQty + ' items/month';
+                renderRetirementCalendar(r.retirement, r.weekDates);
+
+                const fcCtx = document.getElementById('forecast-chart');
+                forecastChart = new Chart(fcCtx, {
+                    type: 'line',
+                    data: {
+                        labels: [...r.histDates, ...r.fcDates],
+                        datasets: forecastDatasets((wardFilter && wardFilter.value) || 'All Wards')
+                    },
+                    options: {
+                        responsive: true, maintainAspectRatio: false,
+                        scales: { x: { ticks: { maxTicksLimit: 10 } } },
+                        plugins: {
+                            legend: { position: 'bottom', labels: { filter: item => !item.text.endsWith('Lower') } }
                         }
                     }
-                }
+                });
+                markChartReady('forecast-chart');
+            },
+
+            activity(r) {
+                // ── Recent Towel Activity Table ───────────────────────────
+                const activityBody = document.getElementById('recent-activity-body');
+                if (!activityBody) return;
+                activityBody.innerHTML = '';
+                r.rows.forEach(row => {
+                    const tr = document.createElement('tr');
+                    tr.innerHTML = `
+                        <td>${escapeHtml(row.timestamp)}</td>
+                        <td>${escapeHtml(row.shortEpc)}</td>
+                        <td>${escapeHtml(row.description)}</td>
+                        <td>${escapeHtml(row.cycles)}</td>
+                        <td>${escapeHtml(row.location)}</td>
+                        <td>${escapeHtml(row.status)}</td>
+                        <td><button class="action-btn drilldown">Drill Down</button></td>
+                    `;
+                    const drillBtn = tr.querySelector('.drilldown');
+                    if (drillBtn) drillBtn.addEventListener('click', () => openDrilldown(row.epc));
+                    activityBody.appendChild(tr);
+                });
+            },
+
+            alerts(r) {
+                setAlertIndex(r.alerts);
+            },
+
+            error(msg) {
+                showToast(msg.message);
+            },
+
+            done() {
+                // Every chart the slider and the live feed drive exists now
+                initReplay();
+                startLiveFeed();
             }
-        });
+        };
 
-        // ── Chart 6: Forecasting ──────────────────────────────────────────
-        // Calculate daily usage from the full history, then project 60 days forward
-        const allDates = Object.keys(processed.usageByDate)
-            .filter(d => d < completeCutoffDate)
-            .sort();
-        const FORECAST_DAYS = 60;
-
-        // 7-day rolling average for smoothing
-        function rollingAvg(arr, window) {
-            return arr.map((_, i) => {
-                const slice = arr.slice(Math.max(0, i - window + 1), i + 1);
-                return slice.reduce((a, b) => a + b, 0) / slice.length;
-            });
+        // ── Replay: time slider over counter checkpoints ──────────────────
+        // The replay block (--replay) holds every counter at each checkpoint
+        // and the towel moves between them.  It is decoded on first use; an
+        // instant is its nearest earlier checkpoint plus the moves since, so a
+        // slider step touches a few hours of moves, never the whole history.
+        // Slider handlers wait on loadReplay(); the rest reads `replay`.
+        const replayBar     = document.getElementById('replay-bar');
+        const replaySlider  = document.getElementById('replay-slider');
+        const replayTime    = document.getElementById('replay-time');
+        const replayLiveBtn = document.getElementById('replay-live-btn');
+        const replayBlock   = document.getElementById('replay-data');
+        let replay = null, replayLoading = null;
+
+        function loadReplay() {
+            if (replayLoading) return replayLoading;
+            const { decodeTable, lowerBound, upperBound } = workerHelpers();
+            return (replayLoading = readDataBlock(replayBlock).then(raw => {
+                const columns = [...raw.keys.stock, ...raw.keys.wards, ...raw.keys.lifecycle];
+                const moves = decodeTable(raw.moves);
+                // Move codes -> counter slots (-1: the towel left / entered no counter)
+                const slots = values => Int32Array.from(values, v => columns.indexOf(v));
+                return (replay = {
+                    keys: raw.keys, columns, checkpoints: decodeTable(raw.checkpoints), moves,
+                    fromSlot: slots(moves.from.values), toSlot: slots(moves.to.values),
+                    lowerBound, upperBound
+                });
+            }));
         }
 
-        const histCounts  = allDates.map(d => processed.usageByDate[d]);
-        const smoothed    = rollingAvg(histCounts, 7);
-        const avgDaily    = smoothed.length ? smoothed[smoothed.length - 1] : 1;
-
-        // Build forecasted dates & values
-        const lastDate   = allDates.length ? new Date(allDates[allDates.length - 1]) : new Date();
-        const fcDates    = [], fcValues = [];
-        for (let i = 1; i <= FORECAST_DAYS; i++) {
-            const d = new Date(lastDate); d.setDate(d.getDate() + i);
-            fcDates.push(d.toISOString().split('T')[0]);
-            // Add slight upward trend + noise
-            fcValues.push(+(avgDaily * (1 + i * 0.001) + (Math.random() - 0.5) * 0.5).toFixed(1));
-        }
-
-        // Calculate projected retirement dates
-        const nearRetire = items.filter(i => i.cycles >= 70).length;
-        const approxCyclesPerItem = avgDaily / items.length;   // cycles added per item per day
-        const daysToRetire = approxCyclesPerItem > 0 ? Math.round(30 / approxCyclesPerItem) : 90;
-
-        document.getElementById('fc-avg-daily').textContent    = avgDaily.toFixed(1);
-        document.getElementById('fc-near-retire').textContent  = nearRetire;
-        document.getElementById('fc-days-retire').textContent  = daysToRetire + ' days';
-        document.getElementById('fc-replenish').textContent    = suggestedOrderQty + ' items/month';
-
-        const fcCtx = document.getElementById('forecast-chart');
-        new Chart(fcCtx, {
-            type: 'line',
-            data: {
-                labels: [...allDates.slice(-60), ...fcDates],
-                datasets: [
-                    {
-                        label: 'Historical Usage',
-                        data: [...histCounts.slice(-60), ...Array(FORECAST_DAYS).fill(null)],
-                        borderColor: '#0056b3', backgroundColor: 'rgba(0,86,179,0.1)',
-                        fill: true, tension: 0.3, pointRadius: 1
-                    },
-                    {
-                        label: 'Forecasted Usage (60d)',
-                        data: [...Array(Math.min(histCounts.length, 60)).fill(null), ...fcValues],
-                        borderColor: '#dc3545', borderDash: [6, 3],
-                        backgroundColor: 'rgba(220,53,69,0.08)',
-                        fill: true, tension: 0.3, pointRadius: 1
-                    }
-                ]
-            },
-            options: {
-                responsive: true, maintainAspectRatio: false,
-                scales: { x: { ticks: { maxTicksLimit: 10 } } },
-                plugins: { legend: { position: 'bottom' } }
+        function replayCountsAt(sec) {
+            const { columns, checkpoints, moves, fromSlot, toSlot, lowerBound, upperBound } = replay;
+            const k = Math.max(0, upperBound(checkpoints.t, sec) - 1);
+            const counts = Int32Array.from(columns, key => checkpoints[key][k]);
+            const to = upperBound(moves.t, sec);
+            for (let i = lowerBound(moves.t, checkpoints.t[k]); i < to; i++) {
+                const a = fromSlot[moves.from.codes[i]], b = toSlot[moves.to.codes[i]];
+                if (a >= 0) counts[a]--;
+                if (b >= 0) counts[b]++;
             }
-        });
+            return counts;
+        }
+
+        function showReplayAt(sec, live) {
+            const { keys, columns } = replay;
+            const counts = replayCountsAt(sec);
+            const value = key => counts[columns.indexOf(key)] || 0;
+            const stockNow = Object.fromEntries(keys.stock.map(key => [key, value(key)]));
+            stockNow['In Wards'] = keys.wards.reduce((sum, ward) => sum + value(ward), 0);
+            if (stockChart) {
+                stockChart.data.datasets[0].data = stockChart.data.labels.map(key => stockNow[key] || 0);
+                stockChart.update();
+            }
+            if (wardChart) {
+                const wardValues = wardChart.data.labels.map(value);
+                wardChart.data.datasets[0].data = wardValues;
+                wardChart.data.datasets[0].backgroundColor = wardValues.map(v => v < LOW_STOCK_THRESHOLD ? '#dc3545' : '#0056b3');
+                wardChart.update();
+            }
+            if (lifecycleChart) {
+                lifecycleChart.data.datasets[0].data = lifecycleChart.data.labels.map(value);
+                lifecycleChart.update();
+            }
+            replayTime.textContent = new Date(sec * 1000).toISOString().slice(0, 16).replace('T', ' ') + ' UTC'
+                + (live ? ' · Live' : '');
+            replayLiveBtn.classList.toggle('active', !!live);
+        }
 
-        // ── Recent Towel Activity Table ────────────────────────────────────
-        const activityBody = document.getElementById('recent-activity-body');
-        if (activityBody) {
-            activityBody.innerHTML = '';
-            const itemByEpc = Object.fromEntries(items.map(item => [item.epc, item]));
-
-            const recentEvents = [...rawData]
-                .filter(ev => ev && ev['Event Timestamp'] && ev['EPC'] && ev['Process'] !== 'INIT')
-                .sort((a, b) => new Date(b['Event Timestamp']) - new Date(a['Event Timestamp']))
-                .slice(0, 15);
-
-            recentEvents.forEach(ev => {
-                const tr = document.createElement('tr');
-                const shortEpc = String(ev['EPC']).split('.').pop();
-                const processLabel = ev['Process'] || '-';
-                const cycleCount = itemByEpc[ev['EPC']] ? itemByEpc[ev['EPC']].cycles : 0;
-                const statusLabel =
-                    processLabel === 'DECOMMISSION' ? 'Retired' :
-                    processLabel === 'OUT' ? 'Checked Out' :
-                    processLabel === 'IN' ? 'Checked In' :
-                    'Active';
-                const timestamp = String(ev['Event Timestamp']).replace('T', ' ').replace('Z', '');
-
-                tr.innerHTML = `
-                    <td>${timestamp}</td>
-                    <td>${shortEpc}</td>
-                    <td>${ev['Item Description'] || '-'}</td>
-                    <td>${cycleCount}</td>
-                    <td>${ev['Location'] || '-'}</td>
-                    <td>${statusLabel}</td>
-                    <td><button class="action-btn drilldown">Drill Down</button></td>
-                `;
-                activityBody.appendChild(tr);
+        function initReplay() {
+            if (!replayBlock || !replayBar) return;
+            // Slider positions are whole hours from the first checkpoint; the last one is the snapshot
+            const start = Number(replayBlock.dataset.start), end = Number(replayBlock.dataset.end);
+            const lastHour = Math.ceil((end - start) / 3600);
+            const secondsAt = hour => Math.min(end, start + hour * 3600);
+            replaySlider.min = 0;
+            replaySlider.max = lastHour;
+            replaySlider.step = 1;
+            replaySlider.value = lastHour;
+            replaySlider.addEventListener('input', () => {
+                const hour = Number(replaySlider.value);
+                loadReplay().then(() => showReplayAt(secondsAt(hour), hour === lastHour));
             });
+            replayLiveBtn.addEventListener('click', () => {
+                replaySlider.value = lastHour;
+                loadReplay().then(() => showReplayAt(end, true));
+            });
+            replayTime.textContent = new Date(end * 1000).toISOString().slice(0, 16).replace('T', ' ') + ' UTC · Live';
+            replayBar.hidden = false;
         }
 
-</script>"""
+        // ── Live feed (pages served by live_server.py) ────────────────────
+        // Each Server-Sent "kpis" message carries only the fields a batch of
+        // scans changed (every field on connect); it is merged into the last
+        // state and the cards and count charts are updated in place.
+        const liveBlock = document.getElementById('live-feed');
+        let liveKpis = {};
+
+        function applyLiveKpis(delta) {
+            const r = liveKpis = { ...liveKpis, ...delta };
+            dashboardMeta = { ...dashboardMeta, snapshot: r.snapshot, wards: r.wards, itemCount: r.itemCount };
+            stockCounts = r.stockCounts;
+            renderKpiCards(r);
+            if (stockChart) {
+                stockChart.data.datasets[0].data = stockChart.data.labels.map(key => stockCounts[key] || 0);
+                stockChart.update();
+            }
+            if (wardChart) {
+                const wardNames = Object.keys(r.wardStockCounts).sort();
+                const wardValues = wardNames.map(ward => r.wardStockCounts[ward] || 0);
+                wardChart.data.labels = wardNames;
+                wardChart.data.datasets[0].data = wardValues;
+                wardChart.data.datasets[0].backgroundColor = wardValues.map(v => v < LOW_STOCK_THRESHOLD ? '#dc3545' : '#0056b3');
+                wardChart.data.datasets[1].data = wardNames.map(() => LOW_STOCK_THRESHOLD);
+                wardChart.update();
+            }
+            if (lifecycleChart) {
+                lifecycleChart.data.datasets[0].data = lifecycleChart.data.labels.map(label => r.lifecycle[label] || 0);
+                lifecycleChart.update();
+            }
+        }
+
+        function startLiveFeed() {
+            if (!liveBlock || typeof EventSource !== 'function') return;
+            const source = new EventSource(JSON.parse(liveBlock.textContent).url);
+            source.addEventListener('kpis', e => applyLiveKpis(JSON.parse(e.data)));
+        }
 
-# ── 3. Inject script into template placeholder ─────────────────────────────────
-new_html = html.replace('<!--__DASHBOARD_SCRIPT__-->', NEW_SCRIPT)
+        // ── Data worker ───────────────────────────────────────────────────
+        // The payload is handed to the worker as text, so JSON.parse and the
+        // decode passes also run off the main thread.  Without Worker support
+        // (or if the Blob worker fails to start) the same pipeline runs inline
+        // after the skeleton has painted.  A compressed payload (--compress) is
+        // inflated by the worker too.
+        const dashboardBlock = document.getElementById('dashboard-data');
+        const dashboardPayload = { text: dashboardBlock.textContent, encoding: dashboardBlock.dataset.encoding || '' };
+        let stagesReceived = 0;
+
+        function handleStage(msg) {
+            stagesReceived++;
+            const handler = stageHandlers[msg.stage];
+            if (handler) handler(msg);
+        }
 
-# ── 4. Inject actual JSON data into the placeholder ───────────────────────────
-new_html = new_html.replace('const rawData = __RAWDATA__;', f'const rawData = {raw_json};', 1)
+        function runPipelineInline() {
+            setTimeout(() => {
+                workerHelpers().runPayload(dashboardPayload, handleStage);
+            }, 0);
+        }
 
-with open("Towel Tracking Dashboard demo v4.html", "w", encoding="utf-8") as f:
-    f.write(new_html)
+        function startDashboardWorker() {
+            if (typeof Worker !== 'function' || typeof Blob !== 'function' || !window.URL || !URL.createObjectURL) {
+                runPipelineInline();
+                return;
+            }
+            let workerUrl = null, worker = null;
+            try {
+                workerUrl = URL.createObjectURL(new Blob([
+                    workerSource,
+                    '\nself.onmessage = e => runPayload(e.data, msg => self.postMessage(msg));\n'
+                ], { type: 'text/javascript' }));
+                worker = new Worker(workerUrl);
+            } catch (err) {
+                if (workerUrl) URL.revokeObjectURL(workerUrl);
+                runPipelineInline();
+                return;
+            }
+            worker.onmessage = e => {
+                handleStage(e.data);
+                if (e.data.stage === 'done' || e.data.stage === 'error') {
+                    worker.terminate();
+                    URL.revokeObjectURL(workerUrl);
+                }
+            };
+            worker.onerror = e => {
+                worker.terminate();
+                URL.revokeObjectURL(workerUrl);
+                // Only fall back if nothing has rendered yet, to avoid duplicate charts
+                if (!stagesReceived) {
+                    if (e.preventDefault) e.preventDefault();
+                    runPipelineInline();
+                }
+            };
+            worker.postMessage(dashboardPayload);
+        }
+
+        startDashboardWorker();
+
+</script>"""
 
-print("Done. v4 rebuilt.")
+# ── 1. Aggregate events once, at build time ───────────────────────────────────
+def load_checkpoint(checkpoint_path, events_path, replay_interval=None):
+    """Saved fold state for `events_path`, or None if missing, stale or
+    folded with a different replay interval."""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        ckpt = json.load(f)
+    if ckpt.get("version") != CHECKPOINT_VERSION or ckpt.get("events") != os.path.abspath(events_path):
+        return None
+    if (ckpt["state"]["replay"] or {}).get("interval") != replay_interval:
+        return None
+    if is_ndjson(events_path):
+        # Log truncated, rotated or regenerated since: the offset is meaningless.
+        if (os.path.getsize(events_path) < ckpt["offset"]
+                or log_head_digest(events_path) != ckpt["head"]):
+            return None
+    return ckpt
+
+
+def save_checkpoint(checkpoint_path, events_path, aggregator, offset, watermark_guids, history=None):
+    ckpt = {
+        "version":         CHECKPOINT_VERSION,
+        "events":          os.path.abspath(events_path),
+        "head":            log_head_digest(events_path),
+        "offset":          offset,
+        "watermark_guids": watermark_guids,
+        "history":         history and history.state(),
+        "state":           aggregator.state(),
+    }
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(ckpt, f, separators=(',', ':'), ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def aggregate_events(events_path, checkpoint_path=None, replay_interval=None):
+    """
+    Returns (aggregator, events_folded_this_run, history), where `history` is
+    the EpcHistoryIndex Drill Down reads traces through.  For NDJSON its
+    offsets are recorded during the fold (and checkpointed), so building the
+    page never re-parses the log.
+    """
+    ckpt = load_checkpoint(checkpoint_path, events_path, replay_interval)
+    if ckpt:
+        aggregator = DashboardAggregator.from_state(ckpt["state"])
+    else:
+        aggregator = DashboardAggregator(ReplayLog(replay_interval) if replay_interval else None)
+    folded_before = aggregator.event_count
+    offset, watermark_guids, recorded = 0, [], None
+
+    if is_ndjson(events_path):
+        # Append-only log in chronological order: stream it, resuming at the
+        # byte offset where the last checkpoint stopped.
+        offset = ckpt["offset"] if ckpt else 0
+        history = recorded = EpcHistoryIndex.recording(events_path, ckpt and ckpt["history"])
+        for ev, end in iter_ndjson_from(events_path, offset):
+            aggregator.add(ev)
+            history.add(ev["EPC"], offset)
+            offset = end
+    elif is_scanner_export(events_path):
+        # Reader export: normalized and merge-sorted as it streams, so the
+        # watermark filter runs on the fly instead of over a loaded list.
+        watermark = aggregator.latest if ckpt else float("-inf")
+        seen = set(ckpt["watermark_guids"]) if ckpt else set()
+        for ev in iter_scanner_events(events_path):
+            t = parse_timestamp(ev["Event Timestamp"])
+            if t > watermark or (t == watermark and ev["Event GUID"] not in seen):
+                aggregator.add(ev)
+            if t > watermark:
+                watermark, seen = t, set()
+            if t == watermark:
+                seen.add(ev["Event GUID"])
+        watermark_guids = sorted(seen)
+        history = EpcHistoryIndex(events_path, load=iter_scanner_events)
+    else:
+        # A JSON array cannot be resumed by offset: skip everything up to the
+        # checkpoint watermark (GUIDs disambiguate events sharing its timestamp).
+        watermark = aggregator.latest if ckpt else float("-inf")
+        seen = set(ckpt["watermark_guids"]) if ckpt else set()
+        timed = [(parse_timestamp(ev["Event Timestamp"]), ev) for ev in iter_events(events_path)]
+        fresh = [(t, ev) for t, ev in timed
+                 if t > watermark or (t == watermark and ev["Event GUID"] not in seen)]
+        fresh.sort(key=lambda pair: pair[0])
+        for _, ev in fresh:
+            aggregator.add(ev)
+        watermark_guids = [ev["Event GUID"] for t, ev in timed if t == aggregator.latest]
+        history = EpcHistoryIndex(events_path)
+
+    if checkpoint_path:
+        save_checkpoint(checkpoint_path, events_path, aggregator, offset, watermark_guids, recorded)
+    return aggregator, aggregator.event_count - folded_before, history
+
+
+def script_json(data):
+    """JSON for an inert <script> block; "</" is escaped so no string value
+    can close the element early."""
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).replace('</', '<\\/')
+
+
+def replay_block(aggregator, snapshot):
+    """Replay payload plus the slider range [first checkpoint, max(last scan, snapshot)]."""
+    replay = aggregator.replay.result(sorted(aggregator.wards))
+    start = replay["checkpoints"]["columns"]["t"]["base"]
+    end = int(max(aggregator.latest, parse_timestamp(snapshot)))
+    return replay, start, end
+
+
+def data_block(block_id, data, compress=False, attrs=''):
+    """
+    Inert <script> block holding `data`: JSON text, or with `compress` the
+    gzipped JSON as base64 (data-encoding="gzip"), which the page inflates
+    with DecompressionStream when the block is first needed.
+    """
+    if not compress:
+        return f'<script type="application/json" id="{block_id}"{attrs}>{script_json(data)}</script>\n'
+    raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    packed = base64.b64encode(gzip.compress(raw, compresslevel=9, mtime=0)).decode('ascii')
+    return (f'<script type="application/octet-stream" id="{block_id}" data-encoding="gzip"{attrs}>'
+            f'{packed}</script>\n')
+
+
+def render(dashboard, html, drilldown=None, replay=None, live=None, compress=False):
+    # ── 3. Embed the pre-aggregated payload and drill-down block as inert JSON ─
+    # The page hands the payload text to the worker unparsed; the drill-down
+    # and replay blocks are only parsed when first used.  With `compress` each
+    # block is gzip + base64 and is also inflated only when first used.
+    worker_js = WORKER_SCRIPT.replace('__DECODER_JS__', DECODER_JS.strip('\n'))
+
+    # ── 4. Inject data, worker source and page script into the placeholder ────
+    replay_html = ''
+    if replay:
+        payload, start, end = replay
+        replay_html = data_block('replay-data', payload, compress, f' data-start="{start}" data-end="{end}"')
+    if live:
+        # Served by live_server.py: the page subscribes to its event stream
+        replay_html += f'<script type="application/json" id="live-feed">{script_json({"url": live})}</script>\n'
+    blocks = (
+        data_block('dashboard-data', dashboard, compress)
+        + data_block('drilldown-data', drilldown, compress)
+        + replay_html +
+        f'<script type="text/js-worker" id="dashboard-worker">{worker_js}</script>\n'
+        + NEW_SCRIPT
+    )
+    return html.replace('<!--__DASHBOARD_SCRIPT__-->', blocks)
+
+
+# ── 5. Library entry points ───────────────────────────────────────────────────
+# Importing this module has no side effects, so a long-running process can
+# keep it loaded and build many dashboards:
+#
+#     sim = generate_epcis_data.Simulation(items=500, days=30, seed=7)
+#     build_dashboard(sim.run(), "ward.html", snapshot=sim.snapshot)
+def write_dashboard(aggregator, history, out, snapshot=SNAPSHOT_TIME, drilldown="activity",
+                    histograms=STAGE_HISTOGRAMS, compress=False):
+    """Renders a fold into the page at `out`; Drill Down traces are read through `history`."""
+    dashboard = aggregator.result(snapshot, histograms)
+    block = None
+    if drilldown != "none":
+        epcs = aggregator.activity_epcs() if drilldown == "activity" else sorted(history.epcs())
+        block = drilldown_block(history, epcs)
+    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        html = f.read()
+    replay = replay_block(aggregator, snapshot) if aggregator.replay else None
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(render(dashboard, html, block, replay, compress=compress))
+
+
+def build_dashboard(events, out=OUTPUT_PATH, snapshot=None, drilldown="activity",
+                    histograms=STAGE_HISTOGRAMS, replay_interval=None, checkpoint=None, compress=False):
+    """
+    Folds `events` and writes one dashboard page to `out`.  Returns
+    (aggregator, events folded by this build).
+
+    `events` is an event file (anything --events accepts) or an iterable of
+    event dicts in chronological order, such as Simulation.run() from
+    generate_epcis_data.py.  `checkpoint` applies to files only.  `snapshot`
+    defaults as for --events: the last scan of a reader export, otherwise
+    SNAPSHOT_TIME.  `compress` embeds the data blocks gzipped (--compress).
+    """
+    if isinstance(events, (str, os.PathLike)):
+        aggregator, folded, history = aggregate_events(events, checkpoint, replay_interval)
+        if snapshot is None:
+            exported = is_scanner_export(events) and aggregator.latest
+            snapshot = format_timestamp(aggregator.latest) if exported else SNAPSHOT_TIME
+        write_dashboard(aggregator, history, out, snapshot, drilldown, histograms, compress)
+        return aggregator, folded
+
+    if checkpoint:
+        raise ValueError("checkpoint applies to event files, not event iterables")
+    aggregator = DashboardAggregator(ReplayLog(replay_interval) if replay_interval else None)
+    with tempfile.TemporaryDirectory(prefix="dashboard-") as spool_dir:
+        # Spooled as NDJSON (offsets indexed as written) so Drill Down can
+        # read traces back once the activity EPCs are known
+        spool_path = os.path.join(spool_dir, "events.ndjson")
+        history, offset = EpcHistoryIndex.recording(spool_path), 0
+        with open(spool_path, "w", encoding="utf-8", newline="\n") as spool:
+            for ev in events:
+                aggregator.add(ev)
+                if drilldown != "none":
+                    line = event_line(ev) + "\n"       # ASCII: characters == bytes
+                    spool.write(line)
+                    history.add(ev["EPC"], offset)
+                    offset += len(line)
+        write_dashboard(aggregator, history, out, snapshot or SNAPSHOT_TIME,
+                        drilldown, histograms, compress)
+    return aggregator, aggregator.event_count
+
+
+# ── 6. Multi-site builds (--sites) ────────────────────────────────────────────
+def site_page_path(out_dir, name):
+    return os.path.join(out_dir, f"Towel Tracking Dashboard v4 - {name}.html")
+
+
+def retitle(html, heading):
+    """Template with `heading` in place of the group name in <title> and <h1>."""
+    heading = escape(heading)
+    return (html.replace("<title>RFS - ", f"<title>{heading} - ", 1)
+                .replace("<h1>Ramathibodi Facilities Services<br>", f"<h1>{heading}<br>", 1))
+
+
+def partition_by_site(events_path, site_ids, shard_dir):
+    """
+    One pass over the source, appending each event to its site's NDJSON shard
+    (source order is kept, so every shard stays chronological).
+    Returns ({site_id: shard_path}, number of events without a configured site).
+    """
+    paths = {site_id: os.path.join(shard_dir, f"{site_id}.ndjson") for site_id in site_ids}
+    shards = {site_id: open(path, "w", encoding="utf-8", newline="\n") for site_id, path in paths.items()}
+    unassigned = 0
+    try:
+        for ev in iter_source_events(events_path):
+            shard = shards.get(ev.get(SITE_FIELD))
+            if shard is None:
+                unassigned += 1
+            else:
+                shard.write(event_line(ev) + "\n")
+    finally:
+        for shard in shards.values():
+            shard.close()
+    return paths, unassigned
+
+
+def build_site(task):
+    """
+    Pool task: folds one site's shard and writes its page.  Returns the fold
+    state and the traces embedded for Drill Down, which the roll-up reuses.
+    """
+    site, shard_path, out_path, html, snapshot, drilldown_mode, histograms, replay_interval, compress = task
+    aggregator, _, history = aggregate_events(shard_path, replay_interval=replay_interval)
+    drilldown, traces = None, {}
+    if drilldown_mode != "none":
+        epcs = aggregator.activity_epcs() if drilldown_mode == "activity" else sorted(history.epcs())
+        traces = history.traces(epcs)
+        drilldown = drilldown_block(TraceCache(traces), epcs)
+    with open(out_path, "w", encoding="utf-8") as f:
+        replay = replay_block(aggregator, snapshot) if replay_interval else None
+        f.write(render(aggregator.result(snapshot, histograms), retitle(html, site["name"]), drilldown, replay,
+                       compress=compress))
+    return site["id"], aggregator.state(), traces
+
+
+def site_event(ev, site_id):
+    """Trace event with its ward locations qualified for the roll-up."""
+    ev = dict(ev, Location=site_ward(ev["Location"], site_id))
+    if ev.get("Home Ward"):
+        ev["Home Ward"] = site_ward(ev["Home Ward"], site_id)
+    return ev
+
+
+def build_sites(events_path, cfg, out_dir, html, snapshot, drilldown_mode, workers=1,
+                histograms=STAGE_HISTOGRAMS, replay_interval=None, compress=False):
+    """Per-site pages plus the group roll-up; returns a summary line."""
+    sites = cfg["sites"]
+    os.makedirs(out_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="sites-") as shard_dir:
+        shards, unassigned = partition_by_site(events_path, [site["id"] for site in sites], shard_dir)
+        tasks = [(site, shards[site["id"]], site_page_path(out_dir, site["id"]), html, snapshot,
+                  drilldown_mode, histograms, replay_interval, compress)
+                 for site in sites]
+        if workers <= 1:
+            results = list(map(build_site, tasks))
+        else:
+            with Pool(min(workers, len(tasks))) as pool:
+                results = list(pool.imap_unordered(build_site, tasks))
+
+    # Roll-up in config order, from the per-site states (no event is re-folded)
+    by_site = {site_id: (state, traces) for site_id, state, traces in results}
+    parts = [(site["id"], DashboardAggregator.from_state(by_site[site["id"]][0])) for site in sites]
+    group = DashboardAggregator.merge(parts)
+    drilldown = None
+    if drilldown_mode != "none":
+        traces = {epc: [site_event(ev, site_id) for ev in events]
+                  for site_id, (_, site_traces) in by_site.items()
+                  for epc, events in site_traces.items()}
+        epcs = group.activity_epcs() if drilldown_mode == "activity" else sorted(traces)
+        drilldown = drilldown_block(TraceCache(traces), epcs)
+    replay = replay_block(group, snapshot) if group.replay else None
+    with open(site_page_path(out_dir, "group"), "w", encoding="utf-8") as f:
+        f.write(render(group.result(snapshot, histograms), retitle(html, cfg["group"]), drilldown, replay,
+                       compress=compress))
+
+    return (f"{len(sites)} site pages + group roll-up in {out_dir}, "
+            f"{group.event_count:,} events, {unassigned:,} without a configured site")
+
+
+def store_snapshot(aggregator):
+    """
+    Default --store snapshot: SNAPSHOT_TIME when the last scan falls in the
+    day before it (a run over the generator's default window), otherwise the
+    last scan, since the store may hold exports or runs over other windows.
+    """
+    end = parse_timestamp(SNAPSHOT_TIME)
+    if not aggregator.latest or end - FLOW_WINDOW_S <= aggregator.latest <= end:
+        return SNAPSHOT_TIME
+    return format_timestamp(aggregator.latest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the towel v4 dashboard HTML.")
+    parser.add_argument("--events", default=EVENTS_PATH,
+                        help="EPCIS events: JSON array or .ndjson stream, or a raw reader "
+                             "export (.csv / .js) (default %(default)s)")
+    parser.add_argument("--out", default=OUTPUT_PATH, help="output HTML (default %(default)s)")
+    parser.add_argument("--checkpoint",
+                        help="fold-state file; later builds only fold events newer than it")
+    parser.add_argument("--drilldown", choices=("activity", "all", "none"), default="activity",
+                        help="towels whose full trace is embedded for Drill Down: those in "
+                             "the recent activity table, every towel, or none (default %(default)s)")
+    parser.add_argument("--store",
+                        help="SQLite event store (see event_store.py) to query instead of --events")
+    parser.add_argument("--snapshot",
+                        help="dashboard 'now' (ISO time); default: the simulation end for EPCIS "
+                             "files (with --sites, the config's start + days), the last scan for "
+                             "reader exports and for stores not ending on the default window")
+    parser.add_argument("--dwell-edges",
+                        help="JSON file overriding Chart 4 bucket edges per stage, e.g. "
+                             '{"Laundry": {"unit": "hour", "edges": [1, 2, 4, 8, 24]}}')
+    parser.add_argument("--sites",
+                        help="site config (see site_config.py): one page per site plus a group "
+                             "roll-up, written to --out-dir")
+    parser.add_argument("--out-dir", default=".", help="--sites: output directory (default %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="--sites: processes building site pages in parallel (default 1)")
+    parser.add_argument("--replay", type=float, nargs="?", const=REPLAY_INTERVAL_S / 3600, metavar="HOURS",
+                        help="embed counter checkpoints every HOURS (default %(const)g) plus the "
+                             "moves between them for the page's time slider")
+    parser.add_argument("--compress", action="store_true",
+                        help="embed the data blocks gzipped + base64; the page inflates them with "
+                             "DecompressionStream (Chrome 80+, Firefox 113+, Safari 16.4+)")
+    args = parser.parse_args(argv)
+    if args.store and args.checkpoint:
+        parser.error("--checkpoint applies to event files, not --store")
+    if args.store and args.replay:
+        parser.error("--replay folds event files; it does not apply to --store")
+    if args.replay is not None and args.replay <= 0:
+        parser.error("--replay: HOURS must be positive")
+    replay_interval = round(args.replay * 3600) if args.replay else None
+    if args.sites and (args.store or args.checkpoint):
+        parser.error("--sites builds from --events; --store and --checkpoint do not apply")
+
+    histograms = load_histogram_config(args.dwell_edges) if args.dwell_edges else STAGE_HISTOGRAMS
+
+    if args.sites:
+        with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+            html = f.read()
+        cfg = load_sites(args.sites)
+        # The run the config describes ends at start + days (generator defaults otherwise)
+        snapshot = args.snapshot or Simulation(sites=cfg).snapshot
+        summary = build_sites(args.events, cfg, args.out_dir, html, snapshot, args.drilldown,
+                              args.workers, histograms, replay_interval, args.compress)
+        print(f"Done. v4 rebuilt ({summary}).")
+        return
+
+    if args.store:
+        with EventStore(args.store) as store:
+            aggregator = store.aggregator()
+            write_dashboard(aggregator, store, args.out, args.snapshot or store_snapshot(aggregator),
+                            args.drilldown, histograms, args.compress)
+        summary = f"{aggregator.event_count:,} events queried from {args.store}"
+    else:
+        aggregator, folded = build_dashboard(args.events, args.out, args.snapshot, args.drilldown,
+                                             histograms, replay_interval, args.checkpoint, args.compress)
+        summary = f"{folded:,} new events folded, {aggregator.event_count:,} total"
+
+    print(f"Done. v4 rebuilt ({summary}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+columnar.py
+Column-oriented, dictionary-encoded tables for the data embedded in the
+dashboard HTML.  Instead of an array of objects repeating long keys and
+strings, each column is stored once:
+
+    dict   repeated strings -> {"values": [...distinct], "codes": [int, ...]}
+    delta  ascending integers (epoch seconds) -> {"base": int, "deltas": [...]}
+    epc    EPC URNs -> shared prefix dictionary + integer serials
+    int    plain integers
+
+The page decodes a table into typed arrays with the matching `decodeTable()`
+in the dashboard script (see DECODER_JS).
+"""
+
+
+def _encode_dict(values):
+    index, distinct, codes = {}, [], []
+    for v in values:
+        code = index.get(v)
+        if code is None:
+            code = index[v] = len(distinct)
+            distinct.append(v)
+        codes.append(code)
+    return {"kind": "dict", "values": distinct, "codes": codes}
+
+
+def _encode_delta(values):
+    base = values[0] if values else 0
+    deltas, prev = [], base
+    for v in values:
+        deltas.append(v - prev)
+        prev = v
+    return {"kind": "delta", "base": base, "deltas": deltas}
+
+
+def split_epc(epc):
+    """'urn:epc:id:sgtin:0890103.00000.00211' -> ('urn:...00000.', 5, 211).
+    EPCs without a numeric serial tail are kept whole: (epc, 0, -1)."""
+    prefix, _, tail = epc.rpartition(".")
+    if tail.isdigit() and prefix:
+        return prefix + ".", len(tail), int(tail)
+    return epc, 0, -1
+
+
+def _encode_epc(values):
+    index, prefixes, prefix_codes, serials = {}, [], [], []
+    for epc in values:
+        prefix, width, serial = split_epc(epc)
+        key = (prefix, width)
+        code = index.get(key)
+        if code is None:
+            code = index[key] = len(prefixes)
+            prefixes.append([prefix, width])
+        prefix_codes.append(code)
+        serials.append(serial)
+    return {"kind": "epc", "prefixes": prefixes, "codes": prefix_codes, "serials": serials}
+
+
+ENCODERS = {
+    "dict":  _encode_dict,
+    "delta": _encode_delta,
+    "epc":   _encode_epc,
+    "int":   lambda values: {"kind": "int", "data": list(values)},
+}
+
+
+def encode_table(rows, schema):
+    """
+    rows:   sequence of tuples
+    schema: [(column_name, kind), ...] matching the tuple positions
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    return {
+        "n": len(rows),
+        "columns": {name: ENCODERS[kind](col) for (name, kind), col in zip(schema, columns)},
+    }
+
+
+# Decoder embedded in the dashboard script.  Columns decode straight into
+# typed arrays, once: delta -> Float64Array, int -> Int32Array, dict/epc ->
+# Uint16Array (or Uint32Array) codes plus an `at(i)` accessor for the string.
+DECODER_JS = r"""
+        function codeArray(codes, cardinality) {
+            return cardinality <= 0x10000 ? Uint16Array.from(codes) : Uint32Array.from(codes);
+        }
+
+        function decodeColumn(col, n) {
+            if (col.kind === 'int') return Int32Array.from(col.data);
+            if (col.kind === 'delta') {
+                const out = new Float64Array(n);
+                let acc = col.base;
+                for (let i = 0; i < n; i++) { acc += col.deltas[i]; out[i] = acc; }
+                return out;
+            }
+            if (col.kind === 'dict') {
+                const codes = codeArray(col.codes, col.values.length);
+                return { values: col.values, codes, at: i => col.values[codes[i]] };
+            }
+            if (col.kind === 'epc') {
+                const codes = codeArray(col.codes, col.prefixes.length);
+                const serials = Float64Array.from(col.serials);
+                return {
+                    codes, serials,
+                    at(i) {
+                        const [prefix, width] = col.prefixes[codes[i]];
+                        return serials[i] < 0 ? prefix : prefix + String(serials[i]).padStart(width, '0');
+                    }
+                };
+            }
+            throw new Error('Unknown column kind: ' + col.kind);
+        }
+
+        function decodeTable(table) {
+            const out = { n: table.n };
+            Object.entries(table.columns).forEach(([name, col]) => { out[name] = decodeColumn(col, table.n); });
+            return out;
+        }
+"""
@@ -0,0 +1,836 @@
+"""
+dashboard_aggregates.py
+Folds chronologically ordered EPCIS events into the compact aggregates the v4
+dashboard renders, so the browser never has to replay raw events itself.
+"""
+import json
+from bisect import bisect_left
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+
+from columnar import encode_table
+from forecast import usage_forecast
+
+# ── Dashboard constants (mirrored from the v4 page) ──────────────────────────
+SNAPSHOT_TIME = "2025-05-01T08:00:00Z"   # SIM_END of the generator
+RECENT_ACTIVITY_ROWS = 15
+DEBUG_SAMPLE_SIZE = 25                   # storage EPCs kept for "Debug Dispatch"
+FLOW_WINDOW_S = 24 * 3600                # "Linen Received / Dispatched" window
+RECENT_WINDOW_S = FLOW_WINDOW_S          # events embedded for the page (>= 15 kept)
+DECOMM_WINDOW_S = 30 * 86400             # decommissions feeding the order KPI
+
+NEW_LINEN = "New Linen Department"
+LAUNDRY   = "Laundry Department"
+STORAGE   = "Cleaned Linen Department"
+
+STOCK_KEYS = {
+    NEW_LINEN: "New Linen",
+    LAUNDRY:   "In Laundry",
+    STORAGE:   "Clean Storage",
+}
+
+# Chart 4 dwell histograms: bucket = first edge >= dwell (bisect), overflow
+# goes into the last bucket (same rule the page used with cfg.buckets.find).
+# Edges can be overridden per stage with load_histogram_config().
+STAGE_HISTOGRAMS = {
+    "New Linen": {"unit": "day",  "edges": [1, 2, 3, 4, 5, 6, 7],
+                  "x_label": "Days in New Linen"},
+    "Laundry":   {"unit": "hour", "edges": [2, 4, 6, 8, 10, 12, 18, 24],
+                  "x_label": "Hours in Laundry"},
+    "Storage":   {"unit": "day",  "edges": [1, 2, 3, 4, 5, 6, 7],
+                  "x_label": "Days in Clean Storage"},
+    "Ward":      {"unit": "hour", "edges": [2, 4, 6, 8, 10, 12, 18, 24],
+                  "x_label": "Hours in Ward"},
+}
+UNIT_SECONDS = {"hour": 3600, "day": 86400}
+DWELL_PERCENTILES = (50, 90, 99)
+DWELL_RESOLUTION_S = 60       # completed dwells are counted per whole minute
+
+LIFECYCLE_BUCKETS = [
+    ("New (0-20)", 20),
+    ("Active (21-70)", 70),
+    ("Old (71-99)", 99),
+    ("Overdue (100+)", None),
+]
+
+# Compliance rules.  Streaming ones are raised as the scans are folded; the
+# state ones (open stays, lost, overdue) are judged at the snapshot.
+MISSING_OUT_HOURS = {"New Linen": 48, "Laundry": 24, "Storage": 96, "Ward": 36}   # per stage
+LOST_DAYS         = 10        # no scan at all for longer: lost / ghost towel
+DUPLICATE_READ_S  = 10        # same location + process again within this: duplicate read
+RULE_SKIPPED_LAUNDRY = "Skipped Laundry (Ward→Storage)"
+RULE_SKIPPED_WASH    = "Skipped First Wash (New→Ward)"
+RULE_AFTER_RETIRED   = "Scan After Retirement"
+RULE_DUPLICATE       = "Duplicate Read"
+RULE_LOST            = f"Lost (No Scan {LOST_DAYS}+ Days)"
+RULE_OVERDUE         = "Overdue, Not Retired"
+NO_WARD              = "No Ward"
+
+
+def missing_out_rule(stage):
+    return f"Missing OUT ({stage} > {MISSING_OUT_HOURS[stage]}h)"
+
+# Retirement projection: each active towel's own wash rate (laundry INs per
+# day since its first scan) carried forward to its cycle limit: the INIT
+# event's "Retire At", else RETIRE_CYCLES
+RETIRE_CYCLES        = 100      # default limit (retire_at of the generator's towels)
+RATE_MIN_WASHES      = 3        # less history than this: the fleet rate is used
+RATE_MIN_DAYS        = 14
+RETIREMENT_WEEKS     = 26       # weekly calendar horizon; later ones are summed
+REPLENISH_LEAD_WEEKS = 2        # an order covers the retirements this many weeks out
+NEAR_RETIRE_DAYS     = 30
+
+# Replay (time slider): counter checkpoints every REPLAY_INTERVAL_S on an
+# epoch-aligned grid, plus one move per towel that changes counter between them
+REPLAY_INTERVAL_S = 6 * 3600
+REPLAY_MOVE_SCHEMA = [("t", "delta"), ("from", "dict"), ("to", "dict")]
+
+# Columnar layouts of the event-shaped tables embedded in the page
+RECENT_EVENT_SCHEMA = [
+    ("t", "delta"), ("epc", "epc"), ("location", "dict"), ("process", "dict"),
+    ("staff", "dict"), ("device", "dict"), ("description", "dict"), ("cycles", "int"),
+]
+ALERT_SCHEMA = [
+    ("day", "dict"), ("rule", "dict"), ("ward", "dict"), ("epc", "epc"), ("location", "dict"),
+]
+# Drill Down: events grouped by EPC, and an EPC -> [start, start + length) index
+DRILLDOWN_EVENT_SCHEMA = [
+    ("t", "delta"), ("location", "dict"), ("process", "dict"), ("staff", "dict"),
+]
+DRILLDOWN_INDEX_SCHEMA = [
+    ("epc", "epc"), ("start", "int"), ("length", "int"),
+    ("initial", "int"), ("homeWard", "dict"),
+]
+
+
+def parse_timestamp(ts):
+    """EPCIS 'Event Timestamp' -> epoch seconds (float)."""
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+
+def format_timestamp(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def format_day(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).date().isoformat()
+
+
+def stage_key(location):
+    """Chart 4 stage for a location, or None."""
+    if location == NEW_LINEN: return "New Linen"
+    if location == LAUNDRY:   return "Laundry"
+    if location == STORAGE:   return "Storage"
+    if location.startswith("Ward"): return "Ward"
+    return None
+
+
+def site_ward(location, site_id):
+    """Ward locations qualified with their site for the group roll-up."""
+    return f"{location} ({site_id})" if location.startswith("Ward") else location
+
+
+def bucket_label(unit, edge):
+    return f"Day {edge}" if unit == "day" else f"{edge}h"
+
+
+def load_histogram_config(path):
+    """
+    STAGE_HISTOGRAMS with per-stage overrides from a JSON file, e.g.
+    {"Laundry": {"unit": "hour", "edges": [1, 2, 4, 8, 12, 24, 48]}}.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    config = {stage: dict(cfg) for stage, cfg in STAGE_HISTOGRAMS.items()}
+    for stage, cfg in overrides.items():
+        if stage not in config:
+            raise ValueError(f"{path}: unknown stage {stage!r} (expected one of {', '.join(config)})")
+        config[stage].update(cfg)
+        edges, unit = config[stage]["edges"], config[stage]["unit"]
+        if unit not in UNIT_SECONDS:
+            raise ValueError(f"{path}: {stage}: unit must be one of {', '.join(UNIT_SECONDS)}")
+        if not edges or any(b <= a for a, b in zip(edges, edges[1:])):
+            raise ValueError(f"{path}: {stage}: edges must be non-empty and strictly increasing")
+    return config
+
+
+def dwell_histogram(cfg, dwells):
+    """
+    Bucket counts and percentiles of `dwells`, (seconds, count) pairs, in the
+    stage's unit.  Percentiles are nearest-rank; negative dwells are ignored.
+    """
+    edges, unit_s = cfg["edges"], UNIT_SECONDS[cfg["unit"]]
+    last = len(edges) - 1
+    counts = [0] * len(edges)
+    values = []
+    for seconds, n in dwells:
+        if seconds < 0:
+            continue
+        d = seconds / unit_s
+        counts[min(bisect_left(edges, d), last)] += n
+        values.append((d, n))
+
+    values.sort()
+    total = sum(counts)
+    percentiles, acc, i = {}, 0, 0
+    for p in DWELL_PERCENTILES:
+        rank = -(-p * total // 100)        # ceil(p% of n), nearest-rank
+        while i < len(values) and acc < rank:
+            acc += values[i][1]
+            i += 1
+        percentiles[f"p{p}"] = round(values[i - 1][0], 2) if total else None
+    return counts, percentiles, total
+
+
+def dense_daily_usage(usage_by_date, usage_by_ward_date):
+    """
+    Date-keyed usage maps -> day-indexed columns starting at `start`, with
+    zero-usage days filled in, so the page can walk them as typed arrays.
+    """
+    if not usage_by_date:
+        return {"start": None, "days": 0, "total": [], "byWard": {}}
+    first = date.fromisoformat(min(usage_by_date))
+    days = (date.fromisoformat(max(usage_by_date)) - first).days + 1
+    keys = [(first + timedelta(days=d)).isoformat() for d in range(days)]
+    return {
+        "start":  first.isoformat(),
+        "days":   days,
+        "total":  [usage_by_date.get(k, 0) for k in keys],
+        "byWard": {ward: [by_date.get(k, 0) for k in keys]
+                   for ward, by_date in sorted(usage_by_ward_date.items())},
+    }
+
+
+def retirement_schedule(pending, overdue, start):
+    """
+    Weekly retirement calendar and replenishment orders from `pending`,
+    (cycles left, washes observed, days observed) per active towel, plus
+    `overdue` towels already past their limit.  Week k starts k * 7 days
+    after `start` (the snapshot date).  A towel with too little history of
+    its own is projected at the fleet rate.  The order for week 0 covers the
+    overdue towels and every retirement inside the lead time.
+    """
+    fleet_washes = sum(washes for _, washes, _ in pending)
+    fleet_days = sum(days for _, _, days in pending if days > 0)
+    fleet_rate = fleet_washes / fleet_days if fleet_days else 0.0
+
+    weeks = [0] * RETIREMENT_WEEKS
+    later = within = 0
+    for remaining, washes, days in pending:
+        own = washes >= RATE_MIN_WASHES and days >= RATE_MIN_DAYS
+        rate = washes / days if own else fleet_rate
+        if rate <= 0:
+            later += 1
+            continue
+        days_left = remaining / rate
+        if days_left <= NEAR_RETIRE_DAYS:
+            within += 1
+        week = int(days_left // 7)
+        if week < RETIREMENT_WEEKS:
+            weeks[week] += 1
+        else:
+            later += 1
+
+    lead = REPLENISH_LEAD_WEEKS
+    orders = [overdue + sum(weeks[:lead + 1])] + weeks[lead + 1:]
+    peak = max(range(RETIREMENT_WEEKS), key=lambda k: (weeks[k], -k))
+    return {
+        "retireAt":     RETIRE_CYCLES,
+        "start":        start.isoformat(),
+        "weeks":        weeks,
+        "later":        later,
+        "overdue":      overdue,
+        "orders":       orders,
+        "leadWeeks":    lead,
+        "fleetRate":    round(fleet_rate, 4),
+        "withinDays":   NEAR_RETIRE_DAYS,
+        "within":       overdue + within,
+        "nextWaveDays": peak * 7 if weeks[peak] else None,
+    }
+
+
+def alert_index(alerts):
+    """
+    Page-ready alert table, newest day first, with row-id lists per ward and
+    per rule and a [start, start + length) row range per day, so the page
+    filters and pages through the alerts without walking them.  `alerts` are
+    (day, rule, ward, epc, location) tuples.
+    """
+    rows = sorted(alerts, key=lambda a: (a[0], a[1], a[2], a[3], a[4]))
+    rows.reverse()
+    by_ward, by_rule, by_day = {}, {}, {}
+    for i, (day, rule, ward, _, _) in enumerate(rows):
+        by_ward.setdefault(ward, []).append(i)
+        by_rule.setdefault(rule, []).append(i)
+        by_day.setdefault(day, [i, 0])[1] += 1
+    return {
+        "total":  len(rows),
+        "table":  encode_table(rows, ALERT_SCHEMA),
+        "wards":  dict(sorted(by_ward.items())),
+        "rules":  dict(sorted(by_rule.items())),
+        "days":   by_day,
+        "config": {"missingOutHours": MISSING_OUT_HOURS, "lostDays": LOST_DAYS,
+                   "duplicateSeconds": DUPLICATE_READ_S},
+    }
+
+
+def lifecycle_label(cycles):
+    for label, upper in LIFECYCLE_BUCKETS:
+        if upper is None or cycles <= upper:
+            return label
+
+
+# ── Replay log ───────────────────────────────────────────────────────────────
+class ReplayLog:
+    """
+    History of the Report 2 / Chart 3 / Chart 5 counters for the time slider.
+    Each towel sits in at most one stock counter (a STOCK_KEYS value or its
+    ward, while its last event is an IN) and one lifecycle counter (while not
+    decommissioned).  The log keeps a copy of every counter at each grid time
+    (the state before events at that time) and a (t, from, to) move whenever a
+    towel changes counter, so any instant is the nearest earlier checkpoint
+    plus the moves since.  With history=False only the current counters are
+    kept (live_server.py).
+    """
+
+    def __init__(self, interval=REPLAY_INTERVAL_S, history=True):
+        self.interval    = interval
+        self.history     = history
+        self.counts      = {}     # counter -> towels now
+        self.checkpoints = []     # (grid epoch, {counter: towels})
+        self.moves       = []     # (epoch, from counter or "", to counter or "")
+        self.next_grid   = None
+
+    def advance(self, t):
+        """Checkpoints every grid time up to `t`, before an event at `t` is folded."""
+        if not self.history:
+            return
+        if self.next_grid is None:
+            self.next_grid = int(t // self.interval) * self.interval
+        while t >= self.next_grid:
+            self.checkpoints.append((self.next_grid, {k: n for k, n in self.counts.items() if n}))
+            self.next_grid += self.interval
+
+    def move(self, t, before, after):
+        """Records the counters a towel left and entered (pairs of keys or None)."""
+        for old, new in zip(before, after):
+            if old == new:
+                continue
+            if old:
+                self.counts[old] -= 1
+            if new:
+                self.counts[new] = self.counts.get(new, 0) + 1
+            if self.history:
+                self.moves.append((int(t), old or "", new or ""))
+
+    def state(self):
+        return {
+            "interval":    self.interval,
+            "history":     self.history,
+            "counts":      self.counts,
+            "checkpoints": self.checkpoints,
+            "moves":       self.moves,
+            "next_grid":   self.next_grid,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        log = cls(state["interval"], state["history"])
+        log.counts      = state["counts"]
+        log.checkpoints = [(t, counts) for t, counts in state["checkpoints"]]
+        log.moves       = [tuple(m) for m in state["moves"]]
+        log.next_grid   = state["next_grid"]
+        return log
+
+    @classmethod
+    def merge(cls, parts, interval):
+        """
+        Group log from per-site logs, [(site_id, log), ...]; the grid is epoch
+        aligned, so site checkpoints line up.  Before its first checkpoint a
+        site counts nothing; after its last one, its current counters (no
+        event of the site is later than its next grid time).
+        """
+        log = cls(interval)
+        parts = [(site_id, part) for site_id, part in parts if part.checkpoints]
+        if not parts:
+            return log
+        qualify = lambda key, site_id: site_ward(key, site_id) if key.startswith("Ward") else key
+        first = min(part.checkpoints[0][0] for _, part in parts)
+        last = max(part.checkpoints[-1][0] for _, part in parts)
+        for grid in range(first, last + interval, interval):
+            merged = {}
+            for site_id, part in parts:
+                k = (grid - part.checkpoints[0][0]) // interval
+                if k < 0:
+                    continue
+                counts = part.checkpoints[k][1] if k < len(part.checkpoints) else part.counts
+                for key, n in counts.items():
+                    key = qualify(key, site_id)
+                    merged[key] = merged.get(key, 0) + n
+            log.checkpoints.append((grid, merged))
+        for site_id, part in parts:
+            for key, n in part.counts.items():
+                key = qualify(key, site_id)
+                log.counts[key] = log.counts.get(key, 0) + n
+            log.moves.extend((t, qualify(old, site_id), qualify(new, site_id))
+                             for t, old, new in part.moves)
+        log.moves.sort(key=lambda m: m[0])
+        log.next_grid = last + interval
+        return log
+
+    def result(self, wards):
+        """Payload of the replay block: counter columns per checkpoint, plus the moves."""
+        keys = {
+            "stock":     list(STOCK_KEYS.values()),
+            "wards":     wards,
+            "lifecycle": [label for label, _ in LIFECYCLE_BUCKETS],
+        }
+        columns = [key for group in keys.values() for key in group]
+        return {
+            "interval":    self.interval,
+            "keys":        keys,
+            "checkpoints": encode_table(
+                [(t, *(counts.get(key, 0) for key in columns)) for t, counts in self.checkpoints],
+                [("t", "delta")] + [(key, "int") for key in columns]),
+            "moves":       encode_table(self.moves, REPLAY_MOVE_SCHEMA),
+        }
+
+
+# ── Per-EPC state ────────────────────────────────────────────────────────────
+class ItemState:
+    """
+    Compact per-EPC record: string fields are codes into the aggregator's
+    string table, so a long-lived towel costs the same as a new one.  No event
+    history is kept here; drill-down traces are read on demand through
+    epcis_io.EpcHistoryIndex.
+    """
+    __slots__ = ("loc", "proc", "last_in", "desc", "laundry_ins", "final_cycles",
+                 "seen", "decommissioned", "first_scan", "last_scan", "last_loc")
+
+    def __init__(self, loc, proc, last_in, desc, laundry_ins=0, final_cycles=0,
+                 seen=0, decommissioned=False, first_scan=None, last_scan=None, last_loc=None):
+        self.loc            = loc        # code of the location of the last IN
+        self.proc           = proc       # code of the last process
+        self.last_in        = last_in    # epoch seconds of the last IN
+        self.desc           = desc       # code of the item description
+        self.laundry_ins    = laundry_ins
+        self.final_cycles   = final_cycles
+        self.seen           = seen       # non-INIT events folded
+        self.decommissioned = decommissioned
+        self.first_scan     = last_in if first_scan is None else first_scan   # epoch seconds
+        self.last_scan      = last_in if last_scan is None else last_scan
+        self.last_loc       = loc if last_loc is None else last_loc           # code, any process
+
+    def to_list(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+
+# ── Aggregator ───────────────────────────────────────────────────────────────
+class DashboardAggregator:
+    """
+    Single-pass fold over EPCIS events.  Per EPC only the state the dashboard
+    reads is kept (an ItemState plus the INIT cycle count, home ward and
+    cycle limit);
+    everything else is accumulated into daily/windowed counters.
+    Events must be fed in chronological order.  With a ReplayLog in
+    `replay`, every counter move is also logged for the time slider.
+    """
+
+    def __init__(self, replay=None):
+        self.items            = {}   # EPC -> ItemState
+        self.init_meta        = {}   # EPC -> (initial_cycles, home_ward)
+        self.retire_at        = {}   # EPC -> INIT "Retire At", when not RETIRE_CYCLES
+        self.strings          = []   # code -> location / process / description
+        self.string_codes     = {}   # string -> code
+        self.usage_by_date    = {}
+        self.usage_by_ward_date = {}
+        self.wards            = set()
+        self.compliance_alerts = []   # streaming rule hits: {"epc", "type", "date", "location"}
+        self.completed_dwells = {}   # stage -> {dwell minutes: count}, closed IN -> OUT stays
+        self.decomm_times     = deque()   # epoch seconds inside 30d
+        self.recent           = deque()   # RECENT_EVENT_FIELDS tuples inside 24h
+        self.latest           = 0.0
+        self.event_count      = 0
+        self.replay           = replay
+
+    def code(self, text):
+        """Interned code for a location, process or description string."""
+        code = self.string_codes.get(text)
+        if code is None:
+            code = self.string_codes[text] = len(self.strings)
+            self.strings.append(text)
+        return code
+
+    def add(self, ev):
+        if self.replay is None:
+            return self.fold(ev)
+        epc, t = ev["EPC"], parse_timestamp(ev["Event Timestamp"])
+        self.replay.advance(t)
+        before = self.replay_counters(epc)
+        self.fold(ev)
+        self.replay.move(t, before, self.replay_counters(epc))
+
+    def fold(self, ev):
+        epc  = ev["EPC"]
+        loc  = ev["Location"]
+        proc = ev["Process"]
+        ts   = ev["Event Timestamp"]
+        t    = parse_timestamp(ts)
+        date = ts[:10]             # timestamps are UTC ('Z') in the EPCIS shape
+
+        self.event_count += 1
+        if t > self.latest:
+            self.latest = t
+
+        # INIT meta-events (carry starting cycle count)
+        if proc == "INIT":
+            self.init_meta[epc] = (ev.get("Initial Cycles") or 0, ev.get("Home Ward") or "")
+            limit = ev.get("Retire At") or RETIRE_CYCLES
+            if limit != RETIRE_CYCLES:
+                self.retire_at[epc] = limit
+            else:
+                self.retire_at.pop(epc, None)
+            return
+
+        item = self.items.get(epc)
+        if item is None:
+            item = self.items[epc] = ItemState(
+                self.code(loc), self.code(proc), t, self.code(ev.get("Item Description", "")))
+        elif item.seen > 0:
+            self.check_scan(epc, item, loc, proc, t, date)
+
+        is_ward = loc.startswith("Ward")
+
+        # Usage: IN at any ward
+        if is_ward and proc == "IN":
+            self.usage_by_date[date] = self.usage_by_date.get(date, 0) + 1
+            self.wards.add(loc)
+            ward_dates = self.usage_by_ward_date.setdefault(loc, {})
+            ward_dates[date] = ward_dates.get(date, 0) + 1
+
+        # Cycle count: IN at Laundry
+        if loc == LAUNDRY and proc == "IN":
+            item.laundry_ins += 1
+
+        # Trust explicit final cycle count at retirement
+        if proc == "DECOMMISSION":
+            if isinstance(ev.get("Final Cycles"), int):
+                item.final_cycles = max(item.final_cycles, ev["Final Cycles"])
+            item.decommissioned = True
+            self.decomm_times.append(t)
+            while self.decomm_times[0] < self.latest - DECOMM_WINDOW_S:
+                self.decomm_times.popleft()
+
+        # Completed stay: OUT closing the open IN at the same location
+        if proc == "OUT" and self.strings[item.proc] == "IN" and self.strings[item.loc] == loc:
+            self.add_completed_dwell(loc, t - item.last_in)
+
+        if proc == "IN":
+            item.last_in = t
+            item.loc = self.code(loc)
+        item.proc = self.code(proc)
+        item.last_scan = t
+        item.last_loc = self.code(loc)
+        item.seen += 1
+
+        # Recent window: feeds the 24h flow KPI and the activity table
+        self.recent.append((t, epc, loc, proc, ev.get("Staff ID", ""), ev.get("RFID Device ID", "")))
+        while (len(self.recent) > RECENT_ACTIVITY_ROWS
+               and self.recent[0][0] < self.latest - RECENT_WINDOW_S):
+            self.recent.popleft()
+
+    def check_scan(self, epc, item, loc, proc, t, date):
+        """
+        Streaming compliance rules for a scan of a towel already seen, judged
+        against its previous scan (and previous IN) before they are updated.
+        """
+        def alert(rule, day, where):
+            self.compliance_alerts.append({"epc": epc, "type": rule, "date": day, "location": where})
+
+        if item.decommissioned:
+            alert(RULE_AFTER_RETIRED, date, loc)
+        prev_proc = self.strings[item.proc]
+        if prev_proc == proc and self.strings[item.last_loc] == loc and t - item.last_scan <= DUPLICATE_READ_S:
+            alert(RULE_DUPLICATE, date, loc)
+        # The previous scan was an IN: its stay lasted until this scan
+        if prev_proc == "IN":
+            stay_loc = self.strings[item.loc]
+            stage = stage_key(stay_loc)
+            if stage in MISSING_OUT_HOURS and t - item.last_in > MISSING_OUT_HOURS[stage] * 3600:
+                alert(missing_out_rule(stage), format_day(item.last_in + MISSING_OUT_HOURS[stage] * 3600), stay_loc)
+        # Illegal skips, against the location of the previous IN
+        if proc == "IN":
+            prev = self.strings[item.loc]
+            if prev.startswith("Ward") and loc == STORAGE:
+                alert(RULE_SKIPPED_LAUNDRY, date, loc)
+            if prev == NEW_LINEN and loc.startswith("Ward"):
+                alert(RULE_SKIPPED_WASH, date, loc)
+
+    def add_completed_dwell(self, loc, seconds, count=1):
+        stage = stage_key(loc)
+        if stage:
+            minutes = int(seconds / DWELL_RESOLUTION_S + 0.5)   # as event_store's SQL CAST
+            by_minute = self.completed_dwells.setdefault(stage, {})
+            by_minute[minutes] = by_minute.get(minutes, 0) + count
+
+    def replay_counters(self, epc):
+        """(stock counter, lifecycle counter) of a towel, None where it counts in neither."""
+        item = self.items.get(epc)
+        if item is None:
+            return None, None
+        stock = None
+        if self.strings[item.proc] == "IN":
+            loc = self.strings[item.loc]
+            stock = STOCK_KEYS.get(loc) or (loc if loc.startswith("Ward") else None)
+        return stock, None if item.decommissioned else lifecycle_label(self.cycles(epc))
+
+    def add_all(self, events):
+        for ev in events:
+            self.add(ev)
+        return self
+
+    # ── Checkpointing ──────────────────────────────────────────────────────
+    def state(self):
+        """JSON-serializable fold state; see from_state()."""
+        return {
+            "items":             {epc: item.to_list() for epc, item in self.items.items()},
+            "init_meta":         self.init_meta,
+            "retire_at":         self.retire_at,
+            "strings":           self.strings,
+            "usage_by_date":     self.usage_by_date,
+            "usage_by_ward_date": self.usage_by_ward_date,
+            "wards":             sorted(self.wards),
+            "compliance_alerts": self.compliance_alerts,
+            "completed_dwells":  {stage: list(by_minute.items())
+                                  for stage, by_minute in self.completed_dwells.items()},
+            "decomm_times":      list(self.decomm_times),
+            "recent":            list(self.recent),
+            "latest":            self.latest,
+            "event_count":       self.event_count,
+            "replay":            self.replay and self.replay.state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        agg = cls()
+        agg.items              = {epc: ItemState(*fields) for epc, fields in state["items"].items()}
+        agg.strings            = state["strings"]
+        agg.string_codes       = {text: code for code, text in enumerate(agg.strings)}
+        agg.init_meta          = {epc: tuple(meta) for epc, meta in state["init_meta"].items()}
+        agg.retire_at          = state["retire_at"]
+        agg.usage_by_date      = state["usage_by_date"]
+        agg.usage_by_ward_date = state["usage_by_ward_date"]
+        agg.wards              = set(state["wards"])
+        agg.compliance_alerts  = state["compliance_alerts"]
+        agg.completed_dwells   = {stage: dict(pairs) for stage, pairs in state["completed_dwells"].items()}
+        agg.decomm_times       = deque(state["decomm_times"])
+        agg.recent             = deque(tuple(r) for r in state["recent"])
+        agg.latest             = state["latest"]
+        agg.event_count        = state["event_count"]
+        agg.replay             = state["replay"] and ReplayLog.from_state(state["replay"])
+        return agg
+
+    @classmethod
+    def merge(cls, parts):
+        """
+        Group roll-up of per-site folds, [(site_id, aggregator), ...], without
+        re-folding any event.  Ward locations are qualified with their site
+        (site_ward) so same-named wards stay apart; EPCs must be unique across
+        sites.  The windows are pruned against the group's latest scan as add()
+        would have.
+        """
+        agg = cls()
+        for site_id, part in parts:
+            for epc, item in part.items.items():
+                agg.items[epc] = ItemState(
+                    agg.code(site_ward(part.strings[item.loc], site_id)), agg.code(part.strings[item.proc]),
+                    item.last_in, agg.code(part.strings[item.desc]), item.laundry_ins,
+                    item.final_cycles, item.seen, item.decommissioned, item.first_scan, item.last_scan,
+                    agg.code(site_ward(part.strings[item.last_loc], site_id)))
+            for epc, (initial, home_ward) in part.init_meta.items():
+                agg.init_meta[epc] = (initial, site_ward(home_ward, site_id))
+            agg.retire_at.update(part.retire_at)
+            for date, n in part.usage_by_date.items():
+                agg.usage_by_date[date] = agg.usage_by_date.get(date, 0) + n
+            for ward, by_date in part.usage_by_ward_date.items():
+                agg.usage_by_ward_date[site_ward(ward, site_id)] = dict(by_date)
+            agg.wards.update(site_ward(ward, site_id) for ward in part.wards)
+            agg.compliance_alerts.extend(dict(a, location=site_ward(a["location"], site_id))
+                                         for a in part.compliance_alerts)
+            for stage, by_minute in part.completed_dwells.items():
+                merged = agg.completed_dwells.setdefault(stage, {})
+                for minutes, n in by_minute.items():
+                    merged[minutes] = merged.get(minutes, 0) + n
+            agg.decomm_times.extend(part.decomm_times)
+            agg.recent.extend((t, epc, site_ward(loc, site_id), *rest) for t, epc, loc, *rest in part.recent)
+            agg.latest = max(agg.latest, part.latest)
+            agg.event_count += part.event_count
+
+        agg.compliance_alerts.sort(key=lambda a: a["date"])
+        agg.decomm_times = deque(sorted(agg.decomm_times))
+        while agg.decomm_times and agg.decomm_times[0] < agg.latest - DECOMM_WINDOW_S:
+            agg.decomm_times.popleft()
+        replays = [(site_id, part.replay) for site_id, part in parts if part.replay]
+        if replays:
+            agg.replay = ReplayLog.merge(replays, replays[0][1].interval)
+        agg.recent = deque(sorted(agg.recent, key=lambda r: r[0]))
+        while (len(agg.recent) > RECENT_ACTIVITY_ROWS
+               and agg.recent[0][0] < agg.latest - RECENT_WINDOW_S):
+            agg.recent.popleft()
+        return agg
+
+    # ── Derived views ──────────────────────────────────────────────────────
+    def cycles(self, epc):
+        item = self.items[epc]
+        initial = self.init_meta.get(epc, (0, ""))[0]
+        return max(item.laundry_ins, item.final_cycles) + initial
+
+    def retire_limit(self, epc):
+        """Cycle count at which `epc` is due for retirement."""
+        return self.retire_at.get(epc, RETIRE_CYCLES)
+
+    def snapshot_alerts(self, epc, item, cycles, snapshot_t, snapshot_date):
+        """
+        State rules for an active towel at the snapshot, as (epc, rule, day,
+        location): lost (no scan for LOST_DAYS), otherwise an open IN past its
+        stage's MISSING_OUT_HOURS; and overdue for retirement.
+        """
+        loc = self.strings[item.loc]
+        if snapshot_t - item.last_scan > LOST_DAYS * 86400:
+            yield epc, RULE_LOST, format_day(item.last_scan + LOST_DAYS * 86400), loc
+        elif self.strings[item.proc] == "IN":
+            stage = stage_key(loc)
+            if stage in MISSING_OUT_HOURS and snapshot_t - item.last_in > MISSING_OUT_HOURS[stage] * 3600:
+                yield epc, missing_out_rule(stage), format_day(item.last_in + MISSING_OUT_HOURS[stage] * 3600), loc
+        if cycles >= self.retire_limit(epc):
+            yield epc, RULE_OVERDUE, snapshot_date.isoformat(), loc
+
+    def activity_epcs(self):
+        """EPCs of the recent activity table rows (newest RECENT_ACTIVITY_ROWS events)."""
+        newest = sorted(self.recent, key=lambda r: r[0])[-RECENT_ACTIVITY_ROWS:]
+        return list(dict.fromkeys(r[1] for r in reversed(newest)))
+
+    def result(self, snapshot=SNAPSHOT_TIME, histograms=STAGE_HISTOGRAMS):
+        """
+        Compact, JSON-ready payload consumed by the dashboard script.
+        `histograms` is the Chart 4 bucket config (see load_histogram_config).
+        """
+        snapshot_t = parse_timestamp(snapshot)
+        recency_end = self.latest or snapshot_t
+        recency_start = recency_end - FLOW_WINDOW_S
+
+        wards = sorted(self.wards)
+        stock_counts = {"New Linen": 0, "In Laundry": 0, "Clean Storage": 0, "In Wards": 0}
+        ward_stock = {ward: 0 for ward in wards}
+        lifecycle = {label: 0 for label, _ in LIFECYCLE_BUCKETS}
+        dwells = {key: [] for key in histograms}
+        storage_sample = []
+        pending, overdue = [], 0     # retirement projection inputs
+        proc_in = self.string_codes.get("IN")
+        snapshot_date = datetime.fromtimestamp(snapshot_t, timezone.utc).date()
+        alerts = [(a["epc"], a["type"], a["date"], a["location"]) for a in self.compliance_alerts]
+
+        for epc, item in self.items.items():
+            cycles = self.cycles(epc)
+            if not item.decommissioned:
+                lifecycle[lifecycle_label(cycles)] += 1
+                limit = self.retire_limit(epc)
+                if cycles >= limit:
+                    overdue += 1
+                else:
+                    pending.append((limit - cycles, item.laundry_ins,
+                                    (snapshot_t - item.first_scan) / 86400))
+                alerts.extend(self.snapshot_alerts(epc, item, cycles, snapshot_t, snapshot_date))
+
+            # Open IN (last event is IN, no OUT yet) = currently in that stage
+            if item.proc != proc_in:
+                continue
+            loc = self.strings[item.loc]
+            if loc in STOCK_KEYS:
+                stock_counts[STOCK_KEYS[loc]] += 1
+            elif loc.startswith("Ward"):
+                stock_counts["In Wards"] += 1
+                ward_stock[loc] = ward_stock.get(loc, 0) + 1
+            if loc == STORAGE and len(storage_sample) < DEBUG_SAMPLE_SIZE:
+                storage_sample.append(epc)
+            stage = stage_key(loc)
+            if stage:
+                dwells[stage].append(snapshot_t - item.last_in)
+
+        # Snapshot dwell of towels in each stage now, and every completed stay
+        dwell_histograms = {}
+        for stage, cfg in histograms.items():
+            counts, percentiles, _ = dwell_histogram(cfg, ((seconds, 1) for seconds in dwells[stage]))
+            done_counts, done_percentiles, done_n = dwell_histogram(
+                cfg, ((minutes * DWELL_RESOLUTION_S, n)
+                      for minutes, n in self.completed_dwells.get(stage, {}).items()))
+            dwell_histograms[stage] = {
+                "labels":      [bucket_label(cfg["unit"], e) for e in cfg["edges"]],
+                "counts":      counts,
+                "percentiles": percentiles,
+                "completed":   {"counts": done_counts, "percentiles": done_percentiles, "n": done_n},
+                "unit":        cfg["unit"],
+                "xLabel":      cfg["x_label"],
+            }
+
+        decomm_30d = sum(1 for t in self.decomm_times
+                         if recency_end - DECOMM_WINDOW_S <= t <= recency_end)
+
+        recent_events = encode_table(
+            [(int(t), epc, loc, proc, staff, device, self.strings[self.items[epc].desc], self.cycles(epc))
+             for t, epc, loc, proc, staff, device in sorted(self.recent, key=lambda r: r[0])],
+            RECENT_EVENT_SCHEMA)
+        home_wards = {epc: home for epc, (_, home) in self.init_meta.items()}
+        alerts = alert_index(
+            [(day, rule, loc if loc.startswith("Ward") else home_wards.get(epc) or NO_WARD, epc, loc)
+             for epc, rule, day, loc in alerts])
+
+        usage = dense_daily_usage(self.usage_by_date, self.usage_by_ward_date)
+
+        return {
+            "snapshot":          snapshot,
+            "eventCount":        self.event_count,
+            "itemCount":         len(self.items),
+            "wards":             wards,
+            "usage":             usage,
+            "forecast":          usage_forecast(usage, snapshot_date),
+            "stockCounts":       stock_counts,
+            "wardStockCounts":   ward_stock,
+            "flow24h":           {"start": format_timestamp(recency_start),
+                                  "end": format_timestamp(recency_end)},
+            "recentDecomm30d":   decomm_30d,
+            "lifecycle":         lifecycle,
+            "retirement":        retirement_schedule(pending, overdue, snapshot_date),
+            "dwellHistograms":   dwell_histograms,
+            "alerts":            alerts,
+            "recentEvents":      recent_events,
+            "storageSample":     storage_sample,
+        }
+
+
+def drilldown_block(history, epcs):
+    """
+    Full traces of `epcs` for the Drill Down view, read through an
+    epcis_io.EpcHistoryIndex.  Events are grouped by EPC (chronological within
+    a group) so one towel is the contiguous slice [start, start + length) named
+    by its index row; the page decodes the block on the first Drill Down.
+    """
+    rows, index = [], []
+    for epc, trace in history.traces(epcs).items():
+        timed = sorted(((parse_timestamp(ev["Event Timestamp"]), ev) for ev in trace),
+                       key=lambda pair: pair[0])
+        start, initial, home_ward = len(rows), 0, ""
+        for t, ev in timed:
+            if ev["Process"] == "INIT":
+                initial, home_ward = ev.get("Initial Cycles") or 0, ev.get("Home Ward") or ""
+            rows.append((int(t), ev["Location"], ev["Process"], ev.get("Staff ID", "")))
+        index.append((epc, start, len(rows) - start, initial, home_ward))
+    return {
+        "index":  encode_table(index, DRILLDOWN_INDEX_SCHEMA),
+        "events": encode_table(rows, DRILLDOWN_EVENT_SCHEMA),
+    }
+
+
+def aggregate(events, snapshot=SNAPSHOT_TIME):
+    """Convenience wrapper: fold an iterable of events and return the payload."""
+    return DashboardAggregator().add_all(events).result(snapshot)
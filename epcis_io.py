@@ -0,0 +1,285 @@
+"""
+epcis_io.py
+Reading and writing EPCIS event files: the classic JSON array
+(`epcis_events.json`) and newline-delimited JSON (`epcis_events.ndjson`),
+plus the external k-way merge used to write large event streams in
+chronological order with bounded memory, and a lazily built per-EPC index
+for reading one towel's history on demand.
+"""
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+from array import array
+
+EVENT_SEPARATORS = (',', ':')
+
+
+def event_line(ev):
+    return json.dumps(ev, separators=EVENT_SEPARATORS)
+
+
+def iter_events(path):
+    """
+    Yields events from `path`.  NDJSON files are streamed line by line;
+    a JSON array (first non-blank character '[') is loaded whole.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == "[":
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def is_ndjson(path):
+    return path.endswith((".ndjson", ".jsonl"))
+
+
+def iter_ndjson_from(path, offset=0):
+    """
+    Yields (event, end_offset) for each complete line after byte `offset` of an
+    append-only NDJSON log.  A trailing line without its newline is still being
+    written by the reader and is left for the next call.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                yield json.loads(line), offset
+
+
+def log_head_digest(path, size=4096):
+    """Fingerprint of the start of a log, to detect it was replaced or rotated."""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(size)).hexdigest()
+
+
+# ── Per-EPC history index ────────────────────────────────────────────────────
+# The dashboard fold keeps only current state per EPC.  When one towel's full
+# trace is needed (drill-down) this index maps EPC -> positions of its events
+# in the file.  An NDJSON log is indexed by byte offset so a lookup re-reads
+# only that EPC's lines; the builder records the offsets while it folds
+# (add()) and keeps them in its checkpoint (state()), so a rebuild extends
+# the index from the last offset instead of re-parsing the log.  Without
+# recorded offsets the index is built on the first lookup.  Any other source
+# (a JSON array, or a reader export through `load`) is not indexed: traces()
+# streams it once and keeps only the events of the EPCs asked for.
+
+class EpcHistoryIndex:
+    """EPC -> events index over an EPCIS event file."""
+
+    def __init__(self, path, load=iter_events, positions=None):
+        self.path       = path
+        self.load       = load      # event iterator for non-NDJSON sources
+        self._positions = positions # NDJSON: EPC -> array of line offsets (None: lazy)
+        self._epcs      = None      # other sources: EPCs in first-seen order
+
+    @classmethod
+    def recording(cls, path, state=None):
+        """NDJSON index filled through add(), resuming from a state() dict."""
+        positions = {epc: array("q", offsets) for epc, offsets in (state or {}).items()}
+        return cls(path, positions=positions)
+
+    def add(self, epc, offset):
+        """Records the NDJSON line of `epc` that starts at byte `offset`."""
+        offsets = self._positions.get(epc)
+        if offsets is None:
+            offsets = self._positions[epc] = array("q")
+        offsets.append(offset)
+
+    def state(self):
+        """JSON-serializable offsets; see recording()."""
+        return {epc: offsets.tolist() for epc, offsets in self._index().items()}
+
+    def _build(self):
+        positions = {}
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    epc = json.loads(line)["EPC"]
+                    positions.setdefault(epc, array("q")).append(offset)
+                offset += len(line)
+        self._positions = positions
+
+    def _index(self):
+        if self._positions is None:
+            self._build()
+        return self._positions
+
+    def __contains__(self, epc):
+        return epc in self.epcs()
+
+    def epcs(self):
+        if is_ndjson(self.path):
+            return self._index().keys()
+        if self._epcs is None:
+            self._epcs = dict.fromkeys(ev["EPC"] for ev in self.load(self.path)).keys()
+        return self._epcs
+
+    def traces(self, epcs):
+        """{epc: history(epc)} for `epcs`, in one pass over a non-NDJSON source."""
+        if is_ndjson(self.path):
+            return {epc: self.history(epc) for epc in epcs}
+        traces = {epc: [] for epc in epcs}
+        for ev in self.load(self.path):
+            trace = traces.get(ev["EPC"])
+            if trace is not None:
+                trace.append(ev)
+        return traces
+
+    def history(self, epc):
+        """Events of `epc` in file order (chronological for generated files)."""
+        if not is_ndjson(self.path):
+            return self.traces([epc])[epc]
+        positions = self._index().get(epc, ())
+        events = []
+        with open(self.path, "rb") as f:
+            for offset in positions:
+                f.seek(offset)
+                line = f.readline()
+                while not line.strip():     # offset recorded before blank lines
+                    line = f.readline()
+                events.append(json.loads(line))
+        return events
+
+
+class TraceCache:
+    """EpcHistoryIndex interface over traces already read (EPC -> events)."""
+
+    def __init__(self, traces):
+        self._traces = traces
+
+    def __contains__(self, epc):
+        return epc in self._traces
+
+    def epcs(self):
+        return self._traces.keys()
+
+    def history(self, epc):
+        return self._traces.get(epc, [])
+
+    def traces(self, epcs):
+        return {epc: self.history(epc) for epc in epcs}
+
+
+# ── External merge ───────────────────────────────────────────────────────────
+# Each simulated item produces a short run that is already chronological.
+# Runs are merged in memory until `chunk_events` is reached, the merged chunk
+# is spilled to a temporary file, and the spilled chunks are k-way merged on
+# the way out.  Peak memory is one chunk, independent of total event count.
+#
+# Spill lines are "<timestamp>\t<event json>" so the final merge can compare
+# raw lines without re-parsing JSON.  A run may also arrive already encoded
+# as spill lines (encoded_line()), e.g. from the NumPy engine, which formats
+# whole columns at once instead of building event dicts.
+
+def _event_ts(ev):
+    return ev["Event Timestamp"]
+
+
+def _line_ts(line):
+    return line[:line.index("\t")]
+
+
+def encoded_line(timestamp, json_text):
+    """Spill-format line of an event encoded by the caller (see add_run())."""
+    return f"{timestamp}\t{json_text}\n"
+
+
+def _is_encoded(run):
+    return isinstance(run[0], str)
+
+
+class ChronologicalWriter:
+    """Accepts per-item sorted runs and writes one chronological NDJSON stream."""
+
+    def __init__(self, out, chunk_events=200_000, tmp_dir=None, encode=event_line):
+        self.out          = out
+        self.encode       = encode      # event -> JSON line (without newline)
+        self.chunk_events = chunk_events
+        self.tmp_dir      = tmp_dir
+        self.pending      = []      # in-memory runs of the current chunk
+        self.pending_n    = 0
+        self.spills       = []      # paths of spilled sorted chunks
+        self.count        = 0
+
+    def add_run(self, run):
+        """Adds one chronological run: event dicts, or encoded_line() strings."""
+        if not run:
+            return
+        self.pending.append(run)
+        self.pending_n += len(run)
+        if self.pending_n >= self.chunk_events:
+            self._spill()
+
+    def _encoded(self, events):
+        encode = self.encode
+        return (f"{ev['Event Timestamp']}\t{encode(ev)}\n" for ev in events)
+
+    def _merged_pending(self):
+        if any(map(_is_encoded, self.pending)):
+            runs = [run if _is_encoded(run) else self._encoded(run) for run in self.pending]
+            return heapq.merge(*runs, key=_line_ts)
+        return self._encoded(heapq.merge(*self.pending, key=_event_ts))
+
+    def _spill(self):
+        fd, path = tempfile.mkstemp(prefix="epcis-run-", suffix=".tsv", dir=self.tmp_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.writelines(self._merged_pending())
+        self.spills.append(path)
+        self.pending, self.pending_n = [], 0
+
+    def merged_lines(self):
+        """Yields every event as an NDJSON line, in chronological order."""
+        if not self.spills:
+            # Everything fit in one chunk: no temp files needed.
+            lines = self._merged_pending()
+        else:
+            if self.pending:
+                self._spill()
+            files = [open(p, "r", encoding="utf-8") for p in self.spills]
+            lines = heapq.merge(*files, key=_line_ts)
+        try:
+            for line in lines:
+                self.count += 1
+                yield line[line.index("\t") + 1:]
+        finally:
+            if self.spills:
+                for f in files:
+                    f.close()
+                for p in self.spills:
+                    os.remove(p)
+                self.spills = []
+            self.pending, self.pending_n = [], 0
+
+    def merged_events(self):
+        """
+        merged_lines() as event dicts.  Runs that fit in one chunk are merged
+        as they are; only spilled chunks and encoded runs are parsed back.
+        """
+        if self.spills or any(map(_is_encoded, self.pending)):
+            for line in self.merged_lines():
+                yield json.loads(line)
+            return
+        merged = heapq.merge(*self.pending, key=_event_ts)
+        self.pending, self.pending_n = [], 0
+        for ev in merged:
+            self.count += 1
+            yield ev
+
+    def close(self):
+        """Merges all runs into `out`; returns the number of events written."""
+        self.out.writelines(self.merged_lines())
+        return self.count
@@ -0,0 +1,348 @@
+"""
+event_store.py
+Optional SQLite event store (standard library `sqlite3`, one local file) for
+keeping long histories of scans from many sources without reloading a flat
+JSON file for every build.
+
+Events are bulk-inserted with `executemany` inside one transaction per batch
+and de-duplicated on their GUID, so re-ingesting an overlapping export is
+safe.  The dashboard aggregates are SQL queries over indexed columns:
+
+    (epc, ts)                  per-EPC state, traces, compliance sequences
+    (location, process, ts)    daily ward usage, decommissions, laundry cycles
+
+The query results are loaded into a DashboardAggregator, whose result()
+renders the same payload a full event fold would.
+
+Usage:
+    python event_store.py events.db epcis_events.json scans.ndjson data.js
+    python build_v4_rebuild.py --store events.db
+"""
+import argparse
+import json
+import sqlite3
+from collections import deque
+
+from dashboard_aggregates import (DECOMM_WINDOW_S, DUPLICATE_READ_S, DWELL_RESOLUTION_S, LAUNDRY,
+                                  MISSING_OUT_HOURS, NEW_LINEN, RECENT_ACTIVITY_ROWS, RECENT_WINDOW_S,
+                                  RETIRE_CYCLES, RULE_AFTER_RETIRED, RULE_DUPLICATE, RULE_SKIPPED_LAUNDRY,
+                                  RULE_SKIPPED_WASH, STORAGE, DashboardAggregator, ItemState,
+                                  missing_out_rule, parse_timestamp)
+from epcis_io import EVENT_SEPARATORS, iter_events
+from scanner_ingest import is_scanner_export, iter_scanner_events
+
+INGEST_BATCH = 50_000
+
+# SQL condition per Chart 4 stage (as dashboard_aggregates.stage_key)
+STAGE_SQL = {
+    "New Linen": f"location = '{NEW_LINEN}'",
+    "Laundry":   f"location = '{LAUNDRY}'",
+    "Storage":   f"location = '{STORAGE}'",
+    "Ward":      "location GLOB 'Ward*'",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id             INTEGER PRIMARY KEY,   -- ingest order; breaks timestamp ties
+    guid           TEXT UNIQUE,
+    ts             REAL NOT NULL,         -- epoch seconds
+    day            TEXT NOT NULL,         -- UTC date, 'YYYY-MM-DD'
+    epc            TEXT NOT NULL,
+    location       TEXT NOT NULL,
+    process        TEXT NOT NULL,
+    staff          TEXT,
+    device         TEXT,
+    description    TEXT,
+    initial_cycles INTEGER,
+    home_ward      TEXT,
+    final_cycles   INTEGER
+);
+-- Full events live apart so aggregate scans only touch the narrow rows above
+CREATE TABLE IF NOT EXISTS docs (
+    id  INTEGER PRIMARY KEY REFERENCES events (id),
+    doc TEXT NOT NULL                     -- the full event, compact JSON
+);
+CREATE INDEX IF NOT EXISTS events_epc_ts      ON events (epc, ts);
+CREATE INDEX IF NOT EXISTS events_loc_proc_ts ON events (location, process, ts);
+CREATE INDEX IF NOT EXISTS events_ts          ON events (ts);
+"""
+
+# Ward locations as an index range scan (LIKE is case-insensitive and cannot use it)
+WARD_CLAUSE = "location GLOB 'Ward*'"
+
+
+def iter_source_events(path):
+    """Events of any supported source file: JSON array, NDJSON or reader export."""
+    return iter_scanner_events(path) if is_scanner_export(path) else iter_events(path)
+
+
+def event_row(ev):
+    final = ev.get("Final Cycles")
+    ts = ev["Event Timestamp"]
+    return (
+        ev.get("Event GUID"), parse_timestamp(ts), ts[:10], ev["EPC"],
+        ev["Location"], ev["Process"], ev.get("Staff ID", ""), ev.get("RFID Device ID", ""),
+        ev.get("Item Description", ""), ev.get("Initial Cycles"), ev.get("Home Ward"),
+        final if isinstance(final, int) else None,
+    )
+
+
+class EventStore:
+    """SQLite-backed event log with the dashboard aggregates as queries."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ── Ingest ─────────────────────────────────────────────────────────────
+    def ingest(self, events, batch=INGEST_BATCH):
+        """Bulk-inserts events (skipping GUIDs already stored); returns rows added."""
+        before = self.count()
+        batch_events = []
+        for ev in events:
+            batch_events.append(ev)
+            if len(batch_events) >= batch:
+                self._insert(batch_events)
+                batch_events = []
+        self._insert(batch_events)
+        self.conn.execute("PRAGMA optimize")   # refresh planner statistics when stale
+        return self.count() - before
+
+    def _insert(self, events):
+        if not events:
+            return
+        with self.conn:    # one transaction per batch
+            first_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM events").fetchone()[0]
+            ids = range(first_id, first_id + len(events))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO events (id, guid, ts, day, epc, location, process, staff, device,"
+                " description, initial_cycles, home_ward, final_cycles)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((i, *event_row(ev)) for i, ev in zip(ids, events)))
+            # Documents only for rows that were actually inserted (new GUIDs)
+            self.conn.executemany(
+                "INSERT INTO docs (id, doc) SELECT ?, ? WHERE EXISTS (SELECT 1 FROM events WHERE id = ?)",
+                ((i, json.dumps(ev, separators=EVENT_SEPARATORS, ensure_ascii=False), i)
+                 for i, ev in zip(ids, events)))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    # ── Per-EPC traces (drill-down; same interface as EpcHistoryIndex) ─────
+    def epcs(self):
+        return [epc for (epc,) in self.conn.execute("SELECT DISTINCT epc FROM events ORDER BY epc")]
+
+    def history(self, epc):
+        return [json.loads(doc) for (doc,) in self.conn.execute(
+            "SELECT d.doc FROM events e JOIN docs d ON d.id = e.id"
+            " WHERE e.epc = ? ORDER BY e.ts, e.id", (epc,))]
+
+    def traces(self, epcs):
+        return {epc: self.history(epc) for epc in epcs}
+
+    # ── Aggregates ─────────────────────────────────────────────────────────
+    def daily_ward_usage(self):
+        """{ward: {day: IN count}} over ward IN scans."""
+        usage = {}
+        for ward, day, n in self.conn.execute(
+                f"SELECT location, day, COUNT(*) FROM events"
+                f" WHERE {WARD_CLAUSE} AND process = 'IN' GROUP BY location, day"):
+            usage.setdefault(ward, {})[day] = n
+        return usage
+
+    def decommission_times(self, since):
+        return [ts for (ts,) in self.conn.execute(
+            "SELECT ts FROM events WHERE process = 'DECOMMISSION' AND ts >= ? ORDER BY ts, id",
+            (since,))]
+
+    def item_states(self):
+        """
+        Yields the ItemState fields of every EPC, in order of first scan.
+        Each role is one GROUP BY scan of the (epc, ts) index; SQLite takes a
+        bare column next to MIN()/MAX() from the row holding that extreme, so
+        these are the first scan, the last scan and the last IN of each EPC.
+        INIT meta-events are excluded as in the fold.
+        """
+        q = self.conn.execute
+        last_in = {epc: (loc, ts) for epc, loc, ts in q(
+            "SELECT epc, location, MAX(ts) FROM events WHERE process = 'IN' GROUP BY epc")}
+        last_scan = {epc: (proc, loc, ts) for epc, proc, loc, ts in q(
+            "SELECT epc, process, location, MAX(ts) FROM events WHERE process != 'INIT' GROUP BY epc")}
+        counters = {epc: rest for epc, *rest in q(f"""
+            SELECT epc,
+                   SUM(process = 'IN' AND location = '{LAUNDRY}'),
+                   COALESCE(MAX(CASE WHEN process = 'DECOMMISSION' THEN final_cycles END), 0),
+                   COUNT(*),
+                   MAX(process = 'DECOMMISSION')
+            FROM events WHERE process != 'INIT' GROUP BY epc""")}
+        for epc, loc, desc, first_ts in q(
+                "SELECT epc, location, description, MIN(ts) FROM events"
+                " WHERE process != 'INIT' GROUP BY epc ORDER BY 4"):
+            loc, t = last_in.get(epc, (loc, first_ts))
+            laundry_ins, final_cycles, seen, decommissioned = counters[epc]
+            proc, last_loc, last_ts = last_scan[epc]
+            yield (epc, loc, proc, t, desc, laundry_ins, final_cycles, seen, decommissioned, first_ts,
+                   last_ts, last_loc)
+
+    def init_meta(self):
+        meta = {}
+        for epc, initial, home in self.conn.execute(
+                "SELECT epc, initial_cycles, home_ward FROM events"
+                " WHERE process = 'INIT' ORDER BY ts, id"):
+            meta[epc] = (initial or 0, home or "")
+        return meta
+
+    def retire_at(self):
+        """INIT "Retire At" limits that differ from the default (read from the stored documents)."""
+        limits = {}
+        for epc, limit in self.conn.execute(
+                "SELECT e.epc, json_extract(d.doc, '$.\"Retire At\"') FROM events e JOIN docs d USING (id)"
+                " WHERE e.process = 'INIT' ORDER BY e.ts, e.id"):
+            limit = limit or RETIRE_CYCLES
+            if limit != RETIRE_CYCLES:
+                limits[epc] = limit
+            else:
+                limits.pop(epc, None)
+        return limits
+
+    def compliance_alerts(self):
+        """
+        The fold's streaming compliance rules (DashboardAggregator.check_scan)
+        as window queries over the (epc, ts) index.  Illegal skips are judged
+        against the location of the towel's previous IN (or its first scan):
+        Ward -> Storage and New Linen -> Ward.  The other rules compare a scan
+        with the towel's previous scan: a scan after DECOMMISSION, a repeat of
+        the same process and location within DUPLICATE_READ_S, and an IN left
+        open past its stage's MISSING_OUT_HOURS.
+        """
+        missing_out = " UNION ALL ".join(
+            f"SELECT epc, '{missing_out_rule(stage)}', date(prev_ts + {hours * 3600}, 'unixepoch'), prev_loc, ts, id"
+            f" FROM scans WHERE prev_proc = 'IN' AND ts - prev_ts > {hours * 3600}"
+            f" AND {STAGE_SQL[stage].replace('location', 'prev_loc')}"
+            for stage, hours in MISSING_OUT_HOURS.items())
+        return [{"epc": epc, "type": kind, "date": day, "location": loc}
+                for epc, kind, day, loc, _, _ in self.conn.execute(f"""
+            WITH scans AS (
+                SELECT epc, id, ts, day, location, process,
+                       LAG(location) OVER w AS prev_loc,
+                       LAG(process)  OVER w AS prev_proc,
+                       LAG(ts)       OVER w AS prev_ts,
+                       MAX(process = 'DECOMMISSION') OVER (w ROWS BETWEEN UNBOUNDED PRECEDING
+                                                           AND 1 PRECEDING) AS retired
+                FROM events WHERE process != 'INIT'
+                WINDOW w AS (PARTITION BY epc ORDER BY ts, id)
+            ),
+            firsts AS (
+                SELECT epc, location AS first_loc, id AS first_id, MIN(ts)
+                FROM events WHERE process != 'INIT' GROUP BY epc
+            ),
+            ins AS (
+                SELECT epc, id, ts, day, location,
+                       LAG(location) OVER (PARTITION BY epc ORDER BY ts, id) AS prev_in
+                FROM events WHERE process = 'IN'
+            ),
+            moves AS (
+                SELECT ins.epc, ins.id, ins.ts, ins.day, ins.location,
+                       COALESCE(ins.prev_in, f.first_loc) AS prev
+                FROM ins JOIN firsts f ON f.epc = ins.epc
+                WHERE ins.id != f.first_id
+            )
+            SELECT epc, '{RULE_SKIPPED_LAUNDRY}', day, location, ts, id FROM moves
+             WHERE prev GLOB 'Ward*' AND location = '{STORAGE}'
+            UNION ALL
+            SELECT epc, '{RULE_SKIPPED_WASH}', day, location, ts, id FROM moves
+             WHERE prev = '{NEW_LINEN}' AND location GLOB 'Ward*'
+            UNION ALL
+            SELECT epc, '{RULE_AFTER_RETIRED}', day, location, ts, id FROM scans WHERE retired
+            UNION ALL
+            SELECT epc, '{RULE_DUPLICATE}', day, location, ts, id FROM scans
+             WHERE prev_proc = process AND prev_loc = location AND ts - prev_ts <= {DUPLICATE_READ_S}
+            UNION ALL
+            {missing_out}
+            ORDER BY 5, 6
+        """)]
+
+    def completed_dwells(self):
+        """
+        (location, dwell minutes, count) of completed stays: an OUT whose
+        previous scan of the towel is an IN at the same location.
+        """
+        return self.conn.execute(f"""
+            WITH scans AS (
+                SELECT location, process, ts,
+                       LAG(location) OVER w AS prev_loc,
+                       LAG(process)  OVER w AS prev_proc,
+                       LAG(ts)       OVER w AS prev_ts
+                FROM events WHERE process != 'INIT'
+                WINDOW w AS (PARTITION BY epc ORDER BY ts, id)
+            )
+            SELECT location, CAST((ts - prev_ts) / {DWELL_RESOLUTION_S} + 0.5 AS INTEGER) AS minutes, COUNT(*)
+            FROM scans
+            WHERE process = 'OUT' AND prev_proc = 'IN' AND prev_loc = location
+            GROUP BY location, minutes
+        """)
+
+    def recent_events(self, latest):
+        """Non-INIT scans in the recent window (at least RECENT_ACTIVITY_ROWS)."""
+        in_window = self.conn.execute(
+            "SELECT COUNT(*) FROM events WHERE ts >= ? AND process != 'INIT'",
+            (latest - RECENT_WINDOW_S,)).fetchone()[0]
+        rows = self.conn.execute(
+            "SELECT ts, epc, location, process, staff, device FROM events"
+            " WHERE process != 'INIT' ORDER BY ts DESC, id DESC LIMIT ?",
+            (max(in_window, RECENT_ACTIVITY_ROWS),)).fetchall()
+        return deque(reversed(rows))
+
+    def aggregator(self):
+        """A DashboardAggregator holding the fold state, built from SQL queries."""
+        agg = DashboardAggregator()
+        latest, count = self.conn.execute("SELECT MAX(ts), COUNT(*) FROM events").fetchone()
+        agg.latest, agg.event_count = latest or 0.0, count
+        agg.init_meta = self.init_meta()
+        agg.retire_at = self.retire_at()
+        for (epc, loc, proc, last_in, desc, laundry_ins, final_cycles, seen, decomm,
+             first_scan, last_scan, last_loc) in self.item_states():
+            agg.items[epc] = ItemState(agg.code(loc), agg.code(proc), last_in, agg.code(desc or ""),
+                                       laundry_ins, final_cycles, seen, bool(decomm), first_scan,
+                                       last_scan, agg.code(last_loc))
+        agg.usage_by_ward_date = self.daily_ward_usage()
+        agg.wards = set(agg.usage_by_ward_date)
+        for by_day in agg.usage_by_ward_date.values():
+            for day, n in by_day.items():
+                agg.usage_by_date[day] = agg.usage_by_date.get(day, 0) + n
+        agg.compliance_alerts = self.compliance_alerts()
+        for loc, minutes, n in self.completed_dwells():
+            agg.add_completed_dwell(loc, minutes * DWELL_RESOLUTION_S, n)
+        agg.decomm_times = deque(self.decommission_times(agg.latest - DECOMM_WINDOW_S))
+        agg.recent = self.recent_events(agg.latest)
+        return agg
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest event files into the SQLite event store.")
+    parser.add_argument("store", help="SQLite database file (created if missing)")
+    parser.add_argument("sources", nargs="+",
+                        help="event files: JSON array, .ndjson, or reader export (.csv / .js)")
+    args = parser.parse_args(argv)
+
+    with EventStore(args.store) as store:
+        for path in args.sources:
+            added = store.ingest(iter_source_events(path))
+            print(f"{path}: {added:,} new events")
+        print(f"{args.store}: {store.count():,} events stored")
+
+
+if __name__ == "__main__":
+    main()
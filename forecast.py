@@ -0,0 +1,150 @@
+"""
+forecast.py
+Chart 6 usage forecast, fitted at build time so the page only draws it.
+
+Each series (the fleet total and every ward's daily ward-IN count) gets an
+additive Holt-Winters model: level, trend and a weekly season.  The
+smoothing parameters are picked from a fixed grid by one-step-ahead squared
+error, so the same history always gives the same forecast (nothing is
+sampled).  Prediction intervals come from the one-step residuals, widened
+per horizon step as for the equivalent ETS(A,A,A) model.  Series shorter
+than two weeks fall back to their mean.
+"""
+from datetime import date, timedelta
+from math import sqrt
+
+SEASON_DAYS   = 7
+FORECAST_DAYS = 60
+HISTORY_DAYS  = 60           # history drawn next to the forecast
+FIT_DAYS      = 26 * 7       # most recent complete days the model is fitted on
+SMOOTH_DAYS   = 7            # trailing average ("Avg Daily Ward IN Events")
+
+# Smoothing parameter grid (level, trend, season)
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7)
+BETAS  = (0.0, 0.01, 0.05, 0.1)
+GAMMAS = (0.05, 0.1, 0.2, 0.4)
+
+INTERVALS = {"80": 1.2816, "95": 1.9600}   # two-sided normal quantiles
+
+
+def rolling_mean(values, window):
+    """Trailing mean of each point over up to `window` points (running sum, O(n))."""
+    out, total = [], 0
+    for i, v in enumerate(values):
+        total += v
+        if i >= window:
+            total -= values[i - window]
+        out.append(total / min(i + 1, window))
+    return out
+
+
+def holt_winters(series, alpha, beta, gamma, period=SEASON_DAYS):
+    """
+    One pass of additive Holt-Winters over `series`.  Returns (sse, residuals,
+    level, trend, season) with `season` indexed by day position mod `period`.
+    The first season initialises the level and seasonal offsets, the first
+    two the trend; one-step errors are collected from the second season on.
+    """
+    first = sum(series[:period]) / period
+    second = sum(series[period:2 * period]) / period
+    level, trend = first, (second - first) / period
+    season = [y - first for y in series[:period]]
+    sse, residuals = 0.0, []
+    for t in range(period, len(series)):
+        y, s = series[t], season[t % period]
+        error = y - (level + trend + s)
+        sse += error * error
+        residuals.append(error)
+        new_level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        season[t % period] = gamma * (y - new_level) + (1 - gamma) * s
+        level = new_level
+    return sse, residuals, level, trend, season
+
+
+def fit(series, period=SEASON_DAYS):
+    """
+    Best grid parameters for `series` as a model dict; ties keep the first
+    (smoothest) candidate, so the choice is stable.
+    """
+    if len(series) < 2 * period:
+        mean = sum(series) / len(series) if series else 0.0
+        spread = sqrt(sum((y - mean) ** 2 for y in series) / max(1, len(series) - 1))
+        return {"method": "mean", "level": mean, "trend": 0.0, "season": [0.0] * period,
+                "alpha": 0.0, "beta": 0.0, "gamma": 0.0, "sigma": spread, "n": len(series)}
+    best = None
+    for alpha in ALPHAS:
+        for beta in BETAS:
+            for gamma in GAMMAS:
+                sse, residuals, level, trend, season = holt_winters(series, alpha, beta, gamma, period)
+                if best is None or sse < best[0]:
+                    best = (sse, residuals, level, trend, season, alpha, beta, gamma)
+    sse, residuals, level, trend, season, alpha, beta, gamma = best
+    return {"method": "holt-winters", "level": level, "trend": trend, "season": season,
+            "alpha": alpha, "beta": beta, "gamma": gamma,
+            "sigma": sqrt(sse / len(residuals)), "n": len(series)}
+
+
+def project(model, horizon=FORECAST_DAYS, period=SEASON_DAYS):
+    """
+    Mean forecast and prediction bounds for days 1..horizon after the fitted
+    series, clipped at zero (usage is a count).  Bound h uses the ETS(A,A,A)
+    variance sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha(1 + j beta) +
+    gamma(1 - alpha) on whole seasons.
+    """
+    n, alpha, beta = model["n"], model["alpha"], model["beta"]
+    gamma = model["gamma"] * (1 - alpha)
+    out = {"mean": []}
+    out.update({f"{side}{level}": [] for level in INTERVALS for side in ("lo", "hi")})
+    spread = 0.0
+    for h in range(1, horizon + 1):
+        if h > 1:
+            j = h - 1
+            c = alpha * (1 + j * beta) + (gamma if j % period == 0 else 0.0)
+            spread += c * c
+        mean = model["level"] + h * model["trend"] + model["season"][(n - 1 + h) % period]
+        sd = model["sigma"] * sqrt(1 + spread)
+        out["mean"].append(round(max(0.0, mean), 1))
+        for level, z in INTERVALS.items():
+            out[f"lo{level}"].append(round(max(0.0, mean - z * sd), 1))
+            out[f"hi{level}"].append(round(max(0.0, mean + z * sd), 1))
+    return out
+
+
+def series_forecast(counts, horizon=FORECAST_DAYS):
+    """History window, its trailing average and the fitted forecast of one daily series."""
+    model = fit(counts[-FIT_DAYS:])
+    block = {
+        "history": counts[-HISTORY_DAYS:],
+        "rolling": [round(v, 2) for v in rolling_mean(counts, SMOOTH_DAYS)[-HISTORY_DAYS:]],
+        "model":   {key: round(model[key], 4) for key in ("alpha", "beta", "gamma", "sigma")},
+    }
+    block["model"]["method"] = model["method"]
+    block.update(project(model, horizon))
+    return block
+
+
+def usage_forecast(usage, snapshot_date, horizon=FORECAST_DAYS):
+    """
+    Chart 6 block from dense_daily_usage() columns.  Only complete days
+    (before `snapshot_date`, a date) are used; the forecast starts on the day
+    after the last one.
+    """
+    if not usage["start"]:
+        start = snapshot_date
+        complete = 0
+    else:
+        start = date.fromisoformat(usage["start"])
+        complete = max(0, min(usage["days"], (snapshot_date - start).days))
+    first_forecast = start + timedelta(days=complete)
+    history_days = min(complete, HISTORY_DAYS)
+    total = usage["total"][:complete]
+    return {
+        "historyStart": (first_forecast - timedelta(days=history_days)).isoformat(),
+        "start":        first_forecast.isoformat(),
+        "days":         horizon,
+        "avgDaily":     round(rolling_mean(total, SMOOTH_DAYS)[-1], 2) if total else 0.0,
+        "total":        series_forecast(total, horizon),
+        "byWard":       {ward: series_forecast(counts[:complete], horizon)
+                         for ward, counts in usage["byWard"].items()},
+    }
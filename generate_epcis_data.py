@@ -1,7 +1,18 @@
-import uuid
+import argparse
+import heapq
 import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
 from datetime import datetime, timedelta
 import json
+from json.encoder import encode_basestring_ascii
+
+from epcis_io import ChronologicalWriter
+from site_config import SITE_FIELD, load_sites
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -23,6 +34,7 @@ HARDCODE_OVERDUE_NOT_RETIRED = 3
 # EPCIS Constants
 GTIN_TOWEL = "08901030000005"
 APP_ID     = "LinenTrack-v2.1"
+ITEM_DESC  = "Bath Towel - Large"
 
 # ---------------------------------------------------------------------------
 # 4 Wards (5 beds per ward -> 20 beds total)
@@ -30,6 +42,11 @@ APP_ID     = "LinenTrack-v2.1"
 WARDS = [str(ward_no) for ward_no in range(1, 5)]
 # e.g. 1, 2, 3, 4
 
+# Multi-site runs (--sites): the site being simulated and its SGTIN item
+# reference; single-site output carries no "Site ID" and item reference 00000
+SITE_ID  = None
+ITEM_REF = 0
+
 def ward_location(ward_id):
     return f"Ward {ward_id}"
 
@@ -39,6 +56,7 @@ STATIC_DEVICES = {
     "Laundry Department":       "RD-WASH-01",
     "Cleaned Linen Department": "RD-STORE-01",
 }
+@lru_cache(maxsize=None)
 def device_for(location):
     if location in STATIC_DEVICES:
         return STATIC_DEVICES[location]
@@ -51,16 +69,26 @@ STAFF_LAUNDRY = ["S-201", "S-202", "S-203", "S-204"]
 STAFF_STORE   = ["S-301", "S-302"]
 # Ward staff pool per ward (ward 1 = S-4xx, ward 2 = S-5xx, etc.)
 def ward_staff(ward_id):
-    ward_no = int(ward_id)          # 1-4
+    ward_no = WARDS.index(ward_id) + 1   # 1-based slot; ids may be "5C" etc.
     base = 400 + (ward_no - 1) * 10
     return [f"S-{base+i}" for i in range(1, 5)]
 
-def staff_for(location):
-    if location == "New Linen Department":     return random.choice(STAFF_NEW)
-    if location == "Laundry Department":       return random.choice(STAFF_LAUNDRY)
-    if location == "Cleaned Linen Department": return random.choice(STAFF_STORE)
+def staff_pool(location):
+    if location == "New Linen Department":     return STAFF_NEW
+    if location == "Laundry Department":       return STAFF_LAUNDRY
+    if location == "Cleaned Linen Department": return STAFF_STORE
     ward_id = location.replace("Ward ", "")
-    return random.choice(ward_staff(ward_id))
+    return ward_staff(ward_id)
+
+# Location -> staff pool, filled on first use (ward pools depend on WARDS,
+# so apply_settings() clears it)
+STAFF_POOLS = {}
+
+def staff_for(location, rng=random):
+    pool = STAFF_POOLS.get(location)
+    if pool is None:
+        pool = STAFF_POOLS[location] = staff_pool(location)
+    return rng.choice(pool)
 
 # ---------------------------------------------------------------------------
 # Dwell Time Rules  (min_hours, max_hours) - TOWEL SPEED
@@ -71,20 +99,20 @@ DWELL_STORE   = (12,  48)
 DWELL_WARD    = (6,   18)    # towels swap fast
 LAUNDRY_QUEUE_DELAY = (0.5, 6.0)  # capacity bottleneck wait before wash starts
 
-def dwell_for(location, anomaly_roll):
+def dwell_for(location, anomaly_roll, rng=random):
     if location == "New Linen Department":
-        h = random.uniform(*DWELL_NEW)
-        if anomaly_roll < 0.03: h = random.uniform(48, 96)
+        h = rng.uniform(*DWELL_NEW)
+        if anomaly_roll < 0.03: h = rng.uniform(48, 96)
     elif location == "Laundry Department":
-        h = random.uniform(*DWELL_LAUNDRY)
-        h += random.uniform(*LAUNDRY_QUEUE_DELAY)
-        if anomaly_roll < 0.04: h = random.uniform(24, 48)
+        h = rng.uniform(*DWELL_LAUNDRY)
+        h += rng.uniform(*LAUNDRY_QUEUE_DELAY)
+        if anomaly_roll < 0.04: h = rng.uniform(24, 48)
     elif location == "Cleaned Linen Department":
-        h = random.uniform(*DWELL_STORE)
-        if anomaly_roll < 0.05: h = random.uniform(5*24, 7*24)
+        h = rng.uniform(*DWELL_STORE)
+        if anomaly_roll < 0.05: h = rng.uniform(5*24, 7*24)
     else:  # Ward
-        h = random.uniform(*DWELL_WARD)
-        if anomaly_roll < 0.04: h = random.uniform(48, 72)
+        h = rng.uniform(*DWELL_WARD)
+        if anomaly_roll < 0.04: h = rng.uniform(48, 72)
     return h
 
 # ---------------------------------------------------------------------------
@@ -92,49 +120,65 @@ def dwell_for(location, anomaly_roll):
 # ---------------------------------------------------------------------------
 # Event factory
 # ---------------------------------------------------------------------------
+UUID4_CLEAR = ~((0xF000 << 64) | (0xC000 << 48))   # version and variant bits
+UUID4_SET   = (0x4000 << 64) | (0x8000 << 48)
+
+def new_guid(rng=random):
+    """UUID4-shaped GUID drawn from `rng`, so seeded runs are reproducible.
+    Formatted directly: the same string as str(uuid.UUID(int=..., version=4))."""
+    h = "%032x" % (rng.getrandbits(128) & UUID4_CLEAR | UUID4_SET)
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
 def make_event(timestamp, epc, location, process, item_desc, gtin, job_id,
-               extra=None):
+               extra=None, rng=random):
+    return event_dict(new_guid(rng), timestamp.isoformat() + "Z", job_id, staff_for(location, rng),
+                      location, process, epc, extra, item_desc, gtin)
+
+def event_dict(guid, timestamp, job_id, staff, location, process, epc, extra=None,
+               item_desc=ITEM_DESC, gtin=GTIN_TOWEL):
     ev = {
-        "Event GUID":      str(uuid.uuid4()),
-        "Event Timestamp": timestamp.isoformat() + "Z",
+        "Event GUID":      guid,
+        "Event Timestamp": timestamp,
         "Job ID":          job_id,
         "RFID Device ID":  device_for(location),
         "Android App ID":  APP_ID,
-        "Staff ID":        staff_for(location),
+        "Staff ID":        staff,
         "Location":        location,
         "Process":         process,
         "Item Description": item_desc,
         "GTIN":            gtin,
         "EPC":             epc,
     }
+    if SITE_ID is not None:
+        ev[SITE_FIELD] = SITE_ID
     if extra:
         ev.update(extra)
     return ev
 
 # ---------------------------------------------------------------------------
 # Simulate one item.
-# Returns (list_of_events, decommission_time_or_None)
+# Generator: yields the item's events in chronological order and returns
+# decommission_time_or_None (see simulate_work_item()).
 # Items whose dwell extends past SIM_END are left with an OPEN IN (no OUT),
 # making them "currently in that stage" at the snapshot date.
 # ---------------------------------------------------------------------------
 SIM_END = START_DATE + timedelta(days=DAYS)
 
 def simulate_item(epc, initial_cycles, home_ward, start_time, start_loc_idx, retire_at,
-                  is_ghost=False, ghost_day=9999):
+                  is_ghost=False, ghost_day=9999, rng=random):
     item_desc = "Bath Towel - Large"
     gtin      = GTIN_TOWEL
-    evs       = []
     current_time = start_time
     cycles    = initial_cycles
     loc_idx   = start_loc_idx
 
     # INIT meta-event
-    evs.append(make_event(
+    yield make_event(
         current_time - timedelta(minutes=1),
         epc, "New Linen Department", "INIT", item_desc, gtin,
-        str(uuid.uuid4()),
-        extra={"Initial Cycles": initial_cycles, "Home Ward": home_ward}
-    ))
+        new_guid(rng),
+        extra={"Initial Cycles": initial_cycles, "Home Ward": home_ward}, rng=rng
+    )
 
     decommission_time = None
 
@@ -148,7 +192,7 @@ def simulate_item(epc, initial_cycles, home_ward, start_time, start_loc_idx, ret
         elif r == 2:
             location = "Cleaned Linen Department"
         else:
-            location = ward_location(random.choice(WARDS)) if random.random() < 0.10 else home_ward
+            location = ward_location(rng.choice(WARDS)) if rng.random() < 0.10 else home_ward
 
         # Ghost disappears silently
         if is_ghost and (current_time - START_DATE).days > ghost_day:
@@ -156,21 +200,21 @@ def simulate_item(epc, initial_cycles, home_ward, start_time, start_loc_idx, ret
 
         # Retirement check — emit DECOMMISSION event
         if cycles >= retire_at:
-            evs.append(make_event(
+            yield make_event(
                 current_time, epc, location, "DECOMMISSION", item_desc, gtin,
-                str(uuid.uuid4()),
-                extra={"Final Cycles": cycles, "Reason": "End of Life"}
-            ))
+                new_guid(rng),
+                extra={"Final Cycles": cycles, "Reason": "End of Life"}, rng=rng
+            )
             decommission_time = current_time
             break
 
-        job_id = str(uuid.uuid4())
+        job_id = new_guid(rng)
 
         # IN event — item enters stage
-        evs.append(make_event(current_time, epc, location, "IN", item_desc, gtin, job_id))
+        yield make_event(current_time, epc, location, "IN", item_desc, gtin, job_id, rng=rng)
 
-        anom = random.random()
-        dwell_h = dwell_for(location, anom)
+        anom = rng.random()
+        dwell_h = dwell_for(location, anom, rng)
         current_time += timedelta(hours=dwell_h)
 
         # If dwell extends past SIM_END, leave as open IN (currently in stage)
@@ -178,10 +222,10 @@ def simulate_item(epc, initial_cycles, home_ward, start_time, start_loc_idx, ret
             break
 
         # OUT event — item leaves stage
-        evs.append(make_event(current_time, epc, location, "OUT", item_desc, gtin, job_id))
+        yield make_event(current_time, epc, location, "OUT", item_desc, gtin, job_id, rng=rng)
 
         # Transit gap
-        current_time += timedelta(minutes=random.randint(15, 120))
+        current_time += timedelta(minutes=rng.randint(15, 120))
 
         # Next location
         next_idx = (loc_idx + 1) % 4
@@ -191,7 +235,7 @@ def simulate_item(epc, initial_cycles, home_ward, start_time, start_loc_idx, ret
             next_idx = 1
 
         # Compliance anomalies
-        skip = random.random()
+        skip = rng.random()
         if location == home_ward and skip < 0.03:
             next_idx = 2   # skip laundry: Ward → Storage
         elif location == "New Linen Department" and skip < 0.02:
@@ -202,131 +246,724 @@ def simulate_item(epc, initial_cycles, home_ward, start_time, start_loc_idx, ret
 
         loc_idx = next_idx
 
-    return evs, decommission_time
+    return decommission_time
 
-# ---------------------------------------------------------------------------
-# Generate events — fleet management with replenishment
-# ---------------------------------------------------------------------------
-events        = []
-item_counter  = NUM_ITEMS + 1   # EPCs for replacement items start here
-total_items   = NUM_ITEMS       # track total unique items ever
-
-# Work queue: list of (epc, initial_cycles, home_ward, start_time, loc_idx, retire_at, is_ghost, ghost_day)
-WorkItem = dict
-
-queue = []
-for i in range(1, NUM_ITEMS + 1):
-    rv = random.random()
-    if   rv < 0.10: cycles = 0
-    elif rv < 0.65: cycles = random.randint(20, 60)
-    elif rv < 0.88: cycles = random.randint(61, 75)
-    else:           cycles = random.randint(76, 85)
-
-    queue.append({
-        "epc":            f"urn:epc:id:sgtin:0890103.00000.{i:05d}",
-        "initial_cycles": cycles,
-        "home_ward":      ward_location(random.choice(WARDS)),
-        "start_time":     START_DATE + timedelta(hours=random.randint(0, 72)),
-        "loc_idx":        0 if cycles == 0 else random.choice([1, 2, 3]),
-        "retire_at":      100,
-        "is_ghost":       random.random() < 0.02,
-        "ghost_day":      random.randint(30, 200),
-    })
-
-while queue:
-    wi = queue.pop(0)
-
-    item_evs, decomm_time = simulate_item(
+
+def item_rng(seed, epc):
+    """Per-EPC random stream: an item's events depend only on (seed, EPC),
+    never on which worker simulated it or in what order."""
+    return random.Random(f"{seed}:{epc}")
+
+
+def simulate_work_item(wi):
+    """
+    Simulate one work item.  Returns (list_of_events, decommission_time_or_None,
+    replacement_or_None); a replacement work item is returned without an EPC,
+    which the caller assigns in fleet order so numbering stays deterministic.
+    """
+    rng = item_rng(wi["seed"], wi["epc"])
+    item_run = simulate_item(
         wi["epc"], wi["initial_cycles"], wi["home_ward"],
         wi["start_time"], wi["loc_idx"], wi["retire_at"],
-        wi["is_ghost"], wi["ghost_day"]
+        wi["is_ghost"], wi["ghost_day"], rng
     )
-    events.extend(item_evs)
+    evs = []
+    try:
+        while True:
+            evs.append(next(item_run))
+    except StopIteration as done:
+        decomm_time = done.value
 
     # Replenish: schedule a new towel to arrive 1–7 days after decommission.
     # Only original-fleet items trigger replenishment — no cascading replacements.
+    replacement = None
     if decomm_time is not None and not wi.get("is_replacement", False):
-        arrival = decomm_time + timedelta(days=random.randint(1, 7))
+        arrival = decomm_time + timedelta(days=rng.randint(1, 7))
         if arrival < SIM_END - timedelta(days=14):   # only worth adding if >2 weeks remain
-            new_epc = f"urn:epc:id:sgtin:0890103.00000.{item_counter:05d}"
-            item_counter += 1
-            total_items  += 1
-            queue.append({
-                "epc":            new_epc,
+            replacement = {
+                "seed":           wi["seed"],
                 "initial_cycles": 0,
-                "home_ward":      ward_location(random.choice(WARDS)),
+                "home_ward":      ward_location(rng.choice(WARDS)),
                 "start_time":     arrival,
                 "loc_idx":        0,    # always starts at New Linen
                 "retire_at":      100,  # fresh stock retires at 100
                 "is_ghost":       False,
                 "ghost_day":      9999,
                 "is_replacement": True, # prevents further cascading
-            })
+            }
+    return evs, decomm_time, replacement
+
+# ---------------------------------------------------------------------------
+# Generate events — fleet management with replenishment
+# ---------------------------------------------------------------------------
+def epc_for(serial):
+    return f"urn:epc:id:sgtin:0890103.{ITEM_REF:05d}.{serial:05d}"
+
+
+def initial_fleet(seed):
+    """Work items for the starting fleet, with a heterogeneous age mix."""
+    rng = random.Random(f"{seed}:fleet")
+    fleet = []
+    for i in range(1, NUM_ITEMS + 1):
+        rv = rng.random()
+        if   rv < 0.10: cycles = 0
+        elif rv < 0.65: cycles = rng.randint(20, 60)
+        elif rv < 0.88: cycles = rng.randint(61, 75)
+        else:           cycles = rng.randint(76, 85)
+
+        fleet.append({
+            "seed":           seed,
+            "epc":            epc_for(i),
+            "initial_cycles": cycles,
+            "home_ward":      ward_location(rng.choice(WARDS)),
+            "start_time":     START_DATE + timedelta(hours=rng.randint(0, 72)),
+            "loc_idx":        0 if cycles == 0 else rng.choice([1, 2, 3]),
+            "retire_at":      100,
+            "is_ghost":       rng.random() < 0.02,
+            "ghost_day":      rng.randint(30, 200),
+        })
+    return fleet
+
+
+def current_settings():
+    return NUM_ITEMS, DAYS, START_DATE, WARDS, SITE_ID, ITEM_REF
+
+
+def apply_settings(num_items, days, start_date, wards, site_id=None, item_ref=0):
+    # Also the Pool initializer: worker processes may be spawned fresh, so
+    # the CLI overrides and the current site are re-applied there.
+    global NUM_ITEMS, DAYS, START_DATE, SIM_END, WARDS, SITE_ID, ITEM_REF
+    NUM_ITEMS, DAYS, START_DATE = num_items, days, start_date
+    SIM_END = START_DATE + timedelta(days=DAYS)
+    WARDS, SITE_ID, ITEM_REF = list(wards), site_id, item_ref
+    STAFF_POOLS.clear()
+
+
+@contextmanager
+def item_mapper(workers):
+    """Ordered map of simulate_work_item, in-process or over a process pool."""
+    if workers <= 1:
+        yield lambda work: map(simulate_work_item, work)
+        return
+    with Pool(workers, initializer=apply_settings, initargs=current_settings()) as pool:
+        yield lambda work: pool.imap(simulate_work_item, work,
+                                     chunksize=max(1, len(work) // (workers * 8)))
+
+
+def iter_item_runs(stats, seed, workers=1):
+    """
+    Yields one chronologically ordered event list per simulated item: the
+    starting fleet, replenishment towels, then the frontend test injections.
+    Output depends only on `seed`, not on `workers`.
+    `stats` collects item and decommission counts for the summary.
+    """
+    item_counter = NUM_ITEMS + 1   # EPCs for replacement items start here
+    stats["total_items"] = NUM_ITEMS
+    stats["decommissions"] = 0
+
+    with item_mapper(workers) as map_items:
+        # Wave 1: original fleet.  Replacement EPCs are numbered in fleet
+        # order as results come back (imap preserves input order).
+        replacements = []
+        for item_evs, decomm_time, replacement in map_items(initial_fleet(seed)):
+            yield item_evs
+            if decomm_time is not None:
+                stats["decommissions"] += 1
+            if replacement is not None:
+                replacement["epc"] = epc_for(item_counter)
+                item_counter += 1
+                stats["total_items"] += 1
+                replacements.append(replacement)
+
+        # Wave 2: replacement towels (never replenished themselves)
+        for item_evs, decomm_time, _ in map_items(replacements):
+            yield item_evs
+            if decomm_time is not None:
+                stats["decommissions"] += 1
+
+    if FRONTEND_TEST_HARDCODE:
+        for run in hardcoded_test_runs(item_counter, random.Random(f"{seed}:frontend-test")):
+            stats["total_items"] += 1
+            yield run
+
+
+def iter_site_runs(stats, seed, sites, days, start_date, workers=1, engine="python"):
+    """
+    iter_item_runs() for every configured site in turn, each with its own
+    fleet size, wards, item reference and seed stream ("<seed>:<site id>").
+    `stats["sites"]` collects the per-site summaries.
+    """
+    stats["sites"] = {}
+    for site in sites:
+        apply_settings(site["items"], days, start_date, site["wards"], site["id"], site["item_ref"])
+        site_stats = stats["sites"][site["id"]] = {}
+        yield from ENGINES[engine](site_stats, f"{seed}:{site['id']}", workers)
+    stats["total_items"] = sum(s["total_items"] for s in stats["sites"].values())
+    stats["decommissions"] = sum(s["decommissions"] for s in stats["sites"].values())
+
+
+def iter_vector_runs(stats, seed, workers=1):
+    """
+    iter_item_runs() on the NumPy engine (vector_sim.py): the whole fleet is
+    simulated in lock-step and streamed as chronological runs.  `workers` is
+    unused; the kernel is vectorized instead.
+    """
+    try:
+        import vector_sim
+    except ImportError:
+        raise SystemExit("--engine numpy requires NumPy (pip install numpy)")
+
+    events = vector_sim.simulate_fleet(stats, seed, NUM_ITEMS, DAYS, len(WARDS))
+    locations = (["New Linen Department", "Laundry Department", "Cleaned Linen Department"]
+                 + [ward_location(w) for w in WARDS])
+    staff_pools = [STAFF_NEW, STAFF_LAUNDRY, STAFF_STORE] + [ward_staff(w) for w in WARDS]
+    # Runs of encoded lines: the NumPy columns are formatted straight to JSON
+    yield from vector_sim.iter_event_lines(events, seed, START_DATE, locations, staff_pools,
+                                           epc_for, SITE_ID)
+
+    if FRONTEND_TEST_HARDCODE:
+        for run in hardcoded_test_runs(stats["next_serial"], random.Random(f"{seed}:frontend-test")):
+            stats["total_items"] += 1
+            yield run
+
+
+# ---------------------------------------------------------------------------
+# Discrete-event laundry model (--engine des)
+# One event queue for the whole fleet.  Laundry is a shared pool of machines:
+# a towel's IN at Laundry puts it in the wash queue, a machine takes a load of
+# up to LAUNDRY_BATCH_SIZE towels (or a partial load once the oldest towel has
+# waited BATCH_MAX_WAIT hours), and every towel of the load gets its OUT when
+# the wash ends.  Queueing delay therefore comes from contention instead of
+# LAUNDRY_QUEUE_DELAY.  The other stages follow simulate_item().
+# ---------------------------------------------------------------------------
+LAUNDRY_MACHINES   = None       # washer/dryer lines shared by the site (None: laundry_machines())
+TOWELS_PER_MACHINE = 125        # towels one line serves at ~70% busy (full loads, ~60 h cycle)
+MIN_MACHINES       = 4          # partial loads on the BATCH_MAX_WAIT timer keep small fleets busy
+SATURATED          = 0.95       # utilization at which the run summary warns
+LAUNDRY_BATCH_SIZE = 25         # towels per load
+WASH_HOURS         = (4, 8)     # wash + dry + fold per load
+BATCH_MAX_WAIT     = 1.0        # hours before a partial load runs anyway
+REWASH_RATE        = 0.04       # towels failing inspection go back in the queue
+
+# Scheduler event kinds
+EV_INIT, EV_ARRIVE, EV_LEAVE, EV_WASH_DONE, EV_LOAD_TIMER = range(5)
+
+
+class Towel:
+    __slots__ = ("epc", "cycles", "home_ward", "loc_idx", "location", "retire_at",
+                 "ghost_day", "is_replacement", "job_id", "queued_at")
+
+    def __init__(self, wi):
+        self.epc            = wi["epc"]
+        self.cycles         = wi["initial_cycles"]
+        self.home_ward      = wi["home_ward"]
+        self.loc_idx        = wi["loc_idx"]
+        self.retire_at      = wi["retire_at"]
+        self.ghost_day      = wi["ghost_day"] if wi["is_ghost"] else None
+        self.is_replacement = wi.get("is_replacement", False)
+        self.location       = None
+        self.job_id         = None
+        self.queued_at      = 0.0
+
+
+def laundry_machines(fleet):
+    """Default machine pool for a starting fleet: enough lines that the pool
+    is not saturated, so queueing stays a bottleneck instead of a backlog."""
+    return max(MIN_MACHINES, -(-fleet // TOWELS_PER_MACHINE))
+
+
+class LaundryModel:
+    """
+    Heap-scheduled simulation of the fleet.  Times are float hours since
+    START_DATE; events come out of the queue in time order, so the emitted
+    EPCIS events are chronological without a merge.  They are emitted as
+    encoded lines (encoded_line_template()), not event dicts.
+    """
+
+    def __init__(self, seed, machines, batch_size):
+        self.rng            = random.Random(f"{seed}:laundry")
+        self.end            = DAYS * 24.0
+        self.machines       = machines
+        self.free_machines  = machines
+        self.batch_size     = batch_size
+        self.schedule       = []           # heap of (hours, seq, kind, payload)
+        self.seq            = 0
+        self.wash_queue     = deque()      # towels waiting for a machine
+        self.timer_at       = None         # pending partial-load timer
+        self.emitted        = []
+        self.item_counter   = NUM_ITEMS + 1
+        self.stats          = {"total_items": NUM_ITEMS, "decommissions": 0}
+        self.loads, self.load_sizes, self.waits, self.busy_hours = 0, 0, [], 0.0
+        self.max_queue      = 0
+        self.line           = encoded_line_template("%sZ")
+        self.tail           = event_tail(SITE_ID)
+        self.encoded        = {}           # location -> (device, staff pool, location) as JSON
+
+    def at(self, hours, kind, payload=None):
+        heapq.heappush(self.schedule, (hours, self.seq, kind, payload))
+        self.seq += 1
+
+    def event(self, hours, towel, location, process, job_id, extra=None):
+        # Same draws in the same order as make_event(): GUID, then staff
+        encoded = self.encoded.get(location)
+        if encoded is None:
+            encoded = self.encoded[location] = (
+                json_string(device_for(location)), [json_string(staff) for staff in staff_pool(location)],
+                json_string(location))
+        device, staff, where = encoded
+        stamp = (START_DATE + timedelta(hours=hours)).isoformat()
+        self.emitted.append(self.line % (
+            stamp, new_guid(self.rng), stamp, job_id, device, self.rng.choice(staff), where,
+            json_string(process), json_string(towel.epc), event_tail(SITE_ID, extra) if extra else self.tail))
+
+    def add_towel(self, wi, start_hours):
+        self.at(start_hours - 1 / 60, EV_INIT, Towel(wi))
+
+    # ── Stages ────────────────────────────────────────────────────────────
+    def init(self, t, towel):
+        self.event(t, towel, "New Linen Department", "INIT", new_guid(self.rng),
+                   {"Initial Cycles": towel.cycles, "Home Ward": towel.home_ward})
+        self.at(t + 1 / 60, EV_ARRIVE, towel)
+
+    def arrive(self, t, towel):
+        rng = self.rng
+        r = towel.loc_idx % 4
+        if r == 0:
+            location = "New Linen Department"
+        elif r == 1:
+            location = "Laundry Department"
+        elif r == 2:
+            location = "Cleaned Linen Department"
+        else:
+            location = ward_location(rng.choice(WARDS)) if rng.random() < 0.10 else towel.home_ward
+
+        if towel.ghost_day is not None and int(t // 24) > towel.ghost_day:
+            return                                    # ghost disappears silently
+        if towel.cycles >= towel.retire_at:
+            self.event(t, towel, location, "DECOMMISSION", new_guid(rng),
+                       {"Final Cycles": towel.cycles, "Reason": "End of Life"})
+            self.stats["decommissions"] += 1
+            if not towel.is_replacement:
+                self.replenish(t)
+            return
+
+        towel.location, towel.job_id = location, new_guid(rng)
+        self.event(t, towel, location, "IN", towel.job_id)
+        if location == "Laundry Department":
+            self.enqueue(t, towel)
+        else:
+            self.at(t + dwell_for(location, rng.random(), rng), EV_LEAVE, towel)
+
+    def leave(self, t, towel):
+        rng = self.rng
+        location = towel.location
+        self.event(t, towel, location, "OUT", towel.job_id)
+        t += rng.randint(15, 120) / 60               # transit gap
+
+        next_idx = (towel.loc_idx + 1) % 4
+        if location.startswith("Ward") and towel.cycles > 0 and next_idx == 0:
+            next_idx = 1
+        skip = rng.random()
+        if location == towel.home_ward and skip < 0.03:
+            next_idx = 2
+        elif location == "New Linen Department" and skip < 0.02:
+            next_idx = 3
+        if next_idx == 1:
+            towel.cycles += 1
+        towel.loc_idx = next_idx
+        self.at(t, EV_ARRIVE, towel)
+
+    def replenish(self, t):
+        arrival = t + self.rng.randint(1, 7) * 24
+        if arrival >= self.end - 14 * 24:
+            return
+        wi = {"epc": epc_for(self.item_counter), "initial_cycles": 0,
+              "home_ward": ward_location(self.rng.choice(WARDS)), "loc_idx": 0,
+              "retire_at": 100, "is_ghost": False, "ghost_day": 9999, "is_replacement": True}
+        self.item_counter += 1
+        self.stats["total_items"] += 1
+        self.add_towel(wi, arrival)
+
+    # ── Laundry machine pool ──────────────────────────────────────────────
+    def enqueue(self, t, towel):
+        towel.queued_at = t
+        self.wash_queue.append(towel)
+        self.max_queue = max(self.max_queue, len(self.wash_queue))
+        self.start_loads(t)
+
+    def start_loads(self, t):
+        queue = self.wash_queue
+        while self.free_machines and queue:
+            if len(queue) < self.batch_size and t < queue[0].queued_at + BATCH_MAX_WAIT:
+                due = queue[0].queued_at + BATCH_MAX_WAIT
+                if self.timer_at != due:
+                    self.timer_at = due
+                    self.at(due, EV_LOAD_TIMER)
+                return
+            load = [queue.popleft() for _ in range(min(self.batch_size, len(queue)))]
+            hours = self.rng.uniform(*WASH_HOURS)
+            self.free_machines -= 1
+            self.loads += 1
+            self.load_sizes += len(load)
+            self.busy_hours += hours
+            self.waits.extend(t - towel.queued_at for towel in load)
+            self.at(t + hours, EV_WASH_DONE, load)
+
+    def wash_done(self, t, load):
+        self.free_machines += 1
+        for towel in load:
+            if self.rng.random() < REWASH_RATE:
+                self.enqueue(t, towel)               # still IN at Laundry
+            else:
+                self.leave(t, towel)
+        self.start_loads(t)
+
+    # ── Main loop ─────────────────────────────────────────────────────────
+    def run(self, chunk_events=100_000):
+        """Yields chronological event chunks until the simulation end."""
+        handlers = {EV_INIT: self.init, EV_ARRIVE: self.arrive, EV_LEAVE: self.leave,
+                    EV_WASH_DONE: self.wash_done}
+        schedule = self.schedule
+        while schedule and schedule[0][0] < self.end:
+            t, _, kind, payload = heapq.heappop(schedule)
+            if kind == EV_LOAD_TIMER:
+                if self.timer_at == t:
+                    self.timer_at = None
+                    self.start_loads(t)
+            else:
+                handlers[kind](t, payload)
+            if len(self.emitted) >= chunk_events:
+                yield self.emitted
+                self.emitted = []
+        if self.emitted:
+            yield self.emitted
+            self.emitted = []
+
+    def laundry_summary(self):
+        waits = sorted(self.waits)
+        return {
+            "machines":     self.machines,
+            "loads":        self.loads,
+            "mean_load":    self.load_sizes / self.loads if self.loads else 0.0,
+            "mean_wait_h":  sum(waits) / len(waits) if waits else 0.0,
+            "p90_wait_h":   waits[int(0.9 * (len(waits) - 1))] if waits else 0.0,
+            "max_queue":    self.max_queue,
+            "utilization":  self.busy_hours / (self.machines * self.end) if self.end else 0.0,
+        }
+
+
+def iter_laundry_runs(stats, seed, workers=1):
+    """
+    iter_item_runs() on the discrete-event laundry model.  `workers` is
+    unused: towels interact through the machine pool, so the fleet is
+    simulated by one scheduler.
+    """
+    model = LaundryModel(seed, LAUNDRY_MACHINES or laundry_machines(NUM_ITEMS), LAUNDRY_BATCH_SIZE)
+    for wi in initial_fleet(seed):
+        model.add_towel(wi, (wi["start_time"] - START_DATE).total_seconds() / 3600)
+    yield from model.run()
+    stats.update(model.stats)
+    stats["laundry"] = model.laundry_summary()
+
+    if FRONTEND_TEST_HARDCODE:
+        for run in hardcoded_test_runs(model.item_counter, random.Random(f"{seed}:frontend-test")):
+            stats["total_items"] += 1
+            yield run
+
+
+ENGINES = {"python": iter_item_runs, "numpy": iter_vector_runs, "des": iter_laundry_runs}
+
 
 # ---------------------------------------------------------------------------
 # Hardcoded frontend test injections (non-production behavior)
 # ---------------------------------------------------------------------------
-if FRONTEND_TEST_HARDCODE:
+def hardcoded_test_runs(item_counter, rng=random):
     item_desc = "Bath Towel - Large"
     gtin = GTIN_TOWEL
 
     # (1) Force ~10 open New Linen items near SIM_END
     for _ in range(HARDCODE_NEW_LINEN_AT_END):
-        epc = f"urn:epc:id:sgtin:0890103.00000.{item_counter:05d}"
+        epc = epc_for(item_counter)
         item_counter += 1
-        total_items += 1
-
-        home_ward = ward_location(random.choice(WARDS))
-        t_in = SIM_END - timedelta(hours=random.uniform(2, 10))
-        job_id = str(uuid.uuid4())
-
-        events.append(make_event(
-            t_in - timedelta(minutes=1),
-            epc, "New Linen Department", "INIT", item_desc, gtin,
-            str(uuid.uuid4()),
-            extra={"Initial Cycles": 0, "Home Ward": home_ward}
-        ))
-        events.append(make_event(
-            t_in,
-            epc, "New Linen Department", "IN", item_desc, gtin, job_id
-        ))
+
+        home_ward = ward_location(rng.choice(WARDS))
+        t_in = SIM_END - timedelta(hours=rng.uniform(2, 10))
+        job_id = new_guid(rng)
+
+        yield [
+            make_event(
+                t_in - timedelta(minutes=1),
+                epc, "New Linen Department", "INIT", item_desc, gtin,
+                new_guid(rng),
+                extra={"Initial Cycles": 0, "Home Ward": home_ward}, rng=rng
+            ),
+            make_event(
+                t_in,
+                epc, "New Linen Department", "IN", item_desc, gtin, job_id, rng=rng
+            ),
+        ]
 
     # (2) Force 2-4 overdue items (using 3) with 105-110 cycles and no DECOMMISSION
     for _ in range(HARDCODE_OVERDUE_NOT_RETIRED):
-        epc = f"urn:epc:id:sgtin:0890103.00000.{item_counter:05d}"
+        epc = epc_for(item_counter)
         item_counter += 1
-        total_items += 1
-
-        home_ward = ward_location(random.choice(WARDS))
-        forced_cycles = random.randint(105, 110)
-        t_in = SIM_END - timedelta(hours=random.uniform(1, 6))
-        job_id = str(uuid.uuid4())
-
-        events.append(make_event(
-            t_in - timedelta(minutes=1),
-            epc, "New Linen Department", "INIT", item_desc, gtin,
-            str(uuid.uuid4()),
-            extra={"Initial Cycles": forced_cycles, "Home Ward": home_ward}
-        ))
-        events.append(make_event(
-            t_in,
-            epc, "Cleaned Linen Department", "IN", item_desc, gtin, job_id
-        ))
-
-# Sort chronologically
-events.sort(key=lambda x: x["Event Timestamp"])
-
-with open("epcis_events.json", "w") as f:
-    json.dump(events, f, separators=(',', ':'))
-
-# Summary
-decomms   = sum(1 for e in events if e["Process"] == "DECOMMISSION")
-replenishments = total_items - NUM_ITEMS
-print(f"Generated {len(events):,} EPCIS events for {total_items} items "
-      f"over {DAYS} days ({START_DATE.date()} -> "
-      f"{SIM_END.date()}).")
-print(f"  Decommissions: {decomms}  |  Replenishments (new stock): {replenishments}")
-if FRONTEND_TEST_HARDCODE:
-    print(f"  [HARDCODED FRONTEND TEST] New Linen open-at-end items: {HARDCODE_NEW_LINEN_AT_END}")
-    print(f"  [HARDCODED FRONTEND TEST] Overdue-not-retired items: {HARDCODE_OVERDUE_NOT_RETIRED}")
-print("Saved to epcis_events.json")
+
+        home_ward = ward_location(rng.choice(WARDS))
+        forced_cycles = rng.randint(105, 110)
+        t_in = SIM_END - timedelta(hours=rng.uniform(1, 6))
+        job_id = new_guid(rng)
+
+        yield [
+            make_event(
+                t_in - timedelta(minutes=1),
+                epc, "New Linen Department", "INIT", item_desc, gtin,
+                new_guid(rng),
+                extra={"Initial Cycles": forced_cycles, "Home Ward": home_ward}, rng=rng
+            ),
+            make_event(
+                t_in,
+                epc, "Cleaned Linen Department", "IN", item_desc, gtin, job_id, rng=rng
+            ),
+        ]
+
+
+# ---------------------------------------------------------------------------
+# Serialization fast path
+# event_dict() always starts an event with the same 11 keys, so events are
+# written through one %-template.  Repeated strings (devices, staff,
+# locations, EPCs) are JSON-escaped once and memoized; GUIDs and timestamps
+# are hex / digits and need no escaping.  The output is byte-identical to
+# json.dumps(ev, separators=(',', ':')).
+# ---------------------------------------------------------------------------
+EVENT_TEMPLATE = (
+    '{"Event GUID":"%s","Event Timestamp":"%s","Job ID":"%s","RFID Device ID":%s,'
+    '"Android App ID":%s,"Staff ID":%s,"Location":%s,"Process":%s,"Item Description":%s,'
+    '"GTIN":%s,"EPC":%s'
+)
+EVENT_FIXED_KEYS = 11
+WRITE_BUFFER = 1 << 20
+_json_strings = {}
+_encode_rest = json.JSONEncoder(separators=(',', ':')).encode
+
+def json_string(text):
+    encoded = _json_strings.get(text)
+    if encoded is None:
+        encoded = _json_strings[text] = encode_basestring_ascii(text)
+    return encoded
+
+def encode_event(ev):
+    """One event as compact JSON, for events built by event_dict()."""
+    line = EVENT_TEMPLATE % (
+        ev["Event GUID"], ev["Event Timestamp"], ev["Job ID"], json_string(ev["RFID Device ID"]),
+        json_string(ev["Android App ID"]), json_string(ev["Staff ID"]), json_string(ev["Location"]),
+        json_string(ev["Process"]), json_string(ev["Item Description"]), json_string(ev["GTIN"]),
+        json_string(ev["EPC"]))
+    if len(ev) > EVENT_FIXED_KEYS:
+        # Site ID and INIT / DECOMMISSION extras: '{...}' -> ',...}'
+        return line + "," + _encode_rest(dict(islice(ev.items(), EVENT_FIXED_KEYS, None)))[1:]
+    return line + "}"
+
+def encoded_line_template(stamp="%s"):
+    """
+    epcis_io.encoded_line() of an event_dict() event as one %-template with
+    the fixed fields filled in.  Slots: timestamp, GUID, timestamp, job ID,
+    the JSON of device, staff, location, process and EPC, then event_tail().
+    `stamp` is the form of both timestamp slots, e.g. "%sZ".
+    """
+    return ("%s\t" + EVENT_TEMPLATE + "%s\n") % (
+        stamp, "%s", stamp, "%s", "%s", json_string(APP_ID), "%s", "%s", "%s",
+        json_string(ITEM_DESC), json_string(GTIN_TOWEL), "%s", "%s")
+
+def event_tail(site_id=None, extra=None):
+    """End of an encoded event: Site ID and extras in event_dict() order, then '}'."""
+    rest = {SITE_FIELD: site_id} if site_id is not None else {}
+    if extra:
+        rest.update(extra)
+    return "," + _encode_rest(rest)[1:] if rest else "}"
+
+def iter_json_array(lines):
+    """Text chunks of NDJSON `lines` as one compact JSON array (as json.dump writes it)."""
+    yield "["
+    first = True
+    for line in lines:
+        yield line[:-1] if first else "," + line[:-1]
+        first = False
+    yield "]"
+
+
+# ---------------------------------------------------------------------------
+# Simulation API
+# ---------------------------------------------------------------------------
+_RUN_LOCK = threading.Lock()        # held while a Simulation's settings are applied
+
+
+class Simulation:
+    """
+    One generator run, usable from other code (tests, benchmarks, a warm
+    scheduler process) without the CLI or a subprocess:
+
+        sim = Simulation(items=500, days=30, seed=7)
+        for ev in sim.run():                      # chronological event dicts
+            ...
+        sim.write("events.ndjson", ndjson=True)   # what the CLI writes
+
+    Not re-entrant: the engines read their settings from module globals
+    (they are also the Pool initializer's arguments), so a run applies its
+    settings while it is iterated and restores the previous ones afterwards.
+    Only one run may be in progress per process: starting a second one, from
+    another thread or by interleaving two generators, raises RuntimeError.
+    Finish (or close()) a run before starting the next.  `stats` holds the
+    item and decommission counts of the last run.
+    """
+
+    def __init__(self, items=NUM_ITEMS, days=DAYS, seed=None, start_date=START_DATE, wards=WARDS,
+                 engine="python", workers=1, sites=None, machines=LAUNDRY_MACHINES,
+                 batch_size=LAUNDRY_BATCH_SIZE, wash_hours=WASH_HOURS, chunk_events=200_000):
+        if engine not in ENGINES:
+            raise ValueError(f"engine must be one of {', '.join(sorted(ENGINES))}")
+        self.seed         = seed if seed is not None else random.randrange(2**32)
+        self.items        = items
+        self.days         = days
+        self.start_date   = start_date
+        self.wards        = list(wards)
+        self.engine       = engine
+        self.workers      = workers
+        self.sites        = sites          # site_config.load_sites() result, or None
+        if sites:
+            self.days       = sites.get("days", days)
+            self.start_date = sites.get("start", start_date)
+        self.laundry      = (machines, batch_size, tuple(wash_hours))
+        self.chunk_events = chunk_events
+        self.stats        = {}
+
+    @property
+    def end(self):
+        return self.start_date + timedelta(days=self.days)
+
+    @property
+    def snapshot(self):
+        """The run's SIM_END as a dashboard snapshot time (build_v4_rebuild.build_dashboard)."""
+        return self.end.isoformat() + "Z"
+
+    @property
+    def fleet(self):
+        """Starting fleet size (all sites)."""
+        return sum(site["items"] for site in self.sites["sites"]) if self.sites else self.items
+
+    @contextmanager
+    def applied(self):
+        global LAUNDRY_MACHINES, LAUNDRY_BATCH_SIZE, WASH_HOURS
+        if not _RUN_LOCK.acquire(blocking=False):
+            raise RuntimeError("another Simulation run is in progress; module settings are shared, "
+                               "so runs cannot overlap")
+        saved = current_settings(), (LAUNDRY_MACHINES, LAUNDRY_BATCH_SIZE, WASH_HOURS)
+        try:
+            apply_settings(self.items, self.days, self.start_date, self.wards)
+            LAUNDRY_MACHINES, LAUNDRY_BATCH_SIZE, WASH_HOURS = self.laundry
+            yield
+        finally:
+            apply_settings(*saved[0])
+            LAUNDRY_MACHINES, LAUNDRY_BATCH_SIZE, WASH_HOURS = saved[1]
+            _RUN_LOCK.release()
+
+    def runs(self):
+        """Per-item event lists, each chronological (the engines' output)."""
+        self.stats = {}
+        with self.applied():
+            if self.sites:
+                yield from iter_site_runs(self.stats, self.seed, self.sites["sites"], self.days,
+                                          self.start_date, self.workers, self.engine)
+            else:
+                yield from ENGINES[self.engine](self.stats, self.seed, self.workers)
+
+    def run(self):
+        """Yields every event in chronological order (k-way merge of the runs)."""
+        writer = ChronologicalWriter(None, chunk_events=self.chunk_events, encode=encode_event)
+        for run in self.runs():
+            writer.add_run(run)
+        yield from writer.merged_events()
+
+    def write(self, out_path, ndjson=False):
+        """Writes the events as a JSON array or NDJSON; returns how many."""
+        # Per-item runs are already chronological: k-way merge instead of a
+        # global sort (ties keep run order, as the stable sort did).
+        with open(out_path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+            writer = ChronologicalWriter(f, chunk_events=self.chunk_events, encode=encode_event)
+            for run in self.runs():
+                writer.add_run(run)
+            if ndjson:
+                return writer.close()
+            f.writelines(iter_json_array(writer.merged_lines()))
+            return writer.count
+
+
+# ---------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic EPCIS towel-tracking events.")
+    parser.add_argument("--items", type=int, default=NUM_ITEMS, help="starting fleet size")
+    parser.add_argument("--days", type=int, default=DAYS, help="simulated days from START_DATE")
+    parser.add_argument("--seed", type=int,
+                        help="RNG seed; identical seeds give identical output for any --workers")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes simulating towels in parallel (default 1)")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="stream newline-delimited JSON in constant memory")
+    parser.add_argument("--out", help="output path (default epcis_events.json, "
+                                      "or epcis_events.ndjson with --ndjson)")
+    parser.add_argument("--chunk-events", type=int, default=200_000,
+                        help="--ndjson: events merged in memory before a sorted run is spilled to disk")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="python",
+                        help="simulation engine: per-towel Python, the vectorized NumPy kernel "
+                             "(vector_sim.py; same rules, different random streams), or the "
+                             "discrete-event model with a shared laundry machine pool")
+    parser.add_argument("--machines", type=int, default=LAUNDRY_MACHINES,
+                        help=f"--engine des: laundry machines (default: one per {TOWELS_PER_MACHINE} "
+                             f"towels of the starting fleet, at least {MIN_MACHINES})")
+    parser.add_argument("--batch-size", type=int, default=LAUNDRY_BATCH_SIZE,
+                        help="--engine des: towels per machine load (default %(default)s)")
+    parser.add_argument("--wash-hours", type=float, nargs=2, default=WASH_HOURS, metavar=("MIN", "MAX"),
+                        help="--engine des: duration of one load in hours (default %(default)s)")
+    parser.add_argument("--sites",
+                        help="site config (see site_config.py): simulate every site into one stream; "
+                             "overrides --items, and --days when the config sets days")
+    args = parser.parse_args(argv)
+
+    sim = Simulation(items=args.items, days=args.days, seed=args.seed, engine=args.engine,
+                     workers=args.workers, sites=load_sites(args.sites) if args.sites else None,
+                     machines=args.machines, batch_size=args.batch_size, wash_hours=args.wash_hours,
+                     chunk_events=args.chunk_events)
+    out_path = args.out or ("epcis_events.ndjson" if args.ndjson else "epcis_events.json")
+    n_events = sim.write(out_path, args.ndjson)
+
+    # Summary
+    stats = sim.stats
+    replenishments = stats["total_items"] - sim.fleet
+    print(f"Generated {n_events:,} EPCIS events for {stats['total_items']} items "
+          f"over {sim.days} days ({sim.start_date.date()} -> "
+          f"{sim.end.date()}).  Seed: {sim.seed}")
+    print(f"  Decommissions: {stats['decommissions']}  |  Replenishments (new stock): {replenishments}")
+    if "laundry" in stats:
+        lz = stats["laundry"]
+        print(f"  Laundry: {lz['machines']} machines, {lz['loads']:,} loads (mean {lz['mean_load']:.1f} towels), "
+              f"wait mean {lz['mean_wait_h']:.1f}h / p90 {lz['p90_wait_h']:.1f}h, "
+              f"max queue {lz['max_queue']}, utilization {lz['utilization']:.0%}")
+        if lz["utilization"] >= SATURATED:
+            print(f"  WARNING: the laundry is saturated; the wash queue grows for the whole run. "
+                  f"Raise --machines (default for this fleet: {laundry_machines(sim.fleet)}).")
+    for site_id, site_stats in stats.get("sites", {}).items():
+        lz = site_stats.get("laundry")
+        laundry = f", laundry {lz['machines']} machines at {lz['utilization']:.0%}" if lz else ""
+        print(f"  Site {site_id}: {site_stats['total_items']} items, "
+              f"{site_stats['decommissions']} decommissions{laundry}")
+        if lz and lz["utilization"] >= SATURATED:
+            print(f"  WARNING: site {site_id}'s laundry is saturated; raise --machines.")
+    if FRONTEND_TEST_HARDCODE:
+        print(f"  [HARDCODED FRONTEND TEST] New Linen open-at-end items: {HARDCODE_NEW_LINEN_AT_END}")
+        print(f"  [HARDCODED FRONTEND TEST] Overdue-not-retired items: {HARDCODE_OVERDUE_NOT_RETIRED}")
+    print(f"Saved to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
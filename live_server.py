@@ -0,0 +1,226 @@
+"""
+live_server.py
+Local live feed for a dashboard that stays open all shift.  Tails an
+append-only NDJSON event log (e.g. `generate_epcis_data.py --ndjson` or
+`scanner_ingest.py --out`), folds each new scan into the dashboard fold as it
+lands and pushes what changed to every open page over Server-Sent Events.
+Standard library only (asyncio).
+
+    GET /         the dashboard, rendered from the current fold
+    GET /events   text/event-stream of "kpis" messages: every field on
+                  connect, then only the fields a batch of scans changed
+
+The pushed fields are the KPI cards, Report 2 stock levels, Chart 3 ward
+availability and Chart 5 lifecycle buckets.  They come from running counters
+(a history-less ReplayLog) and the 24h / 30d windows the fold already keeps,
+so a push costs the new scans, not the history.  The history charts (usage,
+dwell, forecast) refresh on reload; the page is rendered once per log offset
+(off the event loop, from an EPC index the tail extends as it folds) and
+served from cache until the next scan lands.
+
+Usage:
+    python live_server.py --events scans.ndjson
+    python live_server.py --events scans.ndjson --port 8765 --poll 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from build_v4_rebuild import TEMPLATE_PATH, render
+from dashboard_aggregates import (DECOMM_WINDOW_S, FLOW_WINDOW_S, LIFECYCLE_BUCKETS,
+                                  SNAPSHOT_TIME, STOCK_KEYS, STORAGE, DashboardAggregator,
+                                  ReplayLog, drilldown_block, format_timestamp)
+from epcis_io import EpcHistoryIndex, iter_ndjson_from, log_head_digest
+
+POLL_S      = 0.5       # log size check interval; a scan shows within ~one poll
+KEEPALIVE_S = 15        # SSE comment sent to idle streams so proxies keep them open
+HEAD_BYTES  = 4096
+EVENTS_URL  = "/events"
+
+
+def live_kpis(aggregator):
+    """
+    The fields of the page's 'kpis' stage plus the lifecycle buckets, from the
+    fold's running counters and windows (O(24h of scans), not O(towels)).
+    """
+    counts = aggregator.replay.counts
+    wards = sorted(aggregator.wards)
+    end = aggregator.latest
+    stock = {key: counts.get(key, 0) for key in STOCK_KEYS.values()}
+    stock["In Wards"] = sum(counts.get(ward, 0) for ward in wards)
+
+    # Same rule as the page's 24h flow: ward INs / storage OUTs in [end - 24h, end]
+    received = dispatched = 0
+    for t, _, loc, proc, *_ in aggregator.recent:
+        if end - FLOW_WINDOW_S <= t <= end:
+            if proc == "IN" and loc.startswith("Ward"):
+                received += 1
+            elif proc == "OUT" and loc == STORAGE:
+                dispatched += 1
+
+    return {
+        "snapshot":        format_timestamp(end),
+        "flow24h":         {"start": format_timestamp(end - FLOW_WINDOW_S), "end": format_timestamp(end)},
+        "wards":           wards,
+        "itemCount":       len(aggregator.items),
+        "stockCounts":     stock,
+        "wardStockCounts": {ward: counts.get(ward, 0) for ward in wards},
+        "recentDecomm30d": sum(1 for t in aggregator.decomm_times if end - DECOMM_WINDOW_S <= t <= end),
+        "lifecycle":       {label: counts.get(label, 0) for label, _ in LIFECYCLE_BUCKETS},
+        "received24h":     received,
+        "dispatched24h":   dispatched,
+    }
+
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class LiveFeed:
+    """Fold of the log up to `offset`, plus one message queue per open page."""
+
+    def __init__(self, events_path):
+        self.events_path = events_path
+        self.clients = set()
+        self.lock = None        # asyncio.Lock between the tail and page renders, see serve()
+        self.reset()
+
+    def reset(self):
+        self.aggregator = DashboardAggregator(ReplayLog(history=False))
+        self.offset = 0
+        self.head = None        # (bytes hashed, digest) of the log start
+        self.kpis = {}
+        self.history = EpcHistoryIndex.recording(self.events_path)
+        self.rendered = None    # (offset, page bytes)
+
+    def poll(self):
+        """Folds the complete lines appended since the last poll; returns how many."""
+        path = self.events_path
+        if not os.path.exists(path):
+            return 0
+        size = os.path.getsize(path)
+        if size == self.offset:
+            return 0
+        # Truncated, rotated or regenerated: the offset is meaningless, refold
+        if size < self.offset or (self.head and log_head_digest(path, self.head[0]) != self.head[1]):
+            self.reset()
+        folded = 0
+        for ev, end in iter_ndjson_from(path, self.offset):
+            self.aggregator.add(ev)
+            self.history.add(ev["EPC"], self.offset)
+            self.offset = end
+            folded += 1
+        if self.head is None or self.head[0] < min(self.offset, HEAD_BYTES):
+            hashed = min(self.offset, HEAD_BYTES)
+            self.head = (hashed, log_head_digest(path, hashed))
+        return folded
+
+    def publish(self):
+        """Queues the KPI fields that changed since the last publish for every page."""
+        kpis = live_kpis(self.aggregator)
+        delta = {key: value for key, value in kpis.items() if self.kpis.get(key) != value}
+        self.kpis = kpis
+        if delta:
+            for queue in self.clients:
+                queue.put_nowait(delta)
+
+    def page(self, html):
+        """The dashboard as of the last poll (UTF-8), wired to the event stream."""
+        if self.rendered and self.rendered[0] == self.offset:
+            return self.rendered[1]
+        aggregator = self.aggregator
+        snapshot = format_timestamp(aggregator.latest) if aggregator.latest else SNAPSHOT_TIME
+        drilldown = drilldown_block(self.history, aggregator.activity_epcs())
+        body = render(aggregator.result(snapshot), html, drilldown, live=EVENTS_URL).encode("utf-8")
+        self.rendered = (self.offset, body)
+        return body
+
+
+# ── HTTP ─────────────────────────────────────────────────────────────────────
+async def tail(feed, poll_s):
+    while True:
+        async with feed.lock:
+            folded = feed.poll()
+        if folded:
+            feed.publish()
+        await asyncio.sleep(poll_s)
+
+
+async def stream(writer, feed):
+    writer.write(b"HTTP/1.1 200 OK\r\n"
+                 b"Content-Type: text/event-stream\r\n"
+                 b"Cache-Control: no-cache\r\n"
+                 b"Connection: keep-alive\r\n\r\n")
+    queue = asyncio.Queue()
+    queue.put_nowait(feed.kpis)           # every field once, then deltas
+    feed.clients.add(queue)
+    try:
+        while True:
+            try:
+                writer.write(sse_message("kpis", await asyncio.wait_for(queue.get(), KEEPALIVE_S)))
+            except asyncio.TimeoutError:
+                writer.write(b": keepalive\n\n")
+            await writer.drain()
+    finally:
+        feed.clients.discard(queue)
+
+
+def respond(writer, status, content_type, body):
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+
+
+async def handle(reader, writer, feed, html):
+    try:
+        request = (await reader.readline()).decode("latin-1").split()
+        while (await reader.readline()).strip():
+            pass                                  # headers are not needed
+        method, path = (request[0], request[1].split("?")[0]) if len(request) >= 2 else ("", "")
+        if method != "GET":
+            respond(writer, "405 Method Not Allowed", "text/plain", b"GET only\n")
+        elif path == "/":
+            async with feed.lock:             # the fold must not move under the render
+                body = await asyncio.get_running_loop().run_in_executor(None, feed.page, html)
+            respond(writer, "200 OK", "text/html; charset=utf-8", body)
+        elif path == EVENTS_URL:
+            await stream(writer, feed)
+        else:
+            respond(writer, "404 Not Found", "text/plain", b"not found\n")
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass                                      # page closed or reloaded
+    finally:
+        writer.close()
+
+
+async def serve(feed, html, host, port, poll_s):
+    feed.lock = asyncio.Lock()
+    server = await asyncio.start_server(lambda r, w: handle(r, w, feed, html), host, port)
+    print(f"Live dashboard on http://{host}:{port}/ (tailing {feed.events_path}, Ctrl+C to stop)")
+    async with server:
+        await asyncio.gather(server.serve_forever(), tail(feed, poll_s))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the dashboard with a live feed of new scans.")
+    parser.add_argument("--events", required=True, help="append-only NDJSON event log to tail")
+    parser.add_argument("--host", default="127.0.0.1", help="bind address (default %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="port (default %(default)s)")
+    parser.add_argument("--poll", type=float, default=POLL_S,
+                        help="seconds between log checks (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    with open(TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        html = f.read()
+    feed = LiveFeed(args.events)
+    print(f"Folded {feed.poll():,} events from {args.events}.")
+    feed.publish()
+    try:
+        asyncio.run(serve(feed, html, args.host, args.port, args.poll))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+scanner_ingest.py
+Streaming adapter for raw RFID reader exports: the CSV
+(`rf_synthetic_events_track_trace_with_staff.csv`) and the `const rawData = [...]`
+script (`data.js`, UTF-16).  Rows use the reader schema
+
+    Timestamp, EPC, Location, Process, Staff
+    2026-01-30T08:00:00+08:00, 30352AC2D4..., new linen department, in, 25002
+
+and are normalized to the EPCIS event shape the dashboard builder folds:
+UTC 'Z' timestamps, EPC URIs, the canonical location names ("Laundry
+Department", "Ward 5C"), upper-case processes and "Staff ID".
+
+Reader exports are not chronological (the CSV is grouped by tag), so rows are
+sorted in bounded chunks and k-way merged through epcis_io.ChronologicalWriter;
+nothing holds the whole file in memory.
+
+Usage:
+    python scanner_ingest.py data.js --out scans.ndjson
+"""
+import argparse
+import codecs
+import csv
+import json
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from epcis_io import ChronologicalWriter, event_line
+
+SCANNER_EXTENSIONS = (".csv", ".js")
+READ_CHUNK_CHARS = 1 << 16
+GUID_NAMESPACE = uuid.UUID("6f1c2a52-8d0e-4c39-9a55-3b1f0e7d2c41")   # reader-export event GUIDs
+
+LOCATIONS = {
+    "new linen department":     "New Linen Department",
+    "laundry department":       "Laundry Department",
+    "cleaned linen department": "Cleaned Linen Department",
+}
+WARD_SUFFIX = re.compile(r"^(\S+)\s+ward$")     # "5C ward" -> "Ward 5C"
+WARD_PREFIX = re.compile(r"^ward\s+(\S+)$")     # "ward 3"  -> "Ward 3"
+HEX_EPC     = re.compile(r"^[0-9A-Fa-f]+$")
+
+
+def is_scanner_export(path):
+    return path.lower().endswith(SCANNER_EXTENSIONS)
+
+
+def detect_encoding(path):
+    """Text encoding from the BOM; UTF-16 without a BOM is spotted by NUL bytes."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if len(head) >= 2 and head[1] == 0 and head[0] != 0:
+        return "utf-16-le"
+    if len(head) >= 2 and head[0] == 0 and head[1] != 0:
+        return "utf-16-be"
+    return "utf-8"
+
+
+# ── Row readers ──────────────────────────────────────────────────────────────
+def iter_csv_rows(path):
+    with open(path, "r", encoding=detect_encoding(path), newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def iter_js_rows(path):
+    """
+    Yields the objects of a `const rawData = [ {...}, ... ];` script one at a
+    time, decoding from a rolling buffer instead of loading the array.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding=detect_encoding(path)) as f:
+        buf, eof = "", False
+
+        def fill():
+            nonlocal buf, eof
+            chunk = f.read(READ_CHUNK_CHARS)
+            eof = not chunk
+            buf += chunk
+
+        while "[" not in buf and not eof:
+            fill()
+        if "[" not in buf:
+            return
+        buf = buf[buf.index("[") + 1:]
+        pos = 0
+        while True:
+            # Skip separators between objects
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) or eof:
+                    break
+                buf, pos = buf[pos:], 0
+                fill()
+            if pos >= len(buf) or buf[pos] == "]":
+                return
+            try:
+                row, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                buf, pos = buf[pos:], 0    # object split across reads
+                fill()
+                continue
+            yield row
+            pos = end
+
+
+def iter_rows(path):
+    return iter_js_rows(path) if path.lower().endswith(".js") else iter_csv_rows(path)
+
+
+# ── Normalization ────────────────────────────────────────────────────────────
+def normalize_location(raw):
+    key = " ".join(raw.split()).lower()
+    if key in LOCATIONS:
+        return LOCATIONS[key]
+    m = WARD_SUFFIX.match(key) or WARD_PREFIX.match(key)
+    if m:
+        return f"Ward {m.group(1).upper()}"
+    return " ".join(word.capitalize() for word in key.split())
+
+
+def normalize_timestamp(raw):
+    """'2026-01-30T08:00:00+08:00' -> '2026-01-30T00:00:00Z' (UTC, whole seconds)."""
+    t = datetime.fromisoformat(raw.strip().replace("Z", "+00:00"))
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.astimezone(timezone.utc).replace(microsecond=0, tzinfo=None).isoformat() + "Z"
+
+
+def normalize_epc(raw):
+    """Hex tag reads become EPC raw URIs (urn:epc:raw:<bits>.x<HEX>); URIs pass through."""
+    epc = raw.strip()
+    if HEX_EPC.match(epc):
+        return f"urn:epc:raw:{len(epc) * 4}.x{epc.upper()}"
+    return epc
+
+
+def normalize_row(row):
+    """One reader row -> EPCIS-shaped event, or None for rows missing a field."""
+    try:
+        ts, epc = row["Timestamp"], row["EPC"]
+        loc, proc = row["Location"], row["Process"]
+    except KeyError:
+        return None
+    if not (ts and epc and loc and proc):
+        return None
+    event = {
+        "Event Timestamp":  normalize_timestamp(ts),
+        "EPC":              normalize_epc(epc),
+        "Location":         normalize_location(loc),
+        "Process":          proc.strip().upper(),
+        "Staff ID":         str(row.get("Staff") or "").strip(),
+        "RFID Device ID":   str(row.get("Device") or "").strip(),
+        "Item Description": str(row.get("Description") or "").strip(),
+    }
+    # Deterministic GUIDs keep re-ingested exports stable for checkpoints
+    key = "|".join((event["Event Timestamp"], event["EPC"], event["Location"], event["Process"]))
+    event["Event GUID"] = str(uuid.uuid5(GUID_NAMESPACE, key))
+    return event
+
+
+# ── Chronological stream ─────────────────────────────────────────────────────
+def iter_scanner_events(path, chunk_events=200_000, tmp_dir=None):
+    """
+    Normalized events of a reader export in chronological order.  Each chunk
+    of rows is sorted into a run; ChronologicalWriter spills full chunks and
+    merges the runs, so memory stays at one chunk.
+    """
+    writer = ChronologicalWriter(None, chunk_events=chunk_events, tmp_dir=tmp_dir)
+    run = []
+    for row in iter_rows(path):
+        event = normalize_row(row)
+        if event is None:
+            continue
+        run.append(event)
+        if len(run) >= chunk_events:
+            writer.add_run(sorted(run, key=lambda ev: ev["Event Timestamp"]))
+            run = []
+    writer.add_run(sorted(run, key=lambda ev: ev["Event Timestamp"]))
+    for line in writer.merged_lines():
+        yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Normalize a reader export (CSV or data.js) to EPCIS NDJSON.")
+    parser.add_argument("source", help="reader export: .csv or .js (UTF-8 or UTF-16)")
+    parser.add_argument("--out", help="output NDJSON (default: stdout)")
+    parser.add_argument("--chunk-events", type=int, default=200_000,
+                        help="rows sorted in memory before spilling (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    out = open(args.out, "w", encoding="utf-8", newline="\n") if args.out else sys.stdout
+    count = 0
+    try:
+        for event in iter_scanner_events(args.source, args.chunk_events):
+            out.write(event_line(event) + "\n")
+            count += 1
+    finally:
+        if args.out:
+            out.close()
+    print(f"Ingested {count:,} events from {args.source}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
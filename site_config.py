@@ -0,0 +1,55 @@
+"""
+site_config.py
+Site / ward configuration shared by generate_epcis_data.py and
+build_v4_rebuild.py, so a hospital group is described once:
+
+    {
+      "group": "Ramathibodi Facilities Services",
+      "start": "2025-01-01T08:00:00",
+      "days":  120,
+      "sites": [
+        {"id": "RAMA", "name": "Ramathibodi Hospital", "items": 193,
+         "wards": ["1", "2", "3", "4"]},
+        ...
+      ]
+    }
+
+"start" and "days" are optional (the generator defaults apply).  Each site
+gets its own SGTIN item reference, so EPCs never collide across sites, and
+every generated event names its site in the "Site ID" field.
+"""
+import json
+import re
+from datetime import datetime
+
+SITE_FIELD = "Site ID"
+SITE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")   # also used in output file names
+
+
+def load_sites(path):
+    """Reads and validates a site config; returns the config dict."""
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    sites = cfg.get("sites") or []
+    if not sites:
+        raise ValueError(f"{path}: no sites configured")
+
+    seen = set()
+    for index, site in enumerate(sites, start=1):
+        site_id = site.get("id", "")
+        if not SITE_ID_PATTERN.match(site_id):
+            raise ValueError(f"{path}: site #{index} needs an id of letters, digits, '-' or '_'")
+        if site_id in seen:
+            raise ValueError(f"{path}: duplicate site id {site_id!r}")
+        seen.add(site_id)
+        if not site.get("wards"):
+            raise ValueError(f"{path}: site {site_id!r} has no wards")
+        site["wards"] = [str(ward) for ward in site["wards"]]
+        site.setdefault("name", site_id)
+        site.setdefault("items", 193)
+        site.setdefault("item_ref", index)    # SGTIN item reference of the site's EPCs
+
+    cfg.setdefault("group", "Group")
+    if "start" in cfg:
+        cfg["start"] = datetime.fromisoformat(cfg["start"])
+    return cfg
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_epcis_data import Simulation  # noqa: E402
+
+FLEET = dict(items=30, days=60, seed=7)   # includes decommissions and replacements
+
+
+@pytest.fixture(scope="session")
+def event_log(tmp_path_factory):
+    """NDJSON log of a tiny generated fleet (the CLI's --ndjson output)."""
+    path = tmp_path_factory.mktemp("fleet") / "events.ndjson"
+    Simulation(**FLEET).write(str(path), ndjson=True)
+    return path
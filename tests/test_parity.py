@@ -0,0 +1,71 @@
+"""Fast paths against the straightforward way of producing the same output."""
+import json
+
+import pytest
+
+from build_v4_rebuild import aggregate_events, build_dashboard
+from conftest import FLEET
+from dashboard_aggregates import SNAPSHOT_TIME, DashboardAggregator
+from epcis_io import iter_events
+from generate_epcis_data import Simulation, encode_event
+
+
+def full_fold(path):
+    return DashboardAggregator().add_all(iter_events(str(path))).result(SNAPSHOT_TIME)
+
+
+@pytest.mark.parametrize("drilldown", ["activity", "all"])
+def test_incremental_rebuild_matches_full_build(event_log, tmp_path, drilldown):
+    lines = event_log.read_bytes().splitlines(keepends=True)
+    half = len(lines) // 2
+    log, checkpoint = tmp_path / "events.ndjson", str(tmp_path / "fold.ckpt")
+    log.write_bytes(b"".join(lines[:half]))
+    build_dashboard(str(log), str(tmp_path / "first.html"), drilldown=drilldown, checkpoint=checkpoint)
+
+    with open(log, "ab") as f:
+        f.write(b"".join(lines[half:]))
+    _, folded = build_dashboard(str(log), str(tmp_path / "incremental.html"), drilldown=drilldown,
+                                checkpoint=checkpoint)
+    build_dashboard(str(event_log), str(tmp_path / "full.html"), drilldown=drilldown)
+
+    assert folded == len(lines) - half
+    assert (tmp_path / "incremental.html").read_bytes() == (tmp_path / "full.html").read_bytes()
+
+
+def test_noop_rebuild_folds_nothing(event_log, tmp_path):
+    checkpoint = str(tmp_path / "fold.ckpt")
+    aggregate_events(str(event_log), checkpoint)
+    aggregator, folded, _ = aggregate_events(str(event_log), checkpoint)
+    assert folded == 0
+    assert aggregator.result(SNAPSHOT_TIME) == full_fold(event_log)
+
+
+def test_workers_do_not_change_output(event_log, tmp_path):
+    path = tmp_path / "workers.ndjson"
+    Simulation(**FLEET, workers=4).write(str(path), ndjson=True)
+    assert path.read_bytes() == event_log.read_bytes()
+
+
+def test_encode_event_matches_json_dumps():
+    for ev in Simulation(**FLEET).run():
+        assert encode_event(ev) == json.dumps(ev, separators=(",", ":"))
+
+
+@pytest.mark.parametrize("engine", ["python", "des", "numpy"])
+def test_encoded_events_match_json_dumps(tmp_path, engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    path = tmp_path / "events.ndjson"
+    Simulation(**FLEET, engine=engine).write(str(path), ndjson=True)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            assert line[:-1] == json.dumps(json.loads(line), separators=(",", ":"))
+
+
+def test_json_array_matches_ndjson(event_log, tmp_path):
+    path = tmp_path / "events.json"
+    Simulation(**FLEET).write(str(path))
+    with open(path, encoding="utf-8") as f:
+        events = json.load(f)
+    assert [json.dumps(ev, separators=(",", ":")) + "\n" for ev in events] == \
+        event_log.read_text(encoding="utf-8").splitlines(keepends=True)
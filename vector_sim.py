@@ -0,0 +1,274 @@
+"""
+vector_sim.py
+NumPy engine for generate_epcis_data.py (`--engine numpy`, optional
+dependency).  Instead of advancing one towel at a time, every towel still in
+the simulation takes its next stage in lock-step: location, clock (float
+hours since START_DATE), cycles and retirement threshold are arrays, dwell
+times are drawn per stage in batches, and events are appended as structured
+arrays (EVENT_DTYPE).
+
+The stage rules are those of simulate_item(): the dwell_for() ranges and
+anomaly rates, laundry queue delay, 10% visits to another ward, ghost
+disappearance, retirement at `retire_at`, Ward -> Laundry for used towels and
+the compliance skips.  Draws come from one NumPy stream per fleet, so the
+output is reproducible for a seed and statistically (not byte-) equivalent to
+the Python engine.
+"""
+import hashlib
+
+import numpy as np
+
+from generate_epcis_data import (DWELL_LAUNDRY, DWELL_NEW, DWELL_STORE, DWELL_WARD,
+                                 LAUNDRY_QUEUE_DELAY, device_for, encoded_line_template,
+                                 event_tail, json_string)
+
+# Location codes: the three departments, then ward w as WARD_BASE + w
+NEW_LINEN, LAUNDRY, STORAGE = 0, 1, 2
+WARD_BASE = 3
+INIT, IN, OUT, DECOMMISSION = 0, 1, 2, 3
+PROCESSES = ("INIT", "IN", "OUT", "DECOMMISSION")
+
+EVENT_DTYPE = np.dtype([
+    ("t",      "f8"),    # hours since START_DATE
+    ("serial", "i8"),    # EPC serial
+    ("loc",    "i2"),    # location code
+    ("proc",   "u1"),    # process code
+    ("job",    "i8"),    # job number (IN and OUT of one stage share it)
+    ("value",  "i4"),    # INIT: initial cycles, DECOMMISSION: final cycles
+    ("home",   "i2"),    # INIT: home ward index
+])
+
+
+def stream_seed(seed, label):
+    """Integer seed for a NumPy stream from the (possibly string) CLI seed."""
+    digest = hashlib.sha256(f"{seed}:{label}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def dwell_hours(rng, loc):
+    """Vectorized dwell_for(): hours spent at each location code in `loc`."""
+    n = len(loc)
+    anomaly = rng.random(n)
+    hours = np.where(
+        loc == NEW_LINEN,
+        np.where(anomaly < 0.03, rng.uniform(48, 96, n), rng.uniform(*DWELL_NEW, n)),
+        np.where(
+            loc == LAUNDRY,
+            np.where(anomaly < 0.04, rng.uniform(24, 48, n),
+                     rng.uniform(*DWELL_LAUNDRY, n) + rng.uniform(*LAUNDRY_QUEUE_DELAY, n)),
+            np.where(
+                loc == STORAGE,
+                np.where(anomaly < 0.05, rng.uniform(5 * 24, 7 * 24, n), rng.uniform(*DWELL_STORE, n)),
+                np.where(anomaly < 0.04, rng.uniform(48, 72, n), rng.uniform(*DWELL_WARD, n)))))
+    return hours
+
+
+class Fleet:
+    """Column-per-field towel table for one wave of the simulation."""
+
+    def __init__(self, serial, clock, loc_idx, cycles, retire_at, home, ghost_day):
+        self.serial    = serial       # EPC serials
+        self.clock     = clock        # hours since START_DATE
+        self.loc_idx   = loc_idx      # stage index, as in simulate_item()
+        self.cycles    = cycles
+        self.retire_at = retire_at
+        self.home      = home         # home ward index
+        self.ghost_day = ghost_day    # day after which a ghost vanishes (inf: never)
+        self.initial   = cycles.copy()
+
+
+def initial_fleet(rng, num_items, n_wards):
+    """Vectorized initial_fleet(): the same age mix and start spread."""
+    rv = rng.random(num_items)
+    cycles = np.select(
+        [rv < 0.10, rv < 0.65, rv < 0.88],
+        [np.zeros(num_items, np.int64), rng.integers(20, 61, num_items), rng.integers(61, 76, num_items)],
+        rng.integers(76, 86, num_items))
+    home = rng.integers(0, n_wards, num_items)
+    start = rng.integers(0, 73, num_items).astype(np.float64)
+    loc_idx = np.where(cycles == 0, 0, rng.integers(1, 4, num_items))
+    ghost = rng.random(num_items) < 0.02
+    ghost_day = np.where(ghost, rng.integers(30, 201, num_items), np.inf)
+    return Fleet(np.arange(1, num_items + 1), start, loc_idx, cycles,
+                 np.full(num_items, 100), home, ghost_day)
+
+
+class Simulation:
+    """Lock-step state shared by the waves of one fleet: event chunks and job numbers."""
+
+    def __init__(self, rng, days, n_wards):
+        self.rng      = rng
+        self.end      = days * 24.0
+        self.n_wards  = n_wards
+        self.chunks   = []
+        self.next_job = 0
+
+    def emit(self, t, serial, loc, proc, value=-1, home=-1):
+        n = len(t)
+        chunk = np.empty(n, EVENT_DTYPE)
+        chunk["t"], chunk["serial"], chunk["loc"], chunk["proc"] = t, serial, loc, proc
+        chunk["value"], chunk["home"] = value, home
+        chunk["job"] = np.arange(self.next_job, self.next_job + n)
+        self.next_job += n
+        self.chunks.append(chunk)
+        return chunk
+
+    def run(self, fleet):
+        """Simulates a wave; returns the decommission clock per towel (NaN if none)."""
+        rng, n = self.rng, len(fleet.serial)
+        self.emit(fleet.clock - 1 / 60, fleet.serial, NEW_LINEN, INIT, fleet.initial, fleet.home)
+        decommissioned = np.full(n, np.nan)
+        active = np.flatnonzero(fleet.clock < self.end)
+
+        while active.size:
+            r = fleet.loc_idx[active] % 4
+            loc = np.where(r < 3, r, WARD_BASE + fleet.home[active])
+            roam = (r == 3) & (rng.random(active.size) < 0.10)
+            loc[roam] = WARD_BASE + rng.integers(0, self.n_wards, roam.sum())
+            clock = fleet.clock[active]
+
+            # Ghosts disappear silently
+            alive = ~(np.floor(clock / 24) > fleet.ghost_day[active])
+            active, loc, clock = active[alive], loc[alive], clock[alive]
+
+            # Retirement: DECOMMISSION instead of the next IN
+            retire = fleet.cycles[active] >= fleet.retire_at[active]
+            gone = active[retire]
+            self.emit(clock[retire], fleet.serial[gone], loc[retire], DECOMMISSION, fleet.cycles[gone])
+            decommissioned[gone] = clock[retire]
+            active, loc, clock = active[~retire], loc[~retire], clock[~retire]
+
+            # IN, dwell, then OUT unless the dwell runs past the end (open IN)
+            ins = self.emit(clock, fleet.serial[active], loc, IN)
+            clock = clock + dwell_hours(rng, loc)
+            done = clock >= self.end
+            stay = ~done
+            active, loc, clock, jobs = active[stay], loc[stay], clock[stay], ins["job"][stay]
+            outs = self.emit(clock, fleet.serial[active], loc, OUT)
+            outs["job"] = jobs
+            clock = clock + rng.integers(15, 121, active.size) / 60    # transit gap
+
+            # Next stage, with the Ward -> Laundry shortcut and compliance skips
+            cycles = fleet.cycles[active]
+            nxt = (fleet.loc_idx[active] + 1) % 4
+            nxt[(loc >= WARD_BASE) & (cycles > 0) & (nxt == 0)] = 1
+            skip = rng.random(active.size)
+            at_home = loc == WARD_BASE + fleet.home[active]
+            nxt[at_home & (skip < 0.03)] = 2
+            nxt[~at_home & (loc == NEW_LINEN) & (skip < 0.02)] = 3
+            fleet.cycles[active] = cycles + (nxt == 1)
+            fleet.loc_idx[active] = nxt
+            fleet.clock[active] = clock
+            active = active[clock < self.end]
+        return decommissioned
+
+    def events(self):
+        """All events in chronological order (stable across equal times)."""
+        events = np.concatenate(self.chunks) if self.chunks else np.empty(0, EVENT_DTYPE)
+        return events[np.argsort(events["t"], kind="stable")]
+
+
+def simulate_fleet(stats, seed, num_items, days, n_wards):
+    """
+    Starting fleet plus replenishment wave, as iter_item_runs() simulates
+    them.  Returns the chronological EVENT_DTYPE array; `stats` gets the item
+    and decommission counts and the next free serial.
+    """
+    rng = np.random.default_rng(stream_seed(seed, "fleet"))
+    sim = Simulation(rng, days, n_wards)
+    decomm = sim.run(initial_fleet(rng, num_items, n_wards))
+
+    # Replenishment: a fresh towel 1-7 days after each retirement, numbered in
+    # fleet order, if more than two weeks remain; replacements are not replaced
+    retired = np.flatnonzero(~np.isnan(decomm))
+    arrival = decomm[retired] + rng.integers(1, 8, retired.size) * 24.0
+    arrival = arrival[arrival < sim.end - 14 * 24]
+    n_new = arrival.size
+    replacements = Fleet(np.arange(num_items + 1, num_items + 1 + n_new), arrival,
+                         np.zeros(n_new, np.int64), np.zeros(n_new, np.int64),
+                         np.full(n_new, 100), rng.integers(0, n_wards, n_new),
+                         np.full(n_new, np.inf))
+    decomm_new = sim.run(replacements)
+
+    stats["total_items"] = num_items + n_new
+    stats["decommissions"] = retired.size + int(np.count_nonzero(~np.isnan(decomm_new)))
+    stats["next_serial"] = num_items + 1 + n_new
+    return sim.events()
+
+
+def guid_words(keys, seed, label):
+    """Counter-based 128-bit GUID material: splitmix64 of (stream, key)."""
+    base = np.uint64(stream_seed(seed, label))
+    out = []
+    for lane in (np.uint64(0), np.uint64(0x632BE59BD9B4E019)):
+        z = keys.astype(np.uint64) * np.uint64(2) + base + lane + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        out.append(z ^ (z >> np.uint64(31)))
+    return out
+
+
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", np.uint8)
+GUID_DIGIT_COLUMNS = [c for c in range(36) if c not in (8, 13, 18, 23)]
+
+
+def to_guids(words):
+    """UUID4 strings (version and variant bits set) from guid_words() lanes,
+    formatted as one ASCII block for the whole chunk."""
+    hi = (words[0] & ~np.uint64(0xF000)) | np.uint64(0x4000)
+    lo = (words[1] & ~np.uint64(0xC000 << 48)) | np.uint64(0x8000 << 48)
+    raw = np.stack([hi, lo], axis=1).astype(">u8").view(np.uint8).reshape(-1, 16)
+    nibbles = np.stack([raw >> 4, raw & 15], axis=2).reshape(-1, 32)
+    text = np.full((len(raw), 36), ord("-"), np.uint8)
+    text[:, GUID_DIGIT_COLUMNS] = HEX_DIGITS[nibbles]
+    block = text.tobytes().decode("ascii")
+    return [block[i:i + 36] for i in range(0, len(block), 36)]
+
+
+def iter_event_lines(events, seed, start_date, locations, staff_pools, epc_for, site_id=None,
+                     run_events=100_000):
+    """
+    The events of an EVENT_DTYPE array as encoded runs for the chronological
+    writer (epcis_io.encoded_line), `run_events` at a time (consecutive
+    slices, so each run is chronological).  `locations` and `staff_pools` are
+    indexed by location code.  Every column is formatted for the whole run:
+    timestamps and GUIDs by NumPy, the location, device, staff, process and
+    EPC strings by table lookups of their JSON encodings, so no event dict is
+    built.  The lines are byte-identical to encode_event(event_dict(...)).
+    """
+    rng = np.random.default_rng(stream_seed(seed, "staff"))
+    pool_sizes = np.array([len(pool) for pool in staff_pools])
+    pool_starts = np.concatenate([[0], np.cumsum(pool_sizes)[:-1]])
+    start_us = np.datetime64(start_date, "us")
+
+    # JSON encodings, looked up by code with one take() per column
+    table = lambda texts: np.array([json_string(text) for text in texts], dtype=object)
+    location_json = table(locations)
+    device_json   = table(device_for(location) for location in locations)
+    staff_json    = table(staff for pool in staff_pools for staff in pool)
+    process_json  = table(PROCESSES)
+    epc_json      = table([""] + [epc_for(serial)
+                                  for serial in range(1, int(events["serial"].max(initial=0)) + 1)])
+    line = encoded_line_template("%sZ")       # one %-format per event
+    tail = event_tail(site_id)
+
+    for begin in range(0, len(events), run_events):
+        chunk = events[begin:begin + run_events]
+        n, loc, proc = len(chunk), chunk["loc"], chunk["proc"]
+        micros = np.round(chunk["t"] * 3.6e9).astype(np.int64)
+        stamps = np.datetime_as_string(start_us + micros.astype("timedelta64[us]"), unit="us").tolist()
+        for i in np.flatnonzero(micros % 1_000_000 == 0).tolist():
+            stamps[i] = stamps[i][:-7]       # datetime.isoformat() drops zero microseconds
+        staff = (rng.random(n) * pool_sizes[loc]).astype(np.int64)
+        guids = to_guids(guid_words(np.arange(begin, begin + n), seed, "event"))
+        jobs = to_guids(guid_words(chunk["job"], seed, "job"))
+        tails = [tail] * n
+        for i in np.flatnonzero(proc == INIT).tolist():
+            tails[i] = event_tail(site_id, {"Initial Cycles": int(chunk["value"][i]),
+                                            "Home Ward": locations[WARD_BASE + chunk["home"][i]]})
+        for i in np.flatnonzero(proc == DECOMMISSION).tolist():
+            tails[i] = event_tail(site_id, {"Final Cycles": int(chunk["value"][i]), "Reason": "End of Life"})
+        columns = zip(stamps, guids, stamps, jobs, device_json[loc].tolist(),
+                      staff_json[pool_starts[loc] + staff].tolist(), location_json[loc].tolist(),
+                      process_json[proc].tolist(), epc_json[chunk["serial"]].tolist(), tails)
+        yield [line % values for values in columns]